@@ -0,0 +1,52 @@
+"""
+Measures the cost of config value access on hot paths,
+e.g. a queue name lookup on every message send or a client config of a service pool.
+Run: python benchmarks/config_access.py
+"""
+from __future__ import print_function
+
+import timeit
+
+from pypipes.config import Config, ClientConfig, freeze_config
+
+REPEAT = 100000
+
+CONFIG = {
+    'celery': {
+        'app': {'broker': 'redis://localhost:6379/0'},
+        'queue_name': {'processor': '{program_id}.{processor_id}'},
+    },
+    'redis': {
+        'host': 'localhost',
+        'port': 6379,
+        'storage': {'db': 1},
+        'lock': {'db': 2, 'production': {'host': 'redis.prod'}},
+    },
+}
+
+
+def main():
+    config = Config(CONFIG)
+    frozen = freeze_config(config)
+
+    cases = [
+        ('Config, new object per access',
+         lambda: Config(CONFIG).celery.queue_name.get('processor')),
+        ('Config, cached sections',
+         lambda: config.celery.queue_name.get('processor')),
+        ('FrozenConfig attributes',
+         lambda: frozen.celery.queue_name.get('processor')),
+        ('FrozenConfig.get_path',
+         lambda: frozen.get_path('celery.queue_name.processor')),
+        ('ClientConfig item',
+         lambda: ClientConfig(config.redis)['lock']),
+        ('FrozenClientConfig item',
+         lambda: frozen.redis.inherited()['lock']),
+    ]
+    for name, case in cases:
+        total = timeit.timeit(case, number=REPEAT)
+        print('{:<32} {:.3f} us'.format(name, total / REPEAT * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Measures import time of pypipes modules and checks that optional backends
+(celery, kombu, bravado, requests, datadog) are not imported before they are used.
+Each module is imported by a new interpreter with `python -X importtime` (Python 3.7+).
+Namespace package `pypipes` is imported first, so its setup is not counted.
+Run: python benchmarks/import_time.py
+Exit status is not zero if a module imports a lazy backend or exceeds its time budget.
+"""
+from __future__ import print_function
+
+import subprocess
+import sys
+
+BACKENDS = ('celery', 'kombu', 'bravado', 'bravado_core', 'requests', 'datadog')
+BUDGET = 60  # ms
+HTTP_BUDGET = 150  # ms, requests takes most of it
+
+# module, backends that the module may import, import time budget
+MODULES = [
+    ('pypipes.program', (), BUDGET),
+    ('pypipes.processor', (), BUDGET),
+    ('pypipes.config', (), BUDGET),
+    ('pypipes.context.config', (), BUDGET),
+    ('pypipes.service.storage', (), BUDGET),
+    ('pypipes.service.lock', (), BUDGET),
+    ('pypipes.service.counter', (), BUDGET),
+    ('pypipes.service.cache', (), BUDGET),
+    ('pypipes.service.metric', (), BUDGET),
+    ('pypipes.infrastructure.inline', (), BUDGET),
+    ('pypipes.infrastructure.on_celery', (), BUDGET),
+    ('pypipes.infrastructure.command', (), BUDGET),
+    ('pypipes.service.http_client', ('requests',), HTTP_BUDGET),
+    ('pypipes.service.openapi_client', ('requests',), HTTP_BUDGET),
+]
+
+
+def import_time(module):
+    """
+    :return: import time in ms, set of imported modules
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import pypipes; import ' + module],
+        stderr=subprocess.STDOUT, universal_newlines=True)
+    lines = [line.split('|') for line in output.splitlines()
+             if line.startswith('import time:') and '|' in line]
+    # skip interpreter startup and namespace package setup
+    start = [name.rstrip() for _, _, name in lines].index(' pypipes') + 1
+    total = 0
+    imported = set()
+    for _, cumulative, name in lines[start:]:
+        imported.add(name.strip())
+        if not name.startswith('  '):
+            # top level import, its cumulative time includes nested imports
+            total += int(cumulative)
+    return total / 1000.0, imported
+
+
+def main():
+    failed = False
+    for module, allowed, budget in MODULES:
+        total, imported = import_time(module)
+        backends = sorted(name for name in BACKENDS
+                          if name in imported and name not in allowed)
+        over_budget = total > budget
+        failed = failed or over_budget or bool(backends)
+        print('{:<36} {:>8.1f} ms{}{}'.format(
+            module, total, ' OVER BUDGET' if over_budget else '',
+            ' imports {}'.format(', '.join(backends)) if backends else ''))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Measures a cost of receiving a serialized message, reading one field
+and forwarding the message to next processor.
+Run: python benchmarks/message_decoding.py
+"""
+from __future__ import print_function
+
+import pickle
+import timeit
+
+from pypipes.message import FrozenMessage, copy_message, freeze_message, \
+    enable_message_envelopes
+
+REPEAT = 100
+MESSAGES = [
+    # name, count of keys, size of key value
+    ('10 fields', 10, 10),
+    ('1000 fields', 1000, 100),
+]
+
+
+def build_value(index, size):
+    return {'name': 'value {}'.format(index),
+            'items': [{'id': i, 'value': '{}:{}'.format(index, i)} for i in range(size)]}
+
+
+def forward_dict(data):
+    message = pickle.loads(data)
+    message['key0']  # noqa
+    return pickle.dumps(dict(message, key0='updated'))
+
+
+def forward_envelope(data):
+    message = pickle.loads(data)
+    message['key0']  # noqa
+    return pickle.dumps(freeze_message(copy_message(message, key0='updated')))
+
+
+def main():
+    enable_message_envelopes()
+    for name, keys, size in MESSAGES:
+        message = {'key{}'.format(i): build_value(i, size) for i in range(keys)}
+        dict_data = pickle.dumps(message)
+        envelope_data = pickle.dumps(FrozenMessage(message))
+        for method, data in (('dict', dict_data), ('envelope', envelope_data)):
+            total = timeit.timeit(lambda: forward_dict(data) if method == 'dict'
+                                  else forward_envelope(data), number=REPEAT)
+            print('{:>12} {:>9}: {:8.1f} us per message, {} bytes'.format(
+                name, method, total / REPEAT * 1e6, len(data)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Measures a cost of passing a message from one processor to another.
+Run: python benchmarks/message_hop.py
+"""
+from __future__ import print_function
+
+import timeit
+
+from pypipes.infrastructure.inline import RunInline
+from pypipes.processor import pipe_processor
+from pypipes.program import Program
+
+PIPELINE_LENGTH = 10
+MESSAGES = [
+    # name, count of keys, key value size, repeat
+    ('1 KB', 10, 100, 1000),
+    ('1 MB', 10000, 100, 10),
+    ('1 MB, 4 keys', 4, 256 * 1024, 1000),
+]
+
+
+@pipe_processor
+def forward(message):
+    return message
+
+
+def main():
+    pipeline = forward
+    for _ in range(PIPELINE_LENGTH - 1):
+        pipeline = pipeline >> forward
+    program = Program('benchmark', {'pipeline': pipeline})
+    infrastructure = RunInline()
+    infrastructure.load(program)
+
+    for name, keys, value_size, repeat in MESSAGES:
+        message = {'key{}'.format(i): 'x' * value_size for i in range(keys)}
+        total = timeit.timeit(
+            lambda: infrastructure.process_message(program, 'pipeline.forward', message),
+            number=repeat)
+        print('{:>14}: {:8.1f} us per hop'.format(name, total / repeat / PIPELINE_LENGTH * 1e6))
+
+
+if __name__ == '__main__':
+    main()
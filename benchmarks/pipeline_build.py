@@ -0,0 +1,50 @@
+"""
+Measures a cost of building a program with a long pipeline,
+e.g. a worker startup that builds all its programs.
+Each processor has context managers and listens for an event.
+Run: python benchmarks/pipeline_build.py
+"""
+from __future__ import print_function
+
+import timeit
+
+from pypipes.context.define import define
+from pypipes.processor import pipe_processor
+from pypipes.processor.event import Event
+from pypipes.program import Program
+
+PROCESSORS = 500
+REPEAT = 5
+
+
+def make_processor(index):
+    @define(index=index, payload={'values': list(range(100))})
+    @define(name='processor_{}'.format(index))
+    @pipe_processor
+    def forward(message, index):
+        return dict(message, index=index)
+    return forward
+
+
+def build_program(processors):
+    pipeline = processors[0]
+    for index, processor in enumerate(processors[1:]):
+        if index % 10 == 0:
+            pipeline = pipeline >> (Event.on('event_{}'.format(index)) >> processor)
+        else:
+            pipeline = pipeline >> processor
+    return Program('benchmark', {'pipeline': pipeline})
+
+
+def main():
+    processors = [make_processor(index) for index in range(PROCESSORS)]
+    program = build_program(processors)
+    assert len(program.processors) == PROCESSORS
+
+    total = timeit.timeit(lambda: build_program(processors), number=REPEAT)
+    print('Build a program of {} processors: {:.1f} ms'.format(
+        PROCESSORS, total / REPEAT * 1000))
+
+
+if __name__ == '__main__':
+    main()
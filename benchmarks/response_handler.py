@@ -0,0 +1,47 @@
+"""
+Measures CPU time and memory allocations of a response handler per processed message.
+Run: python benchmarks/response_handler.py
+"""
+from __future__ import print_function
+
+import timeit
+import tracemalloc
+
+from pypipes.infrastructure.response.listener import ListenerResponseHandler
+
+REPEAT = 100000
+
+
+class Program(object):
+    @staticmethod
+    def get_next_processor(processor_id):
+        return 'next_processor'
+
+
+class Infrastructure(object):
+    @staticmethod
+    def send_message(program, processor_id, message, start_in=None, priority=None):
+        pass
+
+
+def process_message(infrastructure=Infrastructure(), program=Program(),
+                    message={'key': 'value'}):
+    # a typical message life: create a handler, emit a result, flush
+    response = ListenerResponseHandler(infrastructure, program, 'processor', message)
+    response.emit_message(message)
+    response.flush()
+
+
+def main():
+    total = timeit.timeit(process_message, number=REPEAT)
+    print('CPU time: {:.2f} us per message'.format(total / REPEAT * 1e6))
+
+    tracemalloc.start()
+    process_message()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('Peak memory: {} bytes per message'.format(peak))
+
+
+if __name__ == '__main__':
+    main()
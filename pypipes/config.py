@@ -1,13 +1,15 @@
 import json
 import logging
 import os
+import tempfile
+import threading
 from collections import defaultdict
 
-import requests
 import six
 
 from pypipes.exceptions import InvalidConfigException
-from pypipes.context import apply_injections
+from pypipes.context import apply_injections, IContextFactory
+from pypipes.service import release_config_singletons
 
 if six.PY3:
     from configparser import ConfigParser
@@ -27,33 +29,54 @@ def decrypt(password, ciphertext):
     return decrypt(password, ciphertext).decode('utf-8')
 
 
-def from_url(url, password=None, method='get', content_type=None, **kwargs):
+def _parse_config(content, content_type, password=None):
+    """
+    Parse downloaded config content
+    :param content: content bytes
+    :param content_type: content type
+    :param password: content decryption password
+    :return: configuration dict
+    """
+    content_stream = StringIO(decrypt(password, content) if password
+                              else content.decode('utf-8'))
+    if content_type == 'application/json':
+        return json.load(content_stream) or {}
+    elif content_type in ('application/x-yaml', 'text/x-yaml', 'application/yaml'):
+        import yaml
+        return yaml.safe_load(content_stream) or {}
+    else:
+        raise NotImplementedError('no config parser for %r content type', content_type)
+
+
+def from_url(url, password=None, method='get', content_type=None, cache_file=None, **kwargs):
     """
     Download config from url. Function parameters are same as requests.request parameters
     :param url: request url
     :param method: request method
     :param content_type: override resource content type if needed.
     :param password: content decryption password
+    :param cache_file: local file that keeps last downloaded config.
+        Config is revalidated with a conditional request
+        and the file is used if config server is not available.
     :param kwargs: additional parameters for requests.request
     :return: configuration dict
     """
+    if cache_file:
+        watcher = ConfigWatcher(url, cache_file=cache_file, password=password, method=method,
+                                content_type=content_type, **kwargs)
+        return dict(watcher.load())
+
+    import requests
+
     try:
-        with requests.request(method, url, allow_redirects=True, stream=True, **kwargs) as resp:
+        with requests.request(method, url, allow_redirects=True, **kwargs) as resp:
             if resp.status_code == 404:
                 logger.warning('Config %r not exists', url)
                 return {}
 
             resp.raise_for_status()
-            response_stream = (StringIO(decrypt(password, resp.content))
-                               if password else resp.raw)
-            content_type = content_type or resp.headers.get('Content-Type')
-            if content_type == 'application/json':
-                return json.load(response_stream) or {}
-            elif content_type in ('application/x-yaml', 'text/x-yaml', 'application/yaml'):
-                import yaml
-                return yaml.safe_load(response_stream) or {}
-            else:
-                raise NotImplementedError('no config parser for %r content type', content_type)
+            return _parse_config(resp.content, content_type or resp.headers.get('Content-Type'),
+                                 password)
     except Exception:
         logger.exception('Cannot load config file from url: %r', url)
         raise
@@ -268,6 +291,355 @@ class ClientConfig(InheritedConfig):
         return self.get_section(service_name).get_level()
 
 
+class FrozenConfig(Config):
+    """
+    Immutable precompiled snapshot of a configuration.
+
+    Nested sections are converted into snapshots when the snapshot is created,
+    so a config attribute is a plain instance attribute
+    and a value is found by its dotted path with a single dictionary lookup:
+
+    frozen = freeze_config(config)
+    frozen.celery.queue_name.get('processor')
+    frozen.get_path('celery.queue_name.processor')
+
+    Snapshot is safe to share between threads, use `freeze_config` of a new config
+    to change it.
+    """
+    def __init__(self, values=None):
+        super(FrozenConfig, self).__init__()
+        values = values or {}
+        self.__dict__['_level'] = {key: value for key, value in six.iteritems(values)
+                                   if not isinstance(value, dict)}
+        paths = {}
+        for key, value in six.iteritems(values):
+            if isinstance(value, dict):
+                value = self._create_section(value)
+                paths.update(('{}.{}'.format(key, path), path_value)
+                             for path, path_value in six.iteritems(value._paths))
+            dict.__setitem__(self, key, value)
+            paths[key] = value
+            name = self._normalize_key(key)
+            if not hasattr(self.__class__, name):
+                # dict methods can't be overridden by config values
+                self.__dict__[name] = value
+        self.__dict__['_paths'] = paths
+
+    def _create_section(self, values):
+        return self.__class__(values)
+
+    def _missing_section(self):
+        return self.__class__()
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        # missed section
+        return self._missing_section()
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('{} is immutable'.format(self.__class__.__name__))
+
+    __setattr__ = __delattr__ = __setitem__ = __delitem__ = _immutable
+    update = pop = popitem = setdefault = clear = _immutable
+
+    def get_level(self):
+        return dict(self._level)
+
+    def get_path(self, path, default=None):
+        """
+        Get config value by its dotted path
+        :param path: dotted path of the value, e.g. 'celery.queue_name.processor'
+        :param default: default value
+        :return: config value or default if value doesn't exist
+        """
+        return self._paths.get(path, default)
+
+    def inherited(self):
+        """
+        Get inherited version of the snapshot, see InheritedConfig
+        Inheritance is resolved once for whole snapshot.
+        :rtype: FrozenClientConfig
+        """
+        result = self.__dict__.get('_inherited')
+        if result is None:
+            # a race here only creates the same snapshot twice
+            result = self.__dict__['_inherited'] = FrozenClientConfig(self)
+        return result
+
+
+class FrozenClientConfig(FrozenConfig):
+    """
+    Immutable snapshot of ClientConfig.
+    Values inherited from upper config levels are resolved when the snapshot is created.
+    """
+    def _create_section(self, values):
+        # next level inherits current config as a base
+        return self.__class__(dict(self._level, **values))
+
+    def _missing_section(self):
+        missing = self.__dict__.get('_missing')
+        if missing is None:
+            missing = self.__dict__['_missing'] = self.__class__(self._level)
+        return missing
+
+    def __getitem__(self, service_name):
+        return self.get_section(service_name).get_level()
+
+    def inherited(self):
+        return self
+
+
+def freeze_config(config):
+    """
+    Create an immutable precompiled snapshot of config
+    :param config: configuration dictionary
+    :return: config snapshot
+    :rtype: FrozenConfig
+    """
+    if isinstance(config, FrozenConfig):
+        return config
+    if isinstance(config, InheritedConfig):
+        return FrozenClientConfig(config)
+    return FrozenConfig(config)
+
+
+DEFAULT_WATCH_INTERVAL = 60  # seconds
+
+
+class ConfigWatcher(IContextFactory):
+    """
+    Keeps configuration downloaded from url up to date.
+
+    Config server is polled with conditional requests (If-None-Match / If-Modified-Since),
+    and a changed config replaces current config snapshot at once,
+    so a reader gets either old or new config but never a mix of them.
+    Last downloaded config is saved into a local file,
+    so a worker starts with it without waiting for the config server
+    and keeps working with it if config server is not available.
+
+    Watcher is a lazy context that provides current config snapshot:
+
+    watcher = ConfigWatcher('https://config.server/config.yaml',
+                            cache_file='/var/cache/pipes/config.yaml.cache')
+    watcher.subscribe(on_api_change, 'api.my_api')
+    watcher.start()
+    infrastructure = RedisCeleryInfrastructure({'config': watcher, ...})
+
+    Objects created by `config_singleton` of changed config sections are released
+    and created again with a new configuration.
+    """
+    def __init__(self, url, cache_file=None, interval=DEFAULT_WATCH_INTERVAL, password=None,
+                 method='get', content_type=None, **kwargs):
+        """
+        :param url: config url
+        :param cache_file: local file that keeps last downloaded config content,
+            its content type and validators are kept in `<cache_file>.json`
+        :param interval: polling interval in seconds
+        :param password: content decryption password
+        :param method: request method
+        :param content_type: override resource content type if needed.
+        :param kwargs: additional parameters for requests.request
+        """
+        self.url = url
+        self.cache_file = cache_file
+        self.interval = interval
+        self.password = password
+        self.method = method
+        self.content_type = content_type
+        self._request_kwargs = kwargs
+        self._config = None
+        self._validators = {}
+        self._listeners = []
+        self._sync = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __call__(self, context_dict):
+        return self.config
+
+    @property
+    def config(self):
+        """
+        Current config snapshot
+        :rtype: FrozenConfig
+        """
+        if self._config is None:
+            self.load()
+        return self._config
+
+    def subscribe(self, callback, path=None):
+        """
+        Subscribe on config change
+        :param callback: function(new_value, old_value) that is called
+            when config value is changed
+        :param path: dotted path of watched config value, None - whole config
+        """
+        self._listeners.append((path, callback))
+
+    def load(self):
+        """
+        Load config synchronously.
+        Local copy of the config is used if config server is not available.
+        :return: config snapshot
+        :rtype: FrozenConfig
+        """
+        if self._config is None:
+            self._read_cache()
+        try:
+            self.poll()
+        except Exception:
+            if self._config is None:
+                raise
+            logger.warning('Config server is not available, use a local copy of config %r',
+                           self.url)
+        return self._config
+
+    def poll(self):
+        """
+        Download config if it's changed
+        :return: True if config is changed
+        """
+        import requests
+
+        kwargs = dict(self._request_kwargs)
+        kwargs['headers'] = dict(kwargs.get('headers') or {}, **self._validators)
+        try:
+            with requests.request(self.method, self.url, allow_redirects=True,
+                                  **kwargs) as resp:
+                if resp.status_code == 304:
+                    return False
+                if resp.status_code == 404:
+                    logger.warning('Config %r not exists', self.url)
+                    # keep last known config if config is removed from the server
+                    return self._config is None and self._swap({})
+
+                resp.raise_for_status()
+                content_type = self.content_type or resp.headers.get('Content-Type')
+                values = _parse_config(resp.content, content_type, self.password)
+                validators = _get_validators(resp.headers)
+                content = resp.content
+        except Exception:
+            logger.exception('Cannot load config file from url: %r', self.url)
+            raise
+
+        self._validators = validators
+        self._write_cache(content, content_type, validators)
+        return self._swap(values)
+
+    def _swap(self, values):
+        config = freeze_config(values)
+        with self._sync:
+            previous = self._config
+            if previous == config:
+                # keep current snapshot, so its compiled versions are still valid
+                return False
+            self._config = config
+        if previous is not None:
+            logger.info('Config %r is changed', self.url)
+            self._notify(config, previous)
+        return True
+
+    def _notify(self, config, previous):
+        for path, callback in self._listeners:
+            value = config.get_path(path) if path else config
+            previous_value = previous.get_path(path) if path else previous
+            if value != previous_value:
+                try:
+                    callback(value, previous_value)
+                except Exception:
+                    logger.exception('Config change listener %r failed', callback)
+        release_config_singletons(*[name for name in set(config).union(previous)
+                                    if config.get(name) != previous.get(name)])
+
+    def _read_cache(self):
+        if not (self.cache_file and os.path.exists(self.cache_file)):
+            return
+        try:
+            with open(self.cache_file + '.json', 'r') as meta_file:
+                meta = json.load(meta_file)
+            with open(self.cache_file, 'rb') as cache_file:
+                content = cache_file.read()
+            self._swap(_parse_config(content, meta.get('content_type'), self.password))
+            self._validators = meta.get('validators') or {}
+        except Exception:
+            logger.exception('Failed to read a local copy of config from %s', self.cache_file)
+
+    def _write_cache(self, content, content_type, validators):
+        if not self.cache_file:
+            return
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+        try:
+            if not os.path.isdir(cache_dir):
+                # config may contain secrets, so only the owner may read its local copy
+                os.makedirs(cache_dir, 0o700)
+            # original content is saved, so encrypted config stays encrypted on disk
+            _write_file(self.cache_file, content)
+            # validators are written after the content, so they never validate a stale copy
+            _write_file(self.cache_file + '.json', six.ensure_binary(json.dumps(
+                {'content_type': content_type, 'validators': validators})))
+        except Exception:
+            logger.exception('Failed to save a local copy of config into %s', self.cache_file)
+
+    def start(self):
+        """
+        Start polling of config server in background.
+        Watcher starts with a local copy of config if it exists,
+        otherwise config is loaded before the polling is started.
+        """
+        if self._thread is not None:
+            return
+        if self._config is None:
+            self._read_cache()
+        # config loaded from a local copy is checked at once
+        delay = 0 if self._config is not None else self.interval
+        if self._config is None:
+            self.load()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, args=(delay,),
+                                        name='ConfigWatcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop background polling
+        """
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopped.set()
+            thread.join()
+
+    def _watch(self, delay):
+        while not self._stopped.wait(delay):
+            delay = self.interval
+            try:
+                self.poll()
+            except Exception:
+                # error is already logged, current config is used till next poll
+                pass
+
+
+def _write_file(path, content):
+    # write a temporary file and rename it, so other processes never read a partial file
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)),
+                                     delete=False) as temp_file:
+        temp_file.write(content)
+    os.rename(temp_file.name, path)
+
+
+def _get_validators(headers):
+    validators = {}
+    if headers.get('ETag'):
+        validators['If-None-Match'] = headers['ETag']
+    if headers.get('Last-Modified'):
+        validators['If-Modified-Since'] = headers['Last-Modified']
+    return validators
+
+
 _config = None
 
 ENV_PREFIX = 'PIPES'
@@ -289,8 +661,8 @@ def get_config(env_prefix=ENV_PREFIX, config_path=None, override_path=None, over
         if config_sources:
             if override_env:
                 config_sources.append(from_environ(env_prefix))
-            _config = Config(merge(*config_sources))
+            _config = FrozenConfig(merge(*config_sources))
         else:
             # empty config if config path is not specified
-            _config = Config()
+            _config = FrozenConfig()
     return _config
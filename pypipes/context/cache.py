@@ -1,7 +1,8 @@
 import logging
 from datetime import datetime, timedelta
 from functools import partial
-from time import sleep
+from threading import Event, Lock
+from time import time
 
 from pypipes.context import apply_context_to_kwargs, injections_handler
 from pypipes.context.manager import pipe_contextmanager
@@ -73,106 +74,246 @@ class MetaValue(object):
             return self.metadata.get(item)
 
 
-def cached_lazy_context(_gen_func=None, expires_in=None, generation_time=5,
-                        **key_params):
+class SingleFlight(object):
     """
-    Create a lazy context that handles context generation, caching and refreshing
-    :param _gen_func: Context factory that may use context injections
-    :type _gen_func: (ANY) -> object
-    :param expires_in: context cache expiration time in seconds
-    :param generation_time: time needed to generate a new context
-    :param key_params: context key. The factory will create a separate context per context key
-    :rtype: pypipes.context.factory.LazyContext
+    Coalesces concurrent in-process calls for the same key.
+    Only the first caller executes the function, other callers block
+    until its result is ready and receive the same result or exception.
     """
-    if _gen_func is None:
-        return partial(cached_lazy_context, expires_in=expires_in,
-                       generate_in=generation_time,
-                       **key_params)
 
-    assert generation_time > 0
-    context_name = _gen_func.__name__
-    context_factory = injections_handler(_gen_func)
+    class _Flight(object):
+        def __init__(self):
+            self.done = Event()
+            self.result = None
+            self.error = None
 
-    def get_refresh_at(_expires_in):
-        # returns time when the context may be refreshed
-        if _expires_in:
-            return datetime.utcnow() + timedelta(
-                seconds=(_expires_in - min(_expires_in / 2, generation_time)))
+    def __init__(self):
+        self._flights = {}
+        self._sync = Lock()
 
-    @lazy_context
-    def _cached_lazy_context(cache, lock, injections):
+    def do(self, flight_key, func, timeout=None):
         """
-        Get context from cache or create a new one
-        :type cache: IContextPool[ICache]
-        :type lock: IContextPool[ILock]
-        :param injections: context collection
-        :return: context object
+        Execute func once for all concurrent callers with the same key
+        :param flight_key: flight key
+        :param func: function without parameters
+        :param timeout: max time in seconds to wait for a flight started by other caller
+        :return: func result
+        :raise: RetryMessageException if the flight takes more than timeout
         """
-        context_cache = cache.context
-        context_lock = lock.context
+        with self._sync:
+            flight = self._flights.get(flight_key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[flight_key] = self._Flight()
+
+        if not is_leader:
+            if not flight.done.wait(timeout):
+                raise RetryMessageException(
+                    'Flight {!r} took too much time'.format(flight_key), retry_in=timeout)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._sync:
+                del self._flights[flight_key]
+            flight.done.set()
+
+
+class CachedContextFactory(object):
+    """
+    Generates, caches and refreshes context values built by a context factory.
+    Only one processor generates a context at a time, other processors of the same process
+    wait for the in-flight generation and processors of other processes wait
+    for the context lock release.
+    """
+    def __init__(self, gen_func, expires_in=None, generation_time=5, stale_ttl=0,
+                 wait_timeout=10):
+        assert generation_time > 0
+        self.context_name = gen_func.__name__
+        self.context_factory = injections_handler(gen_func)
+        self.expires_in = expires_in
+        self.generation_time = generation_time
+        self.stale_ttl = stale_ttl
+        self.wait_timeout = wait_timeout
+        self.flights = SingleFlight()
+
+    def _get_refresh_at(self, expires_in):
+        # returns time when the context may be refreshed
+        if expires_in:
+            return datetime.utcnow() + timedelta(
+                seconds=(expires_in - min(expires_in / 2, self.generation_time)))
+
+    @staticmethod
+    def _get_expires_at(expires_in):
+        if expires_in:
+            return datetime.utcnow() + timedelta(seconds=expires_in)
 
-        context_key = key(context_name, apply_context_to_kwargs(key_params, injections))
+    @staticmethod
+    def _refresh_required(refresh_at):
+        return refresh_at and datetime.utcnow() > refresh_at
 
-        def _create_and_save_context():
-            new_context = context_factory(injections)
+    @staticmethod
+    def _get_cached(context_key, context_cache):
+        # returns (context, refresh_at, expires_at) or None if context is not cached
+        value = context_cache.get(context_key)
+        if value:
+            # context saved by previous version has no expiration time
+            return value if len(value) > 2 else (value[0], value[1], None)
+
+    def _create_and_save(self, context_key, context_cache, context_lock, injections):
+        lock_on = False
+        try:
+            new_context = self.context_factory(injections)
 
             if isinstance(new_context, MetaValue):
                 # factory may override default expiration and other predefined params
-                _expires_in = int(new_context.metadata.get('expires_in', expires_in))
-                _lock_on = int(new_context.metadata.get('lock_on', 0))
+                expires_in = int(new_context.metadata.get('expires_in', self.expires_in))
+                lock_on = int(new_context.metadata.get('lock_on', 0))
                 new_context = new_context.value
             else:
-                _expires_in = expires_in
-                _lock_on = False
+                expires_in = self.expires_in
 
-            if _lock_on:
+            if lock_on:
                 # context factory demands to lock it for some time
                 # that may be caused by rate limit or other resource limitations
                 logger.warning('Context factory for %s is locked for %s seconds',
-                               context_key, _lock_on)
-                context_lock.set(context_key, expire_in=_lock_on)
+                               context_key, lock_on)
+                context_lock.set(context_key, expire_in=lock_on)
 
             if new_context is None:
                 raise AssertionError('Context value for %r is not available', context_key)
 
             # save new value into the cache
-            context_cache.save(context_key, (new_context, get_refresh_at(_expires_in)),
-                               expires_in=_expires_in)
+            # expired value is kept in the cache a little longer to be served as stale
+            context_cache.save(context_key, (new_context,
+                                             self._get_refresh_at(expires_in),
+                                             self._get_expires_at(expires_in)),
+                               expires_in=expires_in and expires_in + self.stale_ttl)
             return new_context
+        finally:
+            if not lock_on:
+                # wake up all processors that are waiting for the context
+                context_lock.release(context_key)
 
-        tries = 10  # max count of tries to get the context
-        while tries > 0:
-            tries -= 1
-            value = context_cache.get(context_key)
+    def _acquire_and_create(self, context_key, context_cache, context_lock, injections):
+        """
+        Try to acquire the context lock and generate a new context
+        :return: (True, context) if lock was acquired, otherwise (False, None)
+        """
+        if not context_lock.acquire(context_key, expire_in=self.generation_time):
+            return False, None
+        value = self._get_cached(context_key, context_cache)
+        if value and not self._refresh_required(value[1]):
+            # context was saved by other processor while we were acquiring the lock
+            context_lock.release(context_key)
+            return True, value[0]
+        return True, self._create_and_save(context_key, context_cache, context_lock, injections)
 
-            if value:
-                context, refresh_at = value
-                if (refresh_at and datetime.utcnow() > refresh_at and
-                        context_lock.acquire(context_key, expire_in=generation_time)):
-                    # current context value is still valid
-                    # but it's a good time to prepare a new one in advance
-                    # that will prevents blocking of other processors
-                    context = _create_and_save_context()
+    def _wait_and_create(self, context_key, context_cache, context_lock, injections):
+        deadline = time() + self.wait_timeout
+        while True:
+            acquired, context = self._acquire_and_create(context_key, context_cache,
+                                                         context_lock, injections)
+            if acquired:
                 return context
-            else:
-                if context_lock.acquire(context_key, expire_in=generation_time):
-                    return _create_and_save_context()
-                else:
-                    # some other processor is generating the context right now
-                    # check when the new context will be ready
-                    lock_expires_in = context_lock.get(context_key)
-                    if lock_expires_in:
-                        if lock_expires_in > generation_time:
-                            # the context factory locked itself for a long time
-                            raise RetryMessageException(
-                                'Context factory for {!r} is locked'.format(context_name),
-                                retry_in=lock_expires_in)
-                        # sleep a little and check again
-                        sleep(1)
-
-        # context is still not ready after all tries
+
+            # some other processor is generating the context right now
+            # check when the new context will be ready
+            lock_expires_in = context_lock.get(context_key)
+            if lock_expires_in and lock_expires_in > self.generation_time:
+                # the context factory locked itself for a long time
+                raise RetryMessageException(
+                    'Context factory for {!r} is locked'.format(self.context_name),
+                    retry_in=lock_expires_in)
+
+            remaining = deadline - time()
+            if remaining <= 0:
+                break
+            # block till the context generator releases the lock
+            context_lock.wait(context_key, timeout=remaining)
+            value = self._get_cached(context_key, context_cache)
+            if value:
+                return value[0]
+
+        # context is still not ready after wait_timeout
         # retry the message processing some later
-        logger.error('Failed to create context: %s', context_name)
+        logger.error('Failed to create context: %s', self.context_name)
         raise RetryMessageException(
-            'Context {!r} creation took too much time'.format(context_name), retry_in=60)
+            'Context {!r} creation took too much time'.format(self.context_name), retry_in=60)
+
+    def get(self, context_key, context_cache, context_lock, injections):
+        """
+        Get context from cache or create a new one
+        :param context_key: context key
+        :type context_cache: pypipes.service.cache.ICache
+        :type context_lock: pypipes.service.lock.ILock
+        :param injections: context collection
+        :return: context object
+        """
+        value = self._get_cached(context_key, context_cache)
+        if value:
+            context, refresh_at, _ = value
+            if self._refresh_required(refresh_at):
+                # current context value is still valid or stale
+                # but it's a good time to prepare a new one in advance
+                # other processors use current value meanwhile
+                acquired, new_context = self._acquire_and_create(context_key, context_cache,
+                                                                 context_lock, injections)
+                if acquired:
+                    return new_context
+            # context is served even if it's stale because other processor is refreshing it
+            return context
+
+        # only one caller per process waits for the context, others wait for its result
+        return self.flights.do(
+            context_key,
+            partial(self._wait_and_create, context_key, context_cache, context_lock, injections),
+            timeout=self.wait_timeout)
+
+
+def cached_lazy_context(_gen_func=None, expires_in=None, generation_time=5, stale_ttl=0,
+                        wait_timeout=10, **key_params):
+    """
+    Create a lazy context that handles context generation, caching and refreshing
+    :param _gen_func: Context factory that may use context injections
+    :type _gen_func: (ANY) -> object
+    :param expires_in: context cache expiration time in seconds
+    :param generation_time: time needed to generate a new context
+    :param stale_ttl: time in seconds while an expired context is still served
+        if other processor is generating a new one.
+    :param wait_timeout: max time in seconds to wait for a context generated by other processor
+    :param key_params: context key. The factory will create a separate context per context key
+    :rtype: pypipes.context.factory.LazyContext
+    """
+    if _gen_func is None:
+        return partial(cached_lazy_context, expires_in=expires_in,
+                       generation_time=generation_time,
+                       stale_ttl=stale_ttl,
+                       wait_timeout=wait_timeout,
+                       **key_params)
+
+    context_factory = CachedContextFactory(_gen_func, expires_in=expires_in,
+                                           generation_time=generation_time,
+                                           stale_ttl=stale_ttl,
+                                           wait_timeout=wait_timeout)
+
+    @lazy_context
+    def _cached_lazy_context(cache, lock, injections):
+        """
+        Get context from cache or create a new one
+        :type cache: IContextPool[ICache]
+        :type lock: IContextPool[ILock]
+        :param injections: context collection
+        :return: context object
+        """
+        context_key = key(context_factory.context_name,
+                          apply_context_to_kwargs(key_params, injections))
+        return context_factory.get(context_key, cache.context, lock.context, injections)
     return _cached_lazy_context
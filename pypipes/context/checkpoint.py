@@ -0,0 +1,105 @@
+import logging
+from binascii import hexlify
+
+from pypipes.context import apply_context_to_kwargs
+from pypipes.context.manager import pipe_contextmanager
+from pypipes.message import message_digest
+from pypipes.service import key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_PERIOD = 100  # messages
+
+
+class Checkpoint(object):
+    """
+    Position of a message stream emitted by a processor
+    """
+    def __init__(self, storage, checkpoint_key, every=DEFAULT_CHECKPOINT_PERIOD):
+        """
+        :param storage: checkpoint storage
+        :type storage: pypipes.service.storage.IStorage
+        :param checkpoint_key: checkpoint key
+        :param every: save the position each time when this count of messages are emitted
+        """
+        self.storage = storage
+        self.checkpoint_key = checkpoint_key
+        self.every = every
+        # count of messages emitted by previous attempts of the processing
+        self.position = storage.get(checkpoint_key) or 0
+        self.emitted = self.position  # actual position of the stream
+        self._skip = self.position
+
+    def resume(self):
+        """
+        Take over a stream resumption.
+        Processor that can start its stream from the checkpoint position should call it,
+        otherwise first `position` messages of the stream are dropped.
+        :return: count of messages that the processor should skip
+        """
+        self._skip = 0
+        return self.position
+
+    def filter(self, msg):
+        if self._skip:
+            # the message was emitted before the processing was interrupted
+            self._skip -= 1
+            return None
+        self.emitted += 1
+        if self.emitted % self.every == 0:
+            self.save()
+        return msg
+
+    def save(self):
+        self.storage.save(self.checkpoint_key, self.emitted)
+
+    def delete(self):
+        self.storage.delete(self.checkpoint_key)
+
+
+def checkpoint(checkpoint_name=None, every=DEFAULT_CHECKPOINT_PERIOD, storage_name='checkpoint',
+               **context_kwargs):
+    """
+    Checkpoints a position of a long message stream emitted by a processor.
+    If the processing is interrupted and the message is processed again,
+    messages that were emitted before the last checkpoint are not emitted twice.
+    The stream is still generated from the start unless the processor calls
+    `checkpoint.resume()` and skips already emitted messages itself.
+    Requires next services:
+        storage.checkpoint (IStorage) - checkpoint storage
+    :param checkpoint_name: checkpoint name. Processor id is used as a name if it's missed.
+    :param every: save the position each time when this count of messages are emitted
+    :param storage_name: name of checkpoint storage service
+    :param context_kwargs: checkpoint key parameters based on current context.
+        Use ContextPath to extract values from processor context.
+        Input message content is used as a key parameter if context_kwargs are missed.
+    :rtype: pypipes.context.manager.PipeContextManager
+    """
+    @pipe_contextmanager
+    def checkpoint_contextmanager(processor_id, message, injections, response, storage):
+        """
+        :type response: pypipes.infrastructure.response.IResponseHandler
+        """
+        if context_kwargs:
+            key_params = apply_context_to_kwargs(context_kwargs, injections)
+        else:
+            key_params = {'message': hexlify(message_digest(message)).decode('ascii')}
+        checkpoint_obj = Checkpoint(storage[storage_name],
+                                    key(checkpoint_name or processor_id, **key_params),
+                                    every=every)
+        if checkpoint_obj.position:
+            logger.info('Resume %s stream from position %s',
+                        processor_id, checkpoint_obj.position)
+
+        response.add_message_filter(checkpoint_obj.filter)
+        try:
+            yield {'checkpoint': checkpoint_obj}
+        except Exception:
+            # emitted messages are already sent, save actual position for next attempt
+            checkpoint_obj.save()
+            raise
+        else:
+            checkpoint_obj.delete()
+        finally:
+            response.remove_message_filter(checkpoint_obj.filter)
+    return checkpoint_contextmanager
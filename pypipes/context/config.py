@@ -1,4 +1,4 @@
-from pypipes.config import Config, ClientConfig
+from pypipes.config import Config, ClientConfig, FrozenConfig
 from pypipes.context import ContextPath
 
 
@@ -7,15 +7,26 @@ class ConfigPath(ContextPath):
 
     def __call__(self, context_dict):
         result = super(ConfigPath, self).__call__(context_dict)
+        if isinstance(result, FrozenConfig):
+            # config snapshot is already compiled
+            return self._frozen(result)
         # Convert ContextPath result into a Config object
         if result is None or isinstance(result, dict):
             return self.config_class(result or {})
         return result
 
+    @staticmethod
+    def _frozen(config):
+        return config
+
 
 class ClientConfigPath(ConfigPath):
     config_class = ClientConfig
 
+    @staticmethod
+    def _frozen(config):
+        return config.inherited()
+
 
 config = ConfigPath().config
 client_config = ClientConfigPath().config
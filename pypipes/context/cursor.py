@@ -8,7 +8,8 @@ CURSOR_LOCK_EXPIRATION = 60
 
 
 def cursor(cursor_name=None, guard_expire_in=CURSOR_LOCK_EXPIRATION,
-           retry_if_locked=False, **context_kwargs):
+           retry_if_locked=False, heartbeat_interval=None, wait_timeout=None,
+           **context_kwargs):
     """
     A context manager for pipe processor to manage cursor value saved in IStorage
     This context manager ensure that only one processor works with a cursor in same time frame.
@@ -21,16 +22,23 @@ def cursor(cursor_name=None, guard_expire_in=CURSOR_LOCK_EXPIRATION,
     :param guard_expire_in: singleton_guard lock expiration time.
         Processor lock will be automatically prolonged each time when new message is emitted.
     :param retry_if_locked: retry task if cursor is locked, otherwise just drop task
+    :param heartbeat_interval: renew the processor lock in background with this interval
+        instead of prolonging it on message emit.
+        Cursor writes are fenced by the lock token, so a processor that has lost the lock
+        can't overwrite a cursor saved by a new lock owner.
+    :param wait_timeout: max time in seconds to wait for the cursor lock
+        before the task is retried or dropped
     :param context_kwargs: cursor parameters.
         Use ContextPath to extract values from processor context
     :return: pipe_contextmanager
     :rtype: PipeContextManager
     """
     @singleton_guard(cursor_name, expire_in=guard_expire_in, lock_category='cursor',
-                     retry_if_locked=retry_if_locked, **context_kwargs)
+                     retry_if_locked=retry_if_locked, heartbeat_interval=heartbeat_interval,
+                     wait_timeout=wait_timeout, **context_kwargs)
     @pipe_contextmanager
     def cursor_contextmanager(processor_id, injections, response,
-                              cursor_storage=cursor_storage_context):
+                              cursor_storage=cursor_storage_context, fencing_token=None):
         cursor_key = key(cursor_name or processor_id,
                          **apply_context_to_kwargs(context_kwargs, injections))
         context_name = '{}_cursor'.format(cursor_name) if cursor_name else 'cursor'
@@ -48,7 +56,7 @@ def cursor(cursor_name=None, guard_expire_in=CURSOR_LOCK_EXPIRATION,
 
         def cursor_setter(value):
             # update a cursor value in storage
-            cursor_storage.save(cursor_key, value)
+            cursor_storage.save(cursor_key, value, fencing_token=fencing_token)
 
         # add cursor property into response
         response.set_property(context_name, cursor_getter, cursor_setter)
@@ -1,3 +1,6 @@
+import logging
+from threading import Event, Thread
+
 from pypipes.context import apply_context_to_kwargs
 from pypipes.context.manager import pipe_contextmanager
 from pypipes.exceptions import RetryMessageException, DropMessageException, RetryException
@@ -6,6 +9,8 @@ from pypipes.service import key
 DEFAULT_LOCK_EXPIRATION = 3600  # 1 hour
 DEFAULT_GUARD_EXPIRATION = 60  # 1 minute
 
+logger = logging.getLogger(__name__)
+
 
 class Locker(object):
     def __init__(self, lock_service, lock_key, expire_in=None):
@@ -18,6 +23,7 @@ class Locker(object):
         self.lock_service = lock_service
         self.lock_key = lock_key
         self.expire_in = expire_in
+        self.token = None  # fencing token of acquired lock
 
     def set(self, expire_in=None):
         return self.lock_service.set(self.lock_key, expire_in or self.expire_in)
@@ -25,12 +31,44 @@ class Locker(object):
     def prolong(self):
         return self.set()
 
-    def acquire(self):
+    def acquire(self, wait_timeout=None):
+        """
+        Acquire the lock
+        :param wait_timeout: max time in seconds to wait for the lock release.
+            Waiters acquire the lock in FIFO order.
+        :return: True if lock is acquired
+        """
+        if wait_timeout:
+            return self.lock_service.acquire_wait(self.lock_key, self.expire_in, wait_timeout)
         return self.lock_service.acquire(self.lock_key, self.expire_in)
 
+    def wait(self, timeout):
+        return self.lock_service.wait(self.lock_key, timeout)
+
     def release(self):
+        if self.token is not None:
+            token, self.token = self.token, None
+            return self.lock_service.release_token(self.lock_key, token)
         return self.lock_service.release(self.lock_key)
 
+    def acquire_token(self, wait_timeout=None):
+        """
+        Acquire the lock with a fencing token
+        :param wait_timeout: max time in seconds to wait for the lock release
+        :return: fencing token or None if the lock is already acquired
+        """
+        self.token = self.lock_service.acquire_token(self.lock_key, self.expire_in)
+        if self.token is None and wait_timeout and self.wait(wait_timeout):
+            self.token = self.lock_service.acquire_token(self.lock_key, self.expire_in)
+        return self.token
+
+    def renew(self):
+        """
+        Prolong the lock acquired by acquire_token
+        :return: True if lock is prolonged, False if lock is lost
+        """
+        return self.lock_service.renew(self.lock_key, self.token, self.expire_in)
+
     def get(self):
         return self.lock_service.get(self.lock_key)
 
@@ -46,6 +84,44 @@ class Locker(object):
         return min(default, expire_in)
 
 
+class LockHeartbeat(object):
+    """
+    Renews a lock lease in background while a processor holds the lock.
+    Renewal runs in a daemon thread, that is a greenlet if gevent has patched the threading.
+    """
+    def __init__(self, locker, interval):
+        """
+        :type locker: Locker
+        :param interval: renewal interval in seconds. Must be less than lock expiration time.
+        """
+        assert locker.expire_in and interval < locker.expire_in
+        self.locker = locker
+        self.interval = interval
+        self.lost = False
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                if not self.locker.renew():
+                    self.lost = True
+                    logger.warning('Lock %s is lost by fencing token %s',
+                                   self.locker.lock_key, self.locker.token)
+                    return
+            except Exception:
+                # try again on next heartbeat, the lease is still valid for a while
+                logger.exception('Failed to renew lock %s', self.locker.lock_key)
+
+
 def locker(lock_name=None, expire_in=DEFAULT_LOCK_EXPIRATION, lock_category='default',
            **context_kwargs):
     """
@@ -72,7 +148,8 @@ def locker(lock_name=None, expire_in=DEFAULT_LOCK_EXPIRATION, lock_category='def
 
 
 def singleton_guard(guard_name=None, expire_in=DEFAULT_GUARD_EXPIRATION, lock_category='guard',
-                    retry_if_locked=False, **context_kwargs):
+                    retry_if_locked=False, heartbeat_interval=None, wait_timeout=None,
+                    **context_kwargs):
     """
     Protects some resource from be used by several processors simultaneously.
     :param guard_name: guard name
@@ -82,6 +159,13 @@ def singleton_guard(guard_name=None, expire_in=DEFAULT_GUARD_EXPIRATION, lock_ca
     :param lock_category: name of lock service
     :param retry_if_locked: if True the guard will retry each message if guard is currently locked
         otherwise message will be dropped.
+    :param heartbeat_interval: if set, the guard acquires a lock with a fencing token
+        and renews it in background with this interval instead of prolonging on message emit.
+        The token is available for the processor as `fencing_token` context.
+        If the lock is lost, emitted messages are filtered out
+        and the message is dropped when the processor completes.
+    :param wait_timeout: if set, the guard waits up to this time in seconds for the lock release
+        before message retry or drop, so a brief contention is resolved without a broker.
     :rtype: pypipes.context.manager.PipeContextManager
     """
 
@@ -93,12 +177,36 @@ def singleton_guard(guard_name=None, expire_in=DEFAULT_GUARD_EXPIRATION, lock_ca
         :type locker: Locker
         :type response: pypipes.infrastructure.response.IResponseHandler
         """
-        if not locker.acquire():
+        acquired = (locker.acquire_token(wait_timeout) if heartbeat_interval
+                    else locker.acquire(wait_timeout))
+        if not acquired:
             if retry_if_locked:
                 raise RetryMessageException(retry_in=locker.min_expiration(15))
             else:
                 raise DropMessageException('locked by singleton_guard')
 
+        if heartbeat_interval:
+            heartbeat = LockHeartbeat(locker, heartbeat_interval)
+
+            def _check_lock(msg):
+                # a processor that has lost the lock must not emit messages anymore
+                if heartbeat.lost:
+                    logger.warning('Message is dropped, lock %s is lost', locker.lock_key)
+                    return None
+                return msg
+
+            heartbeat.start()
+            response.add_message_filter(_check_lock)
+            try:
+                yield {'fencing_token': locker.token}
+            finally:
+                heartbeat.stop()
+                response.remove_message_filter(_check_lock)
+                locker.release()
+            if heartbeat.lost:
+                raise DropMessageException('lock is lost by singleton_guard')
+            return
+
         _filter = None
         if expire_in:
             # add a filter that automatically prolong the guard lock when a new message is emitted
@@ -118,7 +226,7 @@ def singleton_guard(guard_name=None, expire_in=DEFAULT_GUARD_EXPIRATION, lock_ca
 
 
 def suspended_guard(guard_name=None, expire_in=None, lock_category='guard',
-                    retry_if_locked=False, **context_kwargs):
+                    retry_if_locked=False, wait_timeout=None, **context_kwargs):
     """
     Suspend processing of some messages while guard lock is not expired
     :param guard_name: guard name
@@ -128,6 +236,8 @@ def suspended_guard(guard_name=None, expire_in=None, lock_category='guard',
     :param lock_category: name of lock service
     :param retry_if_locked: if True the guard will retry messages if guard is currently locked
         otherwise message will be dropped.
+    :param wait_timeout: if the guard lock expires in this time (seconds),
+        wait for it in-process instead of message retry or drop.
     :rtype: pypipes.context.manager.PipeContextManager
     """
 
@@ -139,6 +249,10 @@ def suspended_guard(guard_name=None, expire_in=None, lock_category='guard',
     @pipe_contextmanager
     def guard_contextmanager(locker):
         lock_time = locker.get()
+        if (lock_time and wait_timeout and lock_time is not True and
+                lock_time <= wait_timeout and locker.wait(wait_timeout)):
+            # processing is resumed soon, don't send the message back through a broker
+            lock_time = False
         if lock_time:
             # message processing is suspended
             if retry_if_locked:
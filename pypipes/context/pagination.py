@@ -1,4 +1,5 @@
 from pypipes.context.manager import PipeContextManager
+from pypipes.message import message_without
 
 PAGE_KEY = '_page'
 
@@ -6,12 +7,18 @@ PAGE_KEY = '_page'
 def pagination_contextmanager(message, response):
     """
     Manage processor restarting on next page exists
+    Each page is processed by a separate message processing.
+    Use pypipes.service.paginator.Paginator to stream all pages in one processing.
     :type message: pypipes.message.FrozenMessage
     :param response: pypipes.infrastructure.response.IResponseHandler
     """
     response.page = None
 
-    yield {'page': message.pop(PAGE_KEY)} if PAGE_KEY in message else {}
+    if PAGE_KEY in message:
+        # hide the page key from the processor
+        yield {'page': message[PAGE_KEY], 'message': message_without(message, PAGE_KEY)}
+    else:
+        yield {}
 
     if response.page is not None:
         # restart original message with _page parameter
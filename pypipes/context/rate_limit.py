@@ -6,20 +6,21 @@ from pypipes.service import key
 
 
 def quota_guard(quota_name=None, suspend=True,
-                operation_name=None, **context_kwargs):
+                operation_name=None, wait_timeout=None, **context_kwargs):
     """
     Consume from quota on each message processing begin
     :param quota_name: name of quota
     :param operation_name: name of operation if you have a separate quota per operation
     :param context_kwargs: addition quota sub-key parameters
     :param suspend: suspend processing if quota is exceeded, otherwise drop messages
+    :param wait_timeout: wait in-process for a quota renewal that happens in this time (seconds)
     :return: pipe_contextmanager
     :rtype: pipe_contextmanager
     """
     lock_name = key(quota_name, operation_name) if operation_name else quota_name
 
     @suspended_guard(lock_name, lock_category='quota_guard', retry_if_locked=suspend,
-                     **context_kwargs)
+                     wait_timeout=wait_timeout, **context_kwargs)
     @pipe_contextmanager
     def quota_guard_contextmanager(injections, quota=None):
         """
@@ -40,17 +41,19 @@ def quota_guard(quota_name=None, suspend=True,
     return quota_guard_contextmanager
 
 
-def rate_limit_guard(rate_limit, rate_threshold=10, suspend=True, **context_kwargs):
+def rate_limit_guard(rate_limit, rate_threshold=10, suspend=True, wait_timeout=None,
+                     **context_kwargs):
     """
     Create a contextmanager that control a processor execution rate
     :param rate_limit: rate limit
     :param rate_threshold: rate threshold
     :param retry_if_locked: retry message execution if processor rate is exceeded
+    :param wait_timeout: wait in-process if processor is suspended for less than this time (seconds)
     :param context_kwargs: separate processor rate counter per input context
     :rtype: pipe_contextmanager
     """
     @suspended_guard(None, lock_category='rate_limit', retry_if_locked=suspend,
-                     processor=context.processor_id, **context_kwargs)
+                     wait_timeout=wait_timeout, processor=context.processor_id, **context_kwargs)
     @pipe_contextmanager
     def rate_contextmanager(processor_id, rate_counter, injections):
         """
@@ -61,8 +64,10 @@ def rate_limit_guard(rate_limit, rate_threshold=10, suspend=True, **context_kwar
         """
         counter_key = key(processor_id,
                           **apply_context_to_kwargs(context_kwargs, injections))
-        value, expires_in = rate_counter.rate_limit.increment(counter_key,
-                                                              threshold=rate_threshold)
+        counter = rate_counter.rate_limit
+        # only counters that respect a limit accept it, custom counters may not support it
+        limit = {'limit': rate_limit} if getattr(counter, 'respects_limit', False) else {}
+        value, expires_in = counter.increment(counter_key, threshold=rate_threshold, **limit)
         if value > rate_limit:
             raise RateLimitExceededException(retry_in=expires_in)
         yield {}
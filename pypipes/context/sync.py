@@ -1,10 +1,13 @@
 import logging
 import uuid
 
+import six
+
 from pypipes.context.manager import PipeContextManager
-from pypipes.message import FrozenMessage
+from pypipes.message import FrozenMessage, message_without
 from pypipes.processor import pipe_processor
 from pypipes.processor.event import Event
+from pypipes.service import key
 
 logger = logging.getLogger(__name__)
 
@@ -12,11 +15,30 @@ EVENT_JOB_DONE = 'job_done_{}'
 
 WAIT_ALL_MESSAGE = '_wait_all_message'
 WAIT_ALL_COUNTER = '_wait_all_counter'
+GATHER_COMPLETE = 'gather_complete'
+
+DEFAULT_GROUP_SIZE = 1000
 
 
 class Sync(object):
-    def __init__(self, pipeline):
+    def __init__(self, pipeline, group_size=DEFAULT_GROUP_SIZE):
+        """
+        :param pipeline: synchronised pipeline
+        :param group_size: max count of jobs counted by one barrier counter.
+            Jobs emitted by a processor are split into groups of this size
+            so no counter becomes a hot spot of a huge fan-out.
+        """
         self.pipeline = pipeline
+        self.group_size = group_size
+
+    def _sync(self, sync_processor):
+        job_done_event = EVENT_JOB_DONE.format(uuid.uuid4().hex[-8:])
+        context = count_job_context(job_done_event, self.group_size)
+        # each processor should count every new emitted message as a new job
+        # so we add a contextmanager that will do it for us
+        locked_pipeline = context(self.pipeline)
+        # append a processor that will count completed tasks
+        return locked_pipeline >> (Event.on(job_done_event) >> sync_processor)
 
     @property
     def wait_all(self):
@@ -32,29 +54,138 @@ class Sync(object):
         Thus it's better to design sync_last processor to not emit anything
         to avoid additional message traffic
         """
-        job_done_event = EVENT_JOB_DONE.format(uuid.uuid4().hex[-8:])
-        context = count_job_context(job_done_event)
-        # each processor should increments sync lock counter when emit a new message
-        # so we add a contextmanager that will do it for us
-        locked_pipeline = context(self.pipeline)
-        # append a processor that will count completed tasks
-        return locked_pipeline >> (Event.on(job_done_event) >> wait_all)
+        return self._sync(wait_all)
+
+    @property
+    def gather(self):
+        """
+        Stream results of synchronised jobs and notify when all jobs are completed.
+        This sync helper requires counter.wait_all injection of CounterClient type
 
+        Usage:
+        start_processor >> Sync(sync_first >> ...  >> sync_last).gather >> next_processor
 
-def count_job_context(job_done_event):
+        next_processor receives every message emitted by sync_last processor
+        as soon as it is emitted, and then the message received by sync_first
+        with `gather_complete` flag when all jobs are completed.
+        """
+        return self._sync(gather)
+
+
+class Barrier(object):
+    """
+    A node of hierarchical barrier that synchronises jobs of a pipeline.
+
+    Each job has its own counter that counts the job itself and its open job groups.
+    Jobs emitted by the job are split into groups of `group_size`,
+    a group counter counts unfinished jobs of the group.
+    When a counter drops to zero its parent counter is decremented,
+    so completion is propagated from leaf jobs to the root job
+    and every counter is touched by at most `group_size` jobs.
+
+    Group counters reserve `group_size` credits when group is opened
+    and return unused credits when group is closed,
+    so a counter never drops below the count of unfinished jobs
+    and emitted jobs are counted with one round trip per group.
+    """
+    def __init__(self, counter, path=None, group_size=DEFAULT_GROUP_SIZE):
+        """
+        :type counter: pypipes.service.counter.ICounter
+        :param path: counters of parent barriers from the root job to the group of current job
+        :type path: list[str]
+        :param group_size: max count of jobs in a group
+        """
+        self.counter = counter
+        self.path = list(path or [])
+        self.group_size = group_size
+        self.job_id = uuid.uuid4().hex
+        self._job_counted = False  # job counter exists in the shared counter
+        self._job_pending = 0  # job counter increment that is not applied yet
+        self._groups = 0
+        self._group = None
+        self._group_credits = 0
+
+    @property
+    def root_id(self):
+        return self.path[0] if self.path else self.job_id
+
+    def count_job(self):
+        """
+        Count a new emitted job
+        :return: barrier path of the new job
+        :rtype: list[str]
+        """
+        if not self._group_credits:
+            self._close_group()
+            self._groups += 1
+            self._group = key(self.job_id, self._groups)
+            # job counter counts the job itself and a new open group
+            job_increment = self._job_pending + (1 if self._job_counted else 2)
+            self.counter.increment_many({self.job_id: job_increment,
+                                         self._group: self.group_size})
+            self._job_counted = True
+            self._job_pending = 0
+            self._group_credits = self.group_size
+        self._group_credits -= 1
+        return self.path + [self.job_id, self._group]
+
+    def _close_group(self):
+        if self._group and self._group_credits:
+            # return unused credits
+            if self.counter.increment(self._group, -self._group_credits) <= 0:
+                # all jobs of the group are already done
+                self.counter.delete(self._group)
+                self._job_pending -= 1
+        self._group_credits = 0
+
+    def complete(self):
+        """
+        Count current job as done
+        :return: True if all jobs of the root barrier are done
+        """
+        self._close_group()
+        if self._job_counted:
+            if self.counter.increment(self.job_id, self._job_pending - 1) > 0:
+                # some emitted jobs are not done yet
+                return False
+            self.counter.delete(self.job_id)
+        return complete_path(self.counter, self.path)
+
+
+def complete_path(counter, path):
+    """
+    Propagate a job completion to parent barriers
+    :type counter: pypipes.service.counter.ICounter
+    :param path: counters of parent barriers from the root job to the group of completed job
+    :return: True if all jobs of the root barrier are done
+    """
+    for counter_name in reversed(path):
+        if counter.increment(counter_name, -1) > 0:
+            return False
+        counter.delete(counter_name)
+    return True
+
+
+def _get_path(message):
+    path = message.get(WAIT_ALL_COUNTER)
+    if isinstance(path, six.string_types):
+        # message of the single counter barrier
+        path = [path]
+    return path
+
+
+def count_job_context(job_done_event, group_size=DEFAULT_GROUP_SIZE):
     def _context(message, response, counter):
-        # get counter name from input message
-        counter_name = message.pop(WAIT_ALL_COUNTER, None)
-        sync_message = dict(message.pop(WAIT_ALL_MESSAGE, message))
+        # get barrier path from input message
+        path = _get_path(message)
+        job_message = message_without(message, WAIT_ALL_COUNTER, WAIT_ALL_MESSAGE)
+        sync_message = dict(message.get(WAIT_ALL_MESSAGE, job_message))
 
-        if not counter_name:
-            # start a new job counter is it's a first processor in synchronised pipeline
-            counter_name = uuid.uuid4().hex
-            counter.wait_all.increment(counter_name, 1)
+        # start a new root barrier if it's a first processor in synchronised pipeline
+        barrier = Barrier(counter.wait_all, path, group_size=group_size)
 
         def _filter(msg):
-            counter.wait_all.increment(counter_name, 1)
-            msg[WAIT_ALL_COUNTER] = counter_name
+            msg[WAIT_ALL_COUNTER] = barrier.count_job()
             msg[WAIT_ALL_MESSAGE] = sync_message
             return msg
 
@@ -62,36 +193,51 @@ def count_job_context(job_done_event):
             # flush all new messages
             original_flush()
             # count rest of job
-            if counter.wait_all.increment(counter_name, -1) <= 0:
+            if barrier.complete():
                 # notify wait_all processor that last job is done
                 response.send_event(job_done_event,
-                                    apply_filters=True)
+                                    message={WAIT_ALL_COUNTER: [barrier.root_id],
+                                             WAIT_ALL_MESSAGE: sync_message})
 
         response.add_message_filter(_filter)
         response.extend_flush(_count_jobs_on_flush)
 
-        yield {'wait_all_counter': counter_name,
+        yield {'message': job_message,
+               'wait_all_counter': barrier.root_id,
                'wait_all_message': FrozenMessage(sync_message)}
 
     return PipeContextManager(_context)
 
 
-@pipe_processor
-def wait_all(message, response, counter, event):
-    counter_name = message[WAIT_ALL_COUNTER]
+def _complete_job(message, counter, event):
+    """
+    Complete a job emitted by last processor of synchronised pipeline
+    :return: True if all synchronised jobs are done
+    """
     if event:
-        # counter was already decremented in processor
-        # just double check that there is no new task
-        value = counter.wait_all.increment(counter_name, -1)
-    else:
-        value = counter.wait_all.increment(counter_name, -1)
+        # all jobs are done, the event is sent by last completed job
+        return True
+    return complete_path(counter.wait_all, _get_path(message))
+
 
-    if value <= 0:
+@pipe_processor
+def wait_all(message, response, counter, event):
+    if _complete_job(message, counter, event):
         logger.debug('All jobs are complete, go ahead.')
         # all synchronised processors have finished there jobs
         # emit a message to activate next processor
         response.emit_message(message[WAIT_ALL_MESSAGE])
-        # delete sync lock counter
-        counter.wait_all.delete(counter_name)
     else:
-        logger.debug('One more job is complete, %s jobs left', value)
+        logger.debug('One more job is complete')
+
+
+@pipe_processor
+def gather(message, response, counter, event):
+    if not event:
+        # stream a result of synchronised pipeline to next processor
+        response.emit_message({k: v for k, v in message.items()
+                               if k not in (WAIT_ALL_COUNTER, WAIT_ALL_MESSAGE)})
+
+    if _complete_job(message, counter, event):
+        logger.debug('All jobs are complete, go ahead.')
+        response.emit_message(message[WAIT_ALL_MESSAGE], **{GATHER_COMPLETE: True})
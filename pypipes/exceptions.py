@@ -29,6 +29,14 @@ class RateLimitExceededException(RetryMessageException):
     pass
 
 
+class CircuitOpenException(RetryMessageException):
+    pass
+
+
+class StaleFencingTokenException(Exception):
+    pass
+
+
 class ExtendedException(Exception):
     def __init__(self, *args, **kwargs):
         self.extra = kwargs.pop('extra', {})
@@ -1,19 +1,29 @@
 import logging
+import time
 
 from pypipes.context import ContextPath, apply_context_to_kwargs, LazyContextCollection
 from pypipes.events import EVENT_START, EVENT_STOP
 from pypipes.exceptions import RetryMessageException, DropMessageException, ExtendedException
 from pypipes.infrastructure.response.listener import ListenerResponseHandler
-from pypipes.message import FrozenMessage
+from pypipes.message import freeze_message
 
 logger = logging.getLogger(__name__)
 
 
 class Infrastructure(object):
 
+    # max count of pending messages of a processor.
+    # A processor that emits a message stream is paused while the next processor backlog
+    # exceeds this value. None disables the stream backpressure.
+    max_backlog = None
+    backlog_check_interval = 1  # seconds
+    # max time to pause a stream, so streams never wait for each other forever
+    max_throttle_time = 60  # seconds
+
     def __init__(self, context=None):
         self._context = context or {}
         self._programs = {}
+        self._backlog_checks = {}  # processor queue => time of next backlog check
 
     @property
     def context(self):
@@ -126,7 +136,7 @@ class Infrastructure(object):
 
     def get_message_context(self, program, processor_id, message_dict):
         context = self.get_processor_context(program, processor_id)
-        context['message'] = FrozenMessage(message_dict)
+        context['message'] = freeze_message(message_dict)
         if program.message_mapping:
             # Extract mapped message parts from message dictionary
             # and update context
@@ -158,6 +168,42 @@ class Infrastructure(object):
         """
         raise NotImplementedError()
 
+    def get_backlog(self, program, processor_id):
+        """
+        Count messages that are waiting for processing by the processor
+        :param program: Program object
+        :param processor_id: processor id
+        :return: message count or None if infrastructure can't count it
+        """
+        return None
+
+    def throttle(self, program, processor_id):
+        """
+        Block while the processor backlog exceeds max_backlog, but no longer than max_throttle_time.
+        The backlog is checked once per backlog_check_interval.
+        :param program: Program object
+        :param processor_id: processor id
+        """
+        if not self.max_backlog:
+            return
+        check_key = (program.id, processor_id)
+        if time.time() < self._backlog_checks.get(check_key, 0):
+            return
+        deadline = time.time() + self.max_throttle_time
+        backlog = self.get_backlog(program, processor_id)
+        while backlog is not None and backlog >= self.max_backlog:
+            if time.time() >= deadline:
+                logger.warning('Processor %s backlog is still %s, stop throttling',
+                               processor_id, backlog)
+                break
+            logger.debug('Processor %s backlog is %s, wait for consumers', processor_id, backlog)
+            self.sleep(self.backlog_check_interval)
+            backlog = self.get_backlog(program, processor_id)
+        self._backlog_checks[check_key] = time.time() + self.backlog_check_interval
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
     def send_message(self, program, processor_id, message, start_in=None, priority=None):
         """
         Send direct message to one processor
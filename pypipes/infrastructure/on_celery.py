@@ -4,17 +4,18 @@ from datetime import datetime, timedelta
 from functools import wraps
 from uuid import uuid4
 
-from celery import Celery as CeleryApp
-from celery.exceptions import MaxRetriesExceededError, TaskPredicate
-from kombu import Exchange, Queue
-from kombu.serialization import dumps
-from pypipes.config import Config
+from pypipes.config import freeze_config
 from pypipes.infrastructure.base import ListenerInfrastructure, ISchedulerCommands
+from pypipes.message import enable_message_envelopes
 from pypipes.service import key
 
 logger = logging.getLogger(__name__)
 
 
+# celery and kombu are imported on first use of the infrastructure,
+# so a program module or a command that doesn't start a worker is imported fast
+
+
 def ready_for_celery_bind(func):
     """
     Only not bounded function could be a body of a celery task.
@@ -31,11 +32,14 @@ def ready_for_celery_bind(func):
 class BaseCeleryInf(ListenerInfrastructure):
 
     _app = None
+    _config = None
+    _config_source = None
     started_program_key = 'started_program:{infrastructure}:{program}'
 
     def __init__(self, context=None, app=None):
         super(BaseCeleryInf, self).__init__(context)
         if app:
+            from celery import Celery as CeleryApp
             assert isinstance(app, CeleryApp)
             self._app = app
 
@@ -46,6 +50,9 @@ class BaseCeleryInf(ListenerInfrastructure):
         return self._app
 
     def init_application(self):
+        from celery import Celery as CeleryApp
+        from kombu import Exchange
+
         config = self.config
         app = CeleryApp(**config.celery.app)
 
@@ -62,6 +69,8 @@ class BaseCeleryInf(ListenerInfrastructure):
                         CELERY_DEFAULT_EXCHANGE=Exchange('default', type='direct'),
                         CELERY_ACKS_LATE=True)
         app.conf.update(**config.celery.config)
+        # enable it only after all workers are upgraded to a version that reads envelopes
+        enable_message_envelopes(config.celery.get('message_envelope', False))
         max_retries = config.celery.get('max_error_retries', 3)
         error_retry_delay = config.celery.get('error_retry_delay', 3 * 60)
         app.task(name='pipe_process_message', bind=True,
@@ -100,6 +109,7 @@ class BaseCeleryInf(ListenerInfrastructure):
         except Exception as exc:
             # retry message processing on any unhandled error
             exc_traceback = traceback.format_exc()
+            from celery.exceptions import MaxRetriesExceededError
             try:
                 task.retry()
             except MaxRetriesExceededError:
@@ -115,6 +125,8 @@ class BaseCeleryInf(ListenerInfrastructure):
         """
         Create celery queues.
         """
+        from kombu import Exchange, Queue
+
         app = self.app
         exchange = Exchange('default', type='direct')
         # append new queues into queue list
@@ -125,11 +137,16 @@ class BaseCeleryInf(ListenerInfrastructure):
     @property
     def config(self):
         """
-        Return configuration
+        Return configuration snapshot.
+        Config is read on every message send, so it's compiled once per config object.
         :return: configuration
-        :rtype: pypipes.config.Config
+        :rtype: pypipes.config.FrozenConfig
         """
-        return self.context.get('config') or Config()  # use an empty config by default
+        config = self.context.get('config')
+        if config is not self._config_source or self._config is None:
+            self._config_source = config
+            self._config = freeze_config(config or {})  # use an empty config by default
+        return self._config
 
     @property
     def program_lock(self):
@@ -165,6 +182,16 @@ class BaseCeleryInf(ListenerInfrastructure):
                                processor_id=processor_id,  # includes pipeline name
                                **kwargs)
 
+    @property
+    def max_backlog(self):
+        return self.config.celery.get('max_backlog')
+
+    def get_backlog(self, program, processor_id):
+        # passive declaration returns a queue state without queue creation
+        with self.app.connection_or_acquire() as connection:
+            return connection.default_channel.queue_declare(
+                queue=self._queue_name(program, processor_id), passive=True).message_count
+
     def send_message(self, program, processor_id, message, start_in=None, priority=None,
                      queue=None):
         # each processor has a separate task queue
@@ -250,6 +277,8 @@ class CelerySchedulerMixIn(ISchedulerCommands):
         :param repeat_period: repeat period of the scheduler
         :param start_time: time when the task have to be started
         """
+        from celery.exceptions import MaxRetriesExceededError, TaskPredicate
+
         countdown = 0
         try:
             logger.debug('Start scheduler_task for: %s',
@@ -388,6 +417,8 @@ class SaveErrorMixIn(object):
         """
         :type self: CeleryErrorHandlerMixIn, BaseCeleryInf
         """
+        from kombu.serialization import dumps
+
         queue_name = self._error_queue_name(program, processor_id, exception)
         try:
             # check if the error may be properly serialized
@@ -396,8 +427,7 @@ class SaveErrorMixIn(object):
             # the error instance can't be serialized as is, thus we save the error name instead
             exception = '{}({})'.format(exception.__class__.__name__, exception)
         # include the error into message body. This may be helpful in error processing later
-        message['_exception'] = exception
-        message['_exc_traceback'] = exc_traceback
+        message = dict(message, _exception=exception, _exc_traceback=exc_traceback)
         self.send_message(program, processor_id, message, queue=queue_name)
         logger.warning('Failed job was moved into a standby queue: %r', queue_name)
 
@@ -23,6 +23,11 @@ class QueueItem(object):
 
 class GeventInf(ListenerInfrastructure):
 
+    # all processors share the same message queue,
+    # throttled streams hold pool workers, so the stream backpressure is disabled by default
+    max_backlog = None
+    backlog_check_interval = 0.1
+
     def __init__(self, context=None):
         super(GeventInf, self).__init__(context)
         self.message_queue = gevent.queue.Queue()
@@ -81,6 +86,15 @@ class GeventInf(ListenerInfrastructure):
             signal.signal(signal.SIGTERM, orig_term)
             signal.signal(signal.SIGINT, orig_int)
 
+    def get_backlog(self, program, processor_id):
+        if self.pool.full():
+            # the queue is not consumed while all workers are busy, maybe with throttled streams
+            return None
+        return self.message_queue.qsize()
+
+    def sleep(self, seconds):
+        gevent.sleep(seconds)
+
     def send_message(self, program, processor_id, message, start_in=None, priority=None):
         # current version ignores priority
         # but it could be implemented with gevent.queue.PriorityQueue
@@ -1,5 +1,6 @@
 
 class IResponseHandler(object):
+    __slots__ = ()
 
     @property
     def message(self):
@@ -54,6 +55,15 @@ class IResponseHandler(object):
         """
         raise NotImplementedError()
 
+    def throttle(self):
+        """
+        Block while the next processor has too many pending messages.
+        A processor that emits a long stream of messages calls it between messages,
+        so the stream is paced by message consumers.
+        Response handlers that can't count pending messages don't block.
+        """
+        pass
+
     def emit_message(self, _message=None, _start_in=None, _priority=None, **kwargs):
         """
         Emit a message for next processor in pipeline
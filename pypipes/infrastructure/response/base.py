@@ -4,22 +4,52 @@ from pypipes.infrastructure.response import IResponseHandler
 from pypipes.message import Message, MessageUpdate
 
 
+class ResponseProperty(object):
+    """
+    Response handler attribute that is managed by getter and setter functions
+    registered with set_property
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance._properties[self.name][0]()
+
+    def __set__(self, instance, value):
+        instance._properties[self.name][1](value)
+
+
 class BaseResponseHandler(IResponseHandler):
-    __properties = None
+    # __dict__ is kept for custom attributes that context managers may set on a response
+    __slots__ = ('_original_message', '_message_filters', '_message', '_retry_message_update',
+                 '_properties', '_flush_extension', '__dict__')
+
+    # response handler classes extended with properties, (class, property name) => class
+    _property_classes = {}
 
     def __init__(self, original_message):
-        self.__properties = {}
-        self.__original_message = original_message
-        self.__message_filters = []
-        self._message = Message()
-        self._retry_message_update = MessageUpdate()
+        self._original_message = original_message
+        self._message_filters = None
+        # message objects are created on first access
+        self._message = None
+        self._retry_message_update = None
+        self._properties = None
+        self._flush_extension = None
 
     @property
     def message(self):
+        if self._message is None:
+            self._message = Message()
         return self._message
 
     @property
     def retry_message(self):
+        if self._retry_message_update is None:
+            self._retry_message_update = MessageUpdate()
         return self._retry_message_update
 
     @retry_message.setter
@@ -37,10 +67,12 @@ class BaseResponseHandler(IResponseHandler):
             return message
         :param filter_func: filter callable
         """
-        self.__message_filters.append(filter_func)
+        if self._message_filters is None:
+            self._message_filters = []
+        self._message_filters.append(filter_func)
 
     def remove_message_filter(self, filter_func):
-        self.__message_filters.remove(filter_func)
+        self._message_filters.remove(filter_func)
 
     def _filter_message(self, message):
         """
@@ -49,42 +81,52 @@ class BaseResponseHandler(IResponseHandler):
         :param message: message to filter
         :return: updated message or None if this message should be blocked
         """
-        for message_filter in reversed(self.__message_filters):
-            message = message_filter(message)
-            if message is None:
-                # message has been filtered out
-                break
+        if self._message_filters:
+            for message_filter in reversed(self._message_filters):
+                message = message_filter(message)
+                if message is None:
+                    # message has been filtered out
+                    break
         return message
 
     def flush(self):
+        if self._flush_extension:
+            self._flush_extension()
+        else:
+            self._flush()
+
+    def _flush(self):
         """
         Emit self.message and restart message if any
         """
-        if self.message:
-            self.emit_message(self.message)
-        if self.retry_message is True:
+        message, retry_message = self._message, self._retry_message_update
+        self._message = self._retry_message_update = None
+
+        if message:
+            self.emit_message(message)
+        if retry_message is True:
             # retry input message as is
-            self.emit_retry_message(self.__original_message)
-        elif self.retry_message:
+            self.emit_retry_message(self._original_message)
+        elif retry_message:
             # retry input message with some updates
-            self.emit_retry_message(self.retry_message.merge_with_message(self.__original_message))
-
-        self._message = Message()
-        self._retry_message_update = MessageUpdate()
+            self.emit_retry_message(retry_message.merge_with_message(self._original_message))
 
     def extend_flush(self, flush_extension):
         # override response flush
-        self.flush = partial(flush_extension, self.flush)
+        self._flush_extension = partial(flush_extension, self._flush_extension or self._flush)
 
     def set_property(self, name, getter=None, setter=None):
-        self.__properties[name] = getter, setter
-
-    def __getattr__(self, item):
-        if self.__properties and item in self.__properties:
-            return self.__properties[item][0]()
-        raise AttributeError(item)
-
-    def __setattr__(self, item, value):
-        if self.__properties and item in self.__properties:
-            return self.__properties[item][1](value)
-        super(BaseResponseHandler, self).__setattr__(item, value)
+        if self._properties is None:
+            self._properties = {}
+        self._properties[name] = getter, setter
+
+        cls = type(self)
+        if not isinstance(getattr(cls, name, None), ResponseProperty):
+            # extend the handler class with the property descriptor,
+            # so regular attribute access is not intercepted
+            property_cls = self._property_classes.get((cls, name))
+            if property_cls is None:
+                property_cls = type(cls.__name__, (cls,),
+                                    {'__slots__': (), name: ResponseProperty(name)})
+                self._property_classes[(cls, name)] = property_cls
+            self.__class__ = property_cls
@@ -1,41 +1,45 @@
 from pypipes.infrastructure.response.base import BaseResponseHandler
+from pypipes.message import copy_message, freeze_message
 
 
 class ListenerResponseHandler(BaseResponseHandler):
+    __slots__ = ('_infrastructure', '_program', '_processor_id', '_next_processor_id')
 
     def __init__(self, infrastructure, program, processor_id, original_message):
         super(ListenerResponseHandler, self).__init__(original_message)
-        self.__infrastructure = infrastructure
-        self.__program = program
-        self.__processor_id = processor_id
-        self.__next_processor_id = program.get_next_processor(processor_id)
+        self._infrastructure = infrastructure
+        self._program = program
+        self._processor_id = processor_id
+        self._next_processor_id = program.get_next_processor(processor_id)
 
     def emit_message(self, _message=None, _start_in=None, _priority=None, **kwargs):
-        message_dict = dict(_message, **kwargs) if _message else dict(kwargs)
-        self.send_message(self.__next_processor_id,
-                          start_in=_start_in, priority=_priority,
-                          message=message_dict)
+        message_dict = copy_message(_message, **kwargs)
+        self._send_message(self._next_processor_id, message_dict,
+                           start_in=_start_in, priority=_priority)
+
+    def throttle(self):
+        if self._next_processor_id:
+            self._infrastructure.throttle(self._program, self._next_processor_id)
 
     def emit_retry_message(self, _message=None, _retry_in=None, _priority=None, **kwargs):
-        message_dict = dict(_message, **kwargs) if _message else dict(kwargs)
-        self.send_message(self.__processor_id,
-                          start_in=_retry_in, priority=_priority,
-                          message=message_dict)
+        message_dict = copy_message(_message, **kwargs)
+        self._send_message(self._processor_id, message_dict,
+                           start_in=_retry_in, priority=_priority)
 
     def schedule_message(self, message, scheduler_id=None, target_id=None,
                          start_time=None, period=None):
         assert start_time or period
-        scheduler_id = scheduler_id or self.__processor_id
-        target_id = target_id or self.__next_processor_id
+        scheduler_id = scheduler_id or self._processor_id
+        target_id = target_id or self._next_processor_id
         if target_id:
             # ignore the scheduler if it's a last processor in a pipeline.
-            self.__infrastructure.add_scheduler(self.__program, scheduler_id, target_id,
+            self._infrastructure.add_scheduler(self._program, scheduler_id, target_id,
                                                 dict(message),
                                                 start_time=start_time, repeat_period=period)
 
     def stop_scheduler(self, scheduler_id=None):
-        scheduler_id = scheduler_id or self.__processor_id
-        self.__infrastructure.remove_scheduler(self.__program, scheduler_id)
+        scheduler_id = scheduler_id or self._processor_id
+        self._infrastructure.remove_scheduler(self._program, scheduler_id)
 
     def send_event(self, event_name, processor=None, message=None, apply_filters=False):
         message = dict(message) if message else {}
@@ -44,13 +48,20 @@ class ListenerResponseHandler(BaseResponseHandler):
             if message is None:
                 # some filter stopped the message processing
                 return
-        self.__infrastructure.send_event(self.__program, event_name, processor=processor,
+        self._infrastructure.send_event(self._program, event_name, processor=processor,
                                          message=message)
 
     def send_message(self, processor_id, message, start_in=None, priority=None):
-        message = self._filter_message(dict(message))
+        self._send_message(processor_id, copy_message(message), start_in=start_in,
+                           priority=priority)
+
+    def _send_message(self, processor_id, message, start_in=None, priority=None):
+        # the message is a private copy of emitted message, so filters may update it
+        # and infrastructure receives it without copying
+        message = self._filter_message(message)
         if message is not None and processor_id:
             # ignore messages if it's a last processor in a pipeline
-            self.__infrastructure.send_message(self.__program, processor_id, message,
+            self._infrastructure.send_message(self._program, processor_id,
+                                               freeze_message(message),
                                                start_in=start_in,
                                                priority=priority)
@@ -40,14 +40,20 @@ class PipelineJoin(object):
 
 
 class Pipeline(list, Cloneable, PipelineJoin):
-
+    """
+    List of processors.
+    Pipelines share their processors, so a processor must be cloned before it's modified.
+    """
     def __repr__(self):
         return 'Pipeline{}'.format(super(Pipeline, self))
 
+    def clone(self):
+        return Pipeline(processor.clone() for processor in self)
+
     def to_pipeline(self):
         return self
 
     def join(self, other):
-        pipeline = self.clone()
-        pipeline.extend(other.clone().to_pipeline())
+        pipeline = Pipeline(self)
+        pipeline.extend(other.to_pipeline())
         return pipeline
@@ -1,5 +1,52 @@
+import hashlib
+import json
+import struct
+
+import six
+
+if six.PY3:
+    import pickle
+else:
+    import cPickle as pickle
+
+try:
+    from collections.abc import ItemsView, Mapping, MutableMapping, ValuesView
+except ImportError:
+    from collections import ItemsView, Mapping, MutableMapping, ValuesView
+
+ENVELOPE_VERSION = 1
+ENVELOPE_HEADER = struct.Struct('!BI')  # version, offset table size
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+# workers of previous versions can't unpickle envelopes, see enable_message_envelopes
+_envelopes_enabled = False
+
+
+def enable_message_envelopes(enabled=True):
+    """
+    Pickle frozen messages as lazily decoded envelopes.
+    Workers of previous versions can't unpickle envelopes,
+    so enable it only when all workers that receive the messages are upgraded.
+    Envelopes are unpickled regardless of this setting.
+    :param enabled: False - pickle frozen messages as plain dicts
+    """
+    global _envelopes_enabled
+    _envelopes_enabled = enabled
+
+
+def message_digest(message):
+    """
+    Build a digest of message content.
+    Message values may be unhashable like lists and dicts.
+    :param message: message dict
+    :rtype: bytes
+    """
+    return hashlib.md5(
+        json.dumps(message, sort_keys=True, default=repr).encode('utf-8')).digest()
+
 
 class Message(dict):
+    __slots__ = ()
 
     def __repr__(self):
         return '{}{}'.format(self.__class__.__name__, super(Message, self).__repr__())
@@ -11,7 +58,8 @@ class Message(dict):
             raise AttributeError(name)
 
     def __setattr__(self, name, value):
-        if hasattr(self, name):
+        if hasattr(type(self), name):
+            # class attribute like __class__ or a slot
             super(Message, self).__setattr__(name, value)
         else:
             self[name] = value
@@ -21,6 +69,15 @@ class Message(dict):
 
 
 class FrozenMessage(Message):
+    __slots__ = ()
+
+    def __reduce__(self):
+        if _envelopes_enabled:
+            # frozen message is serialized as an envelope that is decoded lazily
+            return unpack_message, (pack_message(self),)
+        # default dict subclass unpickling sets items one by one
+        return FrozenMessage, (dict(self),)
+
     def __setattr__(self, name, value):
         # message should be used as frozen dict
         # this error is just a reminder
@@ -38,23 +95,183 @@ class FrozenMessage(Message):
     def __delattr__(self, name):
         raise AttributeError()
 
+    def pop(self, *args):
+        raise AttributeError()
+
+    def popitem(self):
+        raise AttributeError()
+
+    def setdefault(self, *args):
+        raise AttributeError()
+
+    def clear(self):
+        raise AttributeError()
+
+
+class EncodedValue(object):
+    """
+    Message value that is not decoded yet
+    """
+    __slots__ = ('data', 'offset', 'length')
+
+    def __init__(self, data, offset, length):
+        self.data = data
+        self.offset = offset
+        self.length = length
+
+    @property
+    def raw(self):
+        return self.data[self.offset:self.offset + self.length]
+
+    def decode(self):
+        return pickle.loads(self.raw)
+
+
+class LazyMessage(Message):
+    """
+    Message unpacked from an envelope.
+    Each message value is decoded on first access,
+    and values that were never accessed are packed into next envelope without decoding.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, EncodedValue):
+            value = value.decode()
+            dict.__setitem__(self, key, value)
+        return value
+
+    def __iter__(self):
+        # dict(message) copies the dict storage directly unless __iter__ is overridden
+        return dict.__iter__(self)
+
+    def __repr__(self):
+        return '{}{}'.format(self.__class__.__name__, dict(self))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        return ItemsView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def copy(self):
+        return LazyMessage(dict.items(self))
+
+    __eq__ = Mapping.__eq__
+    __ne__ = Mapping.__ne__
+    __hash__ = None
+    pop = MutableMapping.pop
+    popitem = MutableMapping.popitem
+    setdefault = MutableMapping.setdefault
+
+
+class FrozenLazyMessage(FrozenMessage, LazyMessage):
+    __slots__ = ()
+
+
+def pack_message(message):
+    """
+    Serialize a message into an envelope.
+    The envelope starts with an offset table, so each value is decoded separately.
+    :type message: dict
+    :rtype: bytes
+    """
+    keys, fields = [], []
+    for key, value in dict.items(message):
+        keys.append(key)
+        fields.append(value.raw if isinstance(value, EncodedValue)
+                      else pickle.dumps(value, PICKLE_PROTOCOL))
+    # field offsets are restored from field sizes
+    offset_table = pickle.dumps((keys, [len(data) for data in fields]), PICKLE_PROTOCOL)
+    return b''.join([ENVELOPE_HEADER.pack(ENVELOPE_VERSION, len(offset_table)),
+                     offset_table] + fields)
+
+
+def unpack_message(data):
+    """
+    Deserialize an envelope. Message values are not decoded until accessed.
+    :type data: bytes
+    :rtype: FrozenLazyMessage
+    """
+    version, table_size = ENVELOPE_HEADER.unpack_from(data)
+    assert version == ENVELOPE_VERSION, 'Unsupported message envelope version'
+    offset = ENVELOPE_HEADER.size + table_size
+    keys, sizes = pickle.loads(data[ENVELOPE_HEADER.size:offset])
+    values = []
+    for size in sizes:
+        values.append(EncodedValue(data, offset, size))
+        offset += size
+    return FrozenLazyMessage(zip(keys, values))
+
+
+def copy_message(message, **updates):
+    """
+    Build a mutable copy of the message.
+    Encoded values of a lazy message are copied without decoding.
+    :type message: dict
+    :rtype: Message
+    """
+    if isinstance(message, LazyMessage):
+        result = LazyMessage(dict.items(message))
+        dict.update(result, updates)
+        return result
+    return Message(message, **updates) if message else Message(updates)
+
+
+def message_without(message, *keys):
+    """
+    Build a frozen copy of the message without some keys
+    The message is not copied if it has none of these keys.
+    :type message: dict
+    :rtype: FrozenMessage
+    """
+    if not any(item in message for item in keys):
+        return freeze_message(message)
+    if isinstance(message, LazyMessage):
+        return FrozenLazyMessage((k, v) for k, v in dict.items(message) if k not in keys)
+    return FrozenMessage((k, v) for k, v in message.items() if k not in keys)
+
+
+def freeze_message(message):
+    """
+    Make a message immutable.
+    A Message object is frozen in place without copying, so it must not be used after that.
+    :type message: dict
+    :rtype: FrozenMessage
+    """
+    if isinstance(message, FrozenMessage):
+        return message
+    if type(message) is Message:
+        message.__class__ = FrozenMessage
+        return message
+    if type(message) is LazyMessage:
+        message.__class__ = FrozenLazyMessage
+        return message
+    return FrozenMessage(message)
+
 
 class MessageUpdate(Message):
-    __deleted_items = None
+    __slots__ = ('_deleted_items',)
 
     def __init__(self, *args, **kwargs):
-        self.__deleted_items = set()
+        self._deleted_items = None  # set of deleted keys is created on first delete
         super(MessageUpdate, self).__init__(*args, **kwargs)
 
     def __nonzero__(self):
         return self.__bool__()
 
     def __bool__(self):
-        return bool(self.__deleted_items) or bool(self.keys())
+        return bool(self._deleted_items) or bool(len(self))
 
     def __delitem__(self, item):
         # save item to delete the key from original message later if exist
-        self.__deleted_items.add(item)
+        if self._deleted_items is None:
+            self._deleted_items = set()
+        self._deleted_items.add(item)
         try:
             super(MessageUpdate, self).__delitem__(item)
         except KeyError:
@@ -62,7 +279,7 @@ class MessageUpdate(Message):
 
     def merge_with_message(self, original_message):
         result = dict(original_message)
-        for item in self.__deleted_items:
+        for item in self._deleted_items or ():
             result.pop(item, None)
         result.update(self)
         return result
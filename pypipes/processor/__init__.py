@@ -1,13 +1,28 @@
 import logging
 import types
-from copy import deepcopy
+from copy import copy
+from functools import partial
 
-from pypipes.context import LazyContextCollection, injections_handler
+from pypipes.context import LazyContextCollection, injections_handler, ContextPath, \
+    apply_context_to_kwargs
+from pypipes.exceptions import DropMessageException, RetryMessageException
 from pypipes.context.manager import MultiContextManager
 from pypipes.line import Pipeline, PipelineJoin, ICloneable
+from pypipes.message import FrozenMessage
 
 logger = logging.getLogger(__name__)
 
+BATCH_MESSAGES = '_batch'
+
+
+def batch_message(messages):
+    """
+    Pack several messages into one batch message
+    :param messages: list of message dicts
+    :return: batch message dict
+    """
+    return {BATCH_MESSAGES: [dict(msg) for msg in messages]}
+
 
 class IProcessor(ICloneable, PipelineJoin):
 
@@ -73,21 +88,27 @@ class Processor(IProcessor):
         if result is not None:
             if isinstance(result, types.GeneratorType):
                 for message in result:
-                    response.emit_message(dict(message))
+                    response.emit_message(message)
+                    # don't generate next message while consumers are overloaded
+                    response.throttle()
             else:
-                response.emit_message(dict(result))
+                response.emit_message(result)
 
     def _do_process(self, injections):
         raise NotImplementedError()
 
     def clone(self):
-        return deepcopy(self)
+        # processor settings are shared with the clone,
+        # only the lists that are extended by pipeline attachments are copied
+        processor = copy(self)
+        processor._monitor_events = list(self._monitor_events)
+        return processor
 
     def to_pipeline(self):
-        # return a cloned copy of this processor
-        # because of pipeline can extend processor with additional features
-        # but original processor should left unchanged
-        return Pipeline([self.clone()])
+        # pipeline shares the processor.
+        # Attachments and context managers extend a clone of the processor,
+        # so original processor is left unchanged
+        return Pipeline([self])
 
 
 class ContextProcessor(MultiContextManager, Processor):
@@ -95,12 +116,19 @@ class ContextProcessor(MultiContextManager, Processor):
     This processor wraps a processor function with set of context managers
     Each context manager can apply some pre and post processing of a message
     Also it may specify additional context for message processing
+
+    A batch message (see batch_message) is processed message by message
+    unless the processor is batch-aware. Batch-aware processor receives all messages of the batch
+    at once as `messages` injection.
+    Context managers are entered once per batch message, they see the batch message
+    as `message` injection, e.g. Sync counts the batch as one job.
     """
-    def __init__(self, processor_func, context_managers=None, events=None):
+    def __init__(self, processor_func, context_managers=None, events=None, batch=False):
         MultiContextManager.__init__(self, context_managers)
         Processor.__init__(self, events)
         self.processor_func = processor_func
         self.injections_handler = injections_handler(processor_func)
+        self.batch = batch
 
     @property
     def name(self):
@@ -109,7 +137,64 @@ class ContextProcessor(MultiContextManager, Processor):
     def __call__(self, *args, **kwargs):
         return self.processor_func(*args, **kwargs)
 
+    def clone(self):
+        processor = super(ContextProcessor, self).clone()
+        processor.context_managers = list(self.context_managers)
+        return processor
+
     def process(self, injections):
+        message = injections.get('message')
+        if self.batch:
+            if not message or BATCH_MESSAGES not in message:
+                messages = [message]
+            else:
+                _, messages = self._split_batch(message)
+            self._process_message(LazyContextCollection(injections, messages=messages))
+        elif not message or BATCH_MESSAGES not in message:
+            self._process_message(injections)
+        else:
+            with self.context(injections) as context:
+                if context:
+                    injections = LazyContextCollection(injections, **context)
+                self._process_batch(injections)
+
+    @staticmethod
+    def _split_batch(message):
+        # values added to the batch message by message filters are shared by all batch messages
+        batch_values = {k: v for k, v in message.items() if k != BATCH_MESSAGES}
+        return batch_values, [FrozenMessage(batch_values, **msg)
+                              for msg in message[BATCH_MESSAGES]]
+
+    def _process_batch(self, injections):
+        # context managers may update the batch message, so it's taken from the context
+        message = injections['message']
+        batch_values, messages = self._split_batch(message)
+        for index, msg in enumerate(messages):
+            try:
+                Processor.process(self, self._get_message_injections(injections, msg))
+            except DropMessageException as e:
+                # other messages of the batch are still processed
+                logger.warning('Processor %s dropped a batch message: %s',
+                               injections.get('processor_id'), e)
+            except RetryMessageException as e:
+                # messages before this one are already processed, retry the rest of the batch
+                injections['response'].emit_retry_message(
+                    batch_values, _retry_in=e.retry_in,
+                    **batch_message(message[BATCH_MESSAGES][index:]))
+                return
+
+    @staticmethod
+    def _get_message_injections(injections, message):
+        context = {'message': message}
+        program = injections.get('program')
+        if program is not None and program.message_mapping:
+            # mapped message parts are extracted from each message of the batch
+            context.update(apply_context_to_kwargs(program.message_mapping,
+                                                   {'message': message},
+                                                   ContextPath('message')))
+        return LazyContextCollection(injections, **context)
+
+    def _process_message(self, injections):
         with self.context(injections) as context:
             if context:
                 injections = LazyContextCollection(injections, **context)
@@ -119,7 +204,16 @@ class ContextProcessor(MultiContextManager, Processor):
         return self.injections_handler(injections)
 
 
-pipe_processor = ContextProcessor
+def pipe_processor(processor_func=None, batch=False):
+    """
+    Func decorator for creating a ContextProcessor
+    Usage: @pipe_processor or @pipe_processor(batch=True)
+    :param batch: if True the processor receives all messages of a batch message at once
+        as `messages` injection
+    """
+    if processor_func is None:
+        return partial(ContextProcessor, batch=batch)
+    return ContextProcessor(processor_func, batch=batch)
 
 
 class ProcessorAttachment(PipelineJoin):
@@ -139,7 +233,8 @@ class ProcessorAttachment(PipelineJoin):
 
     def join(self, other):
         pipeline = other.to_pipeline()
-        result = Pipeline([self.attach_to(pipeline[0])])
+        # attachment modifies a clone of the processor that may be shared with other pipelines
+        result = Pipeline([self.attach_to(pipeline[0].clone())])
         if len(pipeline) > 1:
             result = result.join(Pipeline(pipeline[1:]))
         return result
@@ -1,4 +1,50 @@
-from pypipes.processor import pipe_processor
+from collections import OrderedDict
+from itertools import islice
+
+from pypipes.message import message_digest
+from pypipes.processor import pipe_processor, batch_message
+
+DEFAULT_UNIQUE_CACHE_SIZE = 100000
+
+
+def iter_chunks(iterable, size):
+    """
+    Split iterable into lists of `size` elements
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+class UniqueFilter(object):
+    """
+    Streaming filter of duplicated messages.
+    Only digests of recently seen messages are kept, so a memory usage is bounded by max_size
+    and message values may be unhashable like lists and dicts.
+    A duplicate is not detected if more than max_size unique messages are passed after
+    its original message.
+    """
+    def __init__(self, max_size=DEFAULT_UNIQUE_CACHE_SIZE):
+        self.max_size = max_size
+        self._seen = OrderedDict()
+
+    def __call__(self, msg):
+        """
+        :param msg: message dict
+        :return: True if the message is seen first time
+        """
+        digest = message_digest(msg)
+        if digest in self._seen:
+            # move the digest to the end of the queue
+            self._seen.pop(digest)
+            self._seen[digest] = None
+            return False
+        self._seen[digest] = None
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        return True
 
 
 class Items(object):
@@ -6,17 +52,30 @@ class Items(object):
         self.name = name
         self.iterable = iterable
 
+    def _messages(self, message):
+        for value in self.iterable:
+            msg = dict(message)
+            msg[self.name] = value
+            yield msg
+
     @property
     def for_each(self):
 
         @pipe_processor
         def for_each(message):
-            for value in self.iterable:
-                msg = dict(message)
-                msg[self.name] = value
-                yield msg
+            return self._messages(message)
         return for_each
 
+    def for_each_chunk(self, size):
+        """
+        Emit a batch message per `size` items
+        """
+        @pipe_processor
+        def for_each_chunk(message):
+            for chunk in iter_chunks(self._messages(message), size):
+                yield batch_message(chunk)
+        return for_each_chunk
+
 
 class Collection(object):
     def __init__(self, collection, storage='default'):
@@ -26,24 +85,33 @@ class Collection(object):
     def _format_name(self, element):
         return '{}_{}_{}'.format(self.storage, self.collection, element)
 
-    def transform_each(self, transform, unique=False, only_ids=False):
-
-        @pipe_processor
-        def for_each(message, storage):
-            unique_cache = set() if unique else None
+    def transform_each(self, transform, unique=False, only_ids=False, chunk_size=None):
+        """
+        Emit messages built by transform function from each collection item
+        :param transform: function that yields messages for a collection item
+        :param unique: skip duplicated messages
+        :param only_ids: transform only item ids instead of items
+        :param chunk_size: if set emit a batch message per chunk_size messages
+        """
+        def iter_messages(message, storage):
+            unique_filter = UniqueFilter() if unique else None
 
             for item in storage[self.storage].get_collection(self.collection, only_ids=only_ids):
                 for msg in transform(item):
-                    if unique:
-                        msg_hash = tuple(msg.items())
-                        if msg_hash in unique_cache:
-                            continue
-                        unique_cache.add(msg_hash)
+                    if unique and not unique_filter(msg):
+                        continue
                     # extend input message dict with new values
                     yield dict(message, **msg)
+
+        @pipe_processor
+        def for_each(message, storage):
+            messages = iter_messages(message, storage)
+            if not chunk_size:
+                return messages
+            return (batch_message(chunk) for chunk in iter_chunks(messages, chunk_size))
         return for_each
 
-    def for_each(self, name=None, unique=False):
+    def _item_transform(self, name=None):
         name = name or self._format_name('item')
 
         def transform(item):
@@ -52,7 +120,16 @@ class Collection(object):
                 'value': item.value,
                 'aliases': item.aliases,
                 'collections': item.collections}}
-        return self.transform_each(transform, unique=unique)
+        return transform
+
+    def for_each(self, name=None, unique=False):
+        return self.transform_each(self._item_transform(name), unique=unique)
+
+    def for_each_chunk(self, size, name=None, unique=False):
+        """
+        Emit a batch message per `size` collection items
+        """
+        return self.transform_each(self._item_transform(name), unique=unique, chunk_size=size)
 
     def for_each_id(self, name=None, unique=False):
         name = name or self._format_name('id')
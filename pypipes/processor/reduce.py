@@ -0,0 +1,155 @@
+import logging
+import random
+
+from pypipes.context import apply_context_to_kwargs
+from pypipes.context.sync import GATHER_COMPLETE
+from pypipes.exceptions import RetryMessageException
+from pypipes.processor import ContextProcessor
+from pypipes.service import key
+
+logger = logging.getLogger(__name__)
+
+REDUCE_FLUSH = '_reduce_flush'
+
+PARTIAL_LOCK_EXPIRATION = 60
+PARTIAL_LOCK_TIMEOUT = 5
+
+
+def _lock_partial(lock_service, partial_key, wait_timeout):
+    if not lock_service.acquire_wait(partial_key, PARTIAL_LOCK_EXPIRATION, wait_timeout):
+        raise RetryMessageException(retry_in=wait_timeout)
+
+
+def _flush(storage_service, lock_service, reduce_key, shards, combiner, wait_timeout):
+    # collect and delete all partial aggregates of the key.
+    # All shards are locked before any of them is deleted,
+    # so a flush that can't lock a shard leaves the aggregate untouched.
+    # Shards are locked in the same order by all flushes to avoid a deadlock.
+    partial_keys = [key(reduce_key, 'partial', shard) for shard in range(shards)]
+    locked = []
+    try:
+        for partial_key in partial_keys:
+            _lock_partial(lock_service, partial_key, wait_timeout)
+            locked.append(partial_key)
+        partials = [storage_service.get(partial_key) for partial_key in partial_keys]
+        for partial_key, partial in zip(partial_keys, partials):
+            if partial is not None:
+                storage_service.delete(partial_key)
+    finally:
+        for partial_key in locked:
+            lock_service.release(partial_key)
+
+    result, count = None, 0
+    for value, partial_count in filter(None, partials):
+        result = combiner(result, value) if count else value
+        count += partial_count
+    return result, count
+
+
+class Reduce(ContextProcessor):
+    """
+    Combines a stream of messages into one message per reduce key.
+
+    Messages are folded into partial aggregates kept in a storage service.
+    Each message is added to a random shard of the key,
+    so parallel workers rarely wait for the same partial aggregate.
+    All shards are combined and emitted as one message when:
+     - `window` seconds have passed since the first message of the key
+     - the key has received `max_count` messages
+     - a message with `gather_complete` flag is received, see `Sync.gather`
+
+    Usage:
+    ... >> Reduce(lambda total, msg: total + msg['amount'], initial=0, combiner=operator.add,
+                  shards=4, window=60, account_id=message.account_id) >> next_processor
+
+    next_processor receives messages like {'account_id': <account_id>, 'result': <total>}
+
+    Reduce requires storage.reduce and lock.reduce injections
+    and counter.reduce injection if max_count is set
+    """
+    def __init__(self, reducer, initial=None, combiner=None, shards=1,
+                 window=None, max_count=None, result_name='result',
+                 storage_name='reduce', lock_category='reduce', counter_name='reduce',
+                 wait_timeout=PARTIAL_LOCK_TIMEOUT, **key_params):
+        """
+        :param reducer: function(accumulator, message) that returns a new accumulator value
+        :param initial: initial accumulator value of a partial aggregate
+        :param combiner: function(accumulator1, accumulator2) that combines partial aggregates.
+            Required if shards > 1.
+        :param shards: count of partial aggregates per reduce key
+        :param window: flush the aggregate in this time (seconds) after first message of the key
+        :param max_count: flush the aggregate when this count of messages are reduced
+        :param result_name: name of aggregated value in emitted message
+        :param storage_name: name of storage service for partial aggregates
+        :param lock_category: name of lock service that guards partial aggregates
+        :param counter_name: name of counter service that counts messages if max_count is set
+        :param wait_timeout: max time in seconds to wait for a partial aggregate lock
+        :param key_params: reduce key parameters based on current context.
+            Use ContextPath to extract values from processor context.
+            These values are included into emitted message.
+        """
+        assert shards == 1 or combiner, 'combiner is required to merge several shards'
+
+        def reduce(message, response, processor_id, storage, lock, injections):
+            """
+            :type response: pypipes.infrastructure.response.IResponseHandler
+            """
+            storage_service = storage[storage_name]
+            lock_service = lock[lock_category]
+            key_values = apply_context_to_kwargs(key_params, injections)
+            reduce_key = key(processor_id, **key_values)
+
+            window_key = key(reduce_key, 'window')
+            window_id = message.get(REDUCE_FLUSH)
+            if window_id:
+                # the window lock token identifies the window of a scheduled flush
+                if not lock_service.renew(window_key, window_id, PARTIAL_LOCK_EXPIRATION):
+                    logger.debug('Skip a stale flush of %s', reduce_key)
+                    return
+            if not (window_id or message.get(GATHER_COMPLETE)):
+                # window lock outlives the window so the scheduled flush finds it
+                window_id = window and lock_service.acquire_token(
+                    window_key, window + PARTIAL_LOCK_EXPIRATION)
+                if window_id:
+                    # the first message of the window schedules a flush
+                    response.emit_retry_message(message, _retry_in=window,
+                                                **{REDUCE_FLUSH: window_id})
+
+                partial_key = key(reduce_key, 'partial', random.randrange(shards))
+                _lock_partial(lock_service, partial_key, wait_timeout)
+                try:
+                    value, count = storage_service.get(partial_key) or (initial, 0)
+                    storage_service.save(partial_key, (reducer(value, message), count + 1))
+                finally:
+                    lock_service.release(partial_key)
+
+                if not max_count:
+                    return
+                counter_service = injections['counter'][counter_name]
+                count_key = key(reduce_key, 'count')
+                if counter_service.increment(count_key) < max_count:
+                    return
+                counter_service.delete(count_key)
+                try:
+                    result, count = _flush(storage_service, lock_service, reduce_key,
+                                           shards, combiner, wait_timeout)
+                except RetryMessageException as e:
+                    # the message is already reduced, retry only the flush
+                    response.emit_retry_message(message, _retry_in=e.retry_in,
+                                                **{GATHER_COMPLETE: True})
+                    return
+            else:
+                result, count = _flush(storage_service, lock_service, reduce_key,
+                                       shards, combiner, wait_timeout)
+
+            if window_id:
+                lock_service.release_token(window_key, window_id)
+            elif window:
+                # the flush closes the current window, its scheduled flush becomes stale
+                lock_service.release(window_key)
+            if count:
+                logger.debug('Reduced %s messages of %s', count, reduce_key)
+                key_values[result_name] = result
+                return key_values
+
+        super(Reduce, self).__init__(reduce)
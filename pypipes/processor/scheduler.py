@@ -1,6 +1,7 @@
 from datetime import timedelta
 
 from pypipes.events import EVENT_START
+from pypipes.message import message_without
 from pypipes.service import key
 
 from pypipes.processor import event_processor, pipe_processor
@@ -31,9 +32,10 @@ class Scheduler(object):
                 complex_scheduler_id = (key(scheduler_id, split_by_value)
                                         if scheduler_id else
                                         key(processor_id, split_by_value))
-            scheduler_period = message.pop('_scheduler_period', period)
+            scheduler_period = message.get('_scheduler_period', period)
             if scheduler_period:
-                response.schedule_message(message, scheduler_id=complex_scheduler_id,
+                response.schedule_message(message_without(message, '_scheduler_period'),
+                                          scheduler_id=complex_scheduler_id,
                                           period=scheduler_period)
         return scheduler
 
@@ -17,6 +17,7 @@ class Program(MultiContextManager):
         self.event_processor_map = defaultdict(list)
         self.processor_map = OrderedDict()
         self.next_processor_map = {}
+        self._name_suffixes = {}  # last suffix of unique processor name
         self.message_mapping = message_mapping or {}
 
         self.name = name
@@ -46,13 +47,16 @@ class Program(MultiContextManager):
         for processor in pipeline:
             assert isinstance(processor, IProcessor)
 
-            proc_name = '{}.{}'.format(pipeline_name, processor.name)
-            proc_index = 1
+            base_name = '{}.{}'.format(pipeline_name, processor.name)
+            # names with lower suffixes are already registered
+            proc_index = self._name_suffixes.get(base_name, 1)
+            proc_name = base_name if proc_index == 1 else '{}.{}'.format(base_name, proc_index)
             while proc_name in self.processor_map:
                 # proc name should be unique but this name is already registered
                 # append unique suffix to proc_name
                 proc_index = proc_index + 1
-                proc_name = '{}.{}.{}'.format(pipeline_name, processor.name, proc_index)
+                proc_name = '{}.{}'.format(base_name, proc_index)
+            self._name_suffixes[base_name] = proc_index
 
             self.processor_map[proc_name] = processor
             if prev_proc_name:
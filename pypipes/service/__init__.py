@@ -1,3 +1,4 @@
+from collections import defaultdict
 from functools import wraps
 
 
@@ -17,20 +18,39 @@ def key(*names, **kwargs):
 
 
 _config_singletons = {}
+_config_singleton_sections = defaultdict(set)
 
 
-def config_singleton(func):
+def config_singleton(func=None, section=None):
     """
     A wrapper to create and use single object instance per object configuration
     :param func: object factory
+    :param section: name of config section that configures the object.
+        Objects of changed config section are released by `release_config_singletons`
+        and created again on next call.
     :return: wrapped function
     """
     global _config_singletons
 
+    if func is None:
+        return lambda f: config_singleton(f, section=section)
+
     @wraps(func)
     def wrapped(config):
         func_key = key(func.__module__, func.__name__, **config)
         if func_key not in _config_singletons:
             _config_singletons[func_key] = func(config)
+            if section:
+                _config_singleton_sections[section].add(func_key)
         return _config_singletons[func_key]
     return wrapped
+
+
+def release_config_singletons(*sections):
+    """
+    Release objects created by config_singleton for changed config sections
+    :param sections: names of changed config sections
+    """
+    for section in sections:
+        for func_key in _config_singleton_sections.pop(section, ()):
+            _config_singletons.pop(func_key, None)
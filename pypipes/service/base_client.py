@@ -76,13 +76,13 @@ class MemcachedClient(object):
         return self._client
 
 
-@config_singleton
+@config_singleton(section='redis')
 def get_redis_client(config=None):
     from redis import StrictRedis
     return StrictRedis(**config or {})
 
 
-@config_singleton
+@config_singleton(section='memcached')
 def get_memcached_client(config=None):
     try:
         from pylibmc import Client
@@ -1,12 +1,14 @@
 import time
 from copy import deepcopy
 from functools import partial
+from threading import Lock
 
 from pypipes.context.config import client_config
 from pypipes.service import key
 from pypipes.service.base import ComplexKey, MemcachedComplexKey
 from pypipes.service.base_client import RedisClient, MemcachedClient, get_redis_client, \
     get_memcached_client
+from pypipes.service.eviction import EvictionTracker, LRU
 from pypipes.service.hash import IHash
 
 from pypipes.context.factory import ContextPoolFactory, LazyContextPoolFactory
@@ -69,40 +71,75 @@ class ICache(IHash):
 
 class MemoryCache(ICache):
 
-    def __init__(self):
+    def __init__(self, max_entries=None, max_bytes=None, policy=LRU, metrics=None, name=None):
+        """
+        :param max_entries: max count of cached keys. None - unlimited
+        :param max_bytes: max estimated size of cached values in bytes. None - unlimited
+        :param policy: eviction policy 'lru' or 'lfu'
+        :type metrics: pypipes.service.metric.IMetrics
+        :param name: cache name, is used as a metric tag
+        """
         self.storage = {}
+        self._sync = Lock()
+        self._tracker = EvictionTracker(max_entries=max_entries, max_bytes=max_bytes,
+                                        policy=policy, metrics=metrics,
+                                        name='cache.{}'.format(name) if name else 'cache')
+
+    def _save(self, key, value, expiration_time):
+        self.storage[key] = (value, expiration_time)
+        self._tracker.add(key, value, expiration_time)
+
+    def _evict(self):
+        # remove expired values and values that exceed cache limits
+        for evicted_key in self._tracker.collect():
+            self.storage.pop(evicted_key, None)
 
     def save(self, key, value, expires_in=None):
-        self.storage[key] = (deepcopy(value), expires_in and time.time() + expires_in)
+        value = deepcopy(value)
+        with self._sync:
+            self._save(key, value, expires_in and time.time() + expires_in)
+            self._evict()
 
     def save_many(self, values, expires_in=None):
-        # dict operations are thread-safe therefore no need to use any additional lock here
         expiration_time = expires_in and time.time() + expires_in
-        self.storage.update({key: (deepcopy(values[key]), expiration_time)
-                             for key in values})
+        values = {key: deepcopy(values[key]) for key in values}
+        with self._sync:
+            for k in values:
+                self._save(k, values[k], expiration_time)
+            self._evict()
 
-    def get(self, key, default=None):
+    def _get(self, key, default):
         value, expiration_time = self.storage.get(key, (default, None))
         if expiration_time and expiration_time < time.time():
             # value expired
+            self.storage.pop(key, None)
+            self._tracker.remove(key)
             return default
+        self._tracker.hit(key)
+        return value
+
+    def get(self, key, default=None):
+        with self._sync:
+            value = self._get(key, default)
         return deepcopy(value)
 
     def get_many(self, keys, default=None):
-        # Note! This operation is not thread safe :(
-        # because some value might be updated during operation
-        return {key: self.get(key, default) for key in keys}
+        with self._sync:
+            values = {key: self._get(key, default) for key in keys}
+        return deepcopy(values)
 
     def delete(self, key):
         default = object()
-        result = self.storage.pop(key, default)
+        with self._sync:
+            result = self.storage.pop(key, default)
+            self._tracker.remove(key)
         return result != default
 
     def delete_many(self, keys):
-        # Note! This operation is not thread safe :(
-        # because some value might be updated during operation
-        for k in keys:
-            self.storage.pop(k, None)
+        with self._sync:
+            for k in keys:
+                self.storage.pop(k, None)
+                self._tracker.remove(k)
 
 
 class RedisCache(RedisClient, ComplexKey, ICache):
@@ -238,6 +275,10 @@ def cached_method(func=None, expires_in=300, key_builder=None):
 
 
 memory_cache_pool = ContextPoolFactory(lambda name: MemoryCache())
+# memory cache limited by config.memory.cache.<name> parameters: max_entries, max_bytes, policy
+bounded_memory_cache_pool = LazyContextPoolFactory(
+    lambda name, memory_config=client_config.memory, metrics=None:
+    MemoryCache(metrics=metrics, name=name, **memory_config.cache[name]))
 local_redis_cache_pool = ContextPoolFactory(RedisCache)  # service name => redis prefix
 local_memcached_cache_pool = ContextPoolFactory(MemcachedCache)  # service name => redis prefix
 
@@ -0,0 +1,72 @@
+import logging
+import time
+
+from pypipes.exceptions import CircuitOpenException
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RECOVERY_TIME = 30  # seconds
+DEFAULT_CHECK_INTERVAL = 1  # seconds
+
+
+class CircuitBreaker(object):
+    """
+    Stops calls to a failing service for a while.
+
+    The circuit opens when `failure_threshold` consecutive calls fail in current process.
+    Open state is shared with other processes through a lock service,
+    so calls of all processes are stopped for `recovery_time` seconds.
+    When the circuit is closed again, the first failed call opens it once more,
+    the failure count is reset by a successful call only.
+
+    Open circuit raises CircuitOpenException that is a RetryMessageException,
+    so a processor that is wrapped with `suspended_guard` suspends its processing
+    until the service is recovered.
+    """
+    def __init__(self, lock_service, name,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 recovery_time=DEFAULT_RECOVERY_TIME,
+                 check_interval=DEFAULT_CHECK_INTERVAL):
+        """
+        :param lock_service: lock service that shares the circuit state
+        :type lock_service: pypipes.service.lock.ILock
+        :param name: circuit name, e.g. api name
+        :param failure_threshold: count of consecutive failures that opens the circuit
+        :param recovery_time: time in seconds while the circuit is open
+        :param check_interval: closed circuit state is checked in the lock service
+            not more often than once in this time (seconds)
+        """
+        self.lock_service = lock_service
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.check_interval = check_interval
+        self.failures = 0
+        self._next_check = 0
+
+    def check(self):
+        """
+        Check if the circuit is closed
+        :raise: CircuitOpenException if the circuit is open
+        """
+        now = time.time()
+        if now < self._next_check:
+            return
+        open_time = self.lock_service.get(self.name)
+        if open_time:
+            retry_in = self.recovery_time if open_time is True else open_time
+            self._next_check = 0
+            raise CircuitOpenException('Circuit {} is open'.format(self.name), retry_in=retry_in)
+        self._next_check = now + self.check_interval
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            logger.warning('Circuit %s is open for %s seconds after %s failures',
+                           self.name, self.recovery_time, self.failures)
+            self.lock_service.set(self.name, expire_in=self.recovery_time)
+            self._next_check = 0
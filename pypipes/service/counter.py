@@ -1,9 +1,10 @@
 import logging
-from collections import defaultdict
+from threading import Lock
 
 from pypipes.context.config import client_config
 from pypipes.service.base import ComplexKey
 from pypipes.service.base_client import RedisClient, get_redis_client
+from pypipes.service.eviction import EvictionTracker, LRU
 
 from pypipes.context.factory import ContextPoolFactory, LazyContextPoolFactory
 
@@ -28,26 +29,96 @@ class ICounter(object):
         """
         raise NotImplementedError()
 
+    def increment_many(self, values):
+        """
+        Increment several counters at once
+        :param values: counter name => increment value
+        :type values: dict
+        :return: counter name => counter value after increment operation
+        :rtype: dict
+        """
+        return {name: self.increment(name, value) for name, value in values.items()}
+
+    def get_many(self, names):
+        """
+        Get values of several counters
+        :param names: counter names
+        :return: counter name => counter value, 0 if counter doesn't exist
+        :rtype: dict
+        """
+        raise NotImplementedError()
+
 
 class MemCounter(ICounter):
-    def __init__(self):
-        self.counters = defaultdict(lambda: 0)
+    def __init__(self, max_entries=None, policy=LRU, metrics=None, name=None):
+        """
+        :param max_entries: max count of counters. None - unlimited
+            Note that an evicted counter starts from zero on next increment.
+        :param policy: eviction policy 'lru' or 'lfu'
+        :type metrics: pypipes.service.metric.IMetrics
+        :param name: counter service name, is used as a metric tag
+        """
+        self.counters = {}
+        self._sync = Lock()
+        self._tracker = EvictionTracker(max_entries=max_entries, policy=policy, metrics=metrics,
+                                        name='counter.{}'.format(name) if name else 'counter')
 
     def increment(self, name, value=1):
-        self.counters[name] = result = self.counters[name] + value
+        with self._sync:
+            self.counters[name] = result = self.counters.get(name, 0) + value
+            self._tracker.add(name)
+            for evicted_name in self._tracker.collect():
+                self.counters.pop(evicted_name, None)
         logger.debug('Incremented counter %s by %s = %s', name, value, result)
         return result
 
     def delete(self, name):
-        self.counters.pop(name, None)
+        with self._sync:
+            self.counters.pop(name, None)
+            self._tracker.remove(name)
         logger.debug('Deleted counter %s', name)
 
+    def increment_many(self, values):
+        with self._sync:
+            result = {}
+            for name, value in values.items():
+                self.counters[name] = result[name] = self.counters.get(name, 0) + value
+                self._tracker.add(name)
+            for evicted_name in self._tracker.collect():
+                self.counters.pop(evicted_name, None)
+        logger.debug('Incremented counters %s', values)
+        return result
+
+    def get_many(self, names):
+        with self._sync:
+            for name in names:
+                self._tracker.hit(name)
+            return {name: self.counters.get(name, 0) for name in names}
+
 
 class RedisCounter(RedisClient, ComplexKey, ICounter):
+    lua_increment_many = None
+
+    # KEYS - counter names
+    # ARGV[i] - increment value of KEYS[i]
+    # return list of counter values after increment
+    LUA_INCREMENT_MANY_SCRIPT = """
+             local result = {}
+             for i, key in ipairs(KEYS) do
+                 result[i] = redis.call('incrby', key, ARGV[i])
+             end
+             return result
+         """
 
     def __init__(self, prefix=None, client=None, **redis_params):
         ComplexKey.__init__(self, prefix)
         RedisClient.__init__(self, client, **redis_params)
+        RedisCounter.register_scripts(self.redis)
+
+    @classmethod
+    def register_scripts(cls, redis):
+        if cls.lua_increment_many is None:
+            cls.lua_increment_many = redis.register_script(cls.LUA_INCREMENT_MANY_SCRIPT)
 
     def increment(self, name, value=1):
         key = self.format_key(name)
@@ -57,8 +128,29 @@ class RedisCounter(RedisClient, ComplexKey, ICounter):
         key = self.format_key(name)
         self.redis.delete(key)
 
+    def increment_many(self, values):
+        if not values:
+            return {}
+        names = list(values)
+        # all counters are incremented atomically in one round trip
+        result = self.lua_increment_many(keys=[self.format_key(name) for name in names],
+                                         args=[int(values[name]) for name in names],
+                                         client=self.redis)
+        return dict(zip(names, result))
+
+    def get_many(self, names):
+        names = list(names)
+        if not names:
+            return {}
+        result = self.redis.mget([self.format_key(name) for name in names])
+        return {name: int(value or 0) for name, value in zip(names, result)}
+
 
 memory_counter_pool = ContextPoolFactory(lambda name: MemCounter())
+# memory counter limited by config.memory.counter.<name> parameters: max_entries, policy
+bounded_memory_counter_pool = LazyContextPoolFactory(
+    lambda name, memory_config=client_config.memory, metrics=None:
+    MemCounter(metrics=metrics, name=name, **memory_config.counter[name]))
 # service name in pool => redis prefix
 local_redis_counter_pool = ContextPoolFactory(RedisCounter)
 redis_counter_pool = LazyContextPoolFactory(
@@ -16,12 +16,15 @@ class ICursorStorage(object):
         """
         raise NotImplementedError()
 
-    def save(self, cursor_name, value):
+    def save(self, cursor_name, value, fencing_token=None):
         """
         Save cursor value
         :param cursor_name: unique cursor name
         :param value: cursor value
         :type value: object
+        :param fencing_token: fencing token of cursor lock owner.
+            The write is rejected if a greater token was already used for the cursor.
+        :raise: StaleFencingTokenException
         """
         raise NotImplementedError()
 
@@ -54,8 +57,9 @@ class CursorStorage(ICursorStorage):
         result = self._storage.get_item(cursor_name)
         return result and result.value
 
-    def save(self, cursor_name, value):
-        self._storage.save(cursor_name, value, collections=[self._all_collection])
+    def save(self, cursor_name, value, fencing_token=None):
+        self._storage.save(cursor_name, value, collections=[self._all_collection],
+                           fencing_token=fencing_token)
 
     def clear(self):
         self._storage.delete_collection(self._all_collection, delete_items=True)
@@ -123,12 +127,13 @@ class VersionedCursorStorage(CursorStorage):
                 best_version = version
         return best_value
 
-    def save(self, cursor_name, value):
+    def save(self, cursor_name, value, fencing_token=None):
         versioned_name = key(cursor_name, self._version)
         self._storage.save(versioned_name, value,
                            collections=[cursor_name,
                                         self._all_collection,
-                                        self._version_collection])
+                                        self._version_collection],
+                           fencing_token=fencing_token)
 
     def clear(self):
         # clear current version cursors only
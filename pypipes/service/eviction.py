@@ -0,0 +1,281 @@
+import heapq
+import itertools
+import sys
+import time
+from collections import OrderedDict
+
+import six
+
+if six.PY3:
+    import pickle
+else:
+    import cPickle as pickle
+
+LRU = 'lru'
+LFU = 'lfu'
+
+
+class IEvictionPolicy(object):
+    def add(self, key):
+        """
+        Start tracking a new key
+        :param key: key
+        """
+        raise NotImplementedError()
+
+    def hit(self, key):
+        """
+        Register an access to the tracked key
+        :param key: key
+        """
+        raise NotImplementedError()
+
+    def remove(self, key):
+        """
+        Stop tracking the key
+        :param key: key
+        """
+        raise NotImplementedError()
+
+    def victim(self):
+        """
+        Choose a key that should be evicted first
+        :return: key or None if nothing is tracked
+        """
+        raise NotImplementedError()
+
+
+class LRUPolicy(IEvictionPolicy):
+    """
+    Least recently used key is evicted first
+    """
+    def __init__(self):
+        self._order = OrderedDict()
+
+    def add(self, key):
+        self._order[key] = None
+
+    def hit(self, key):
+        # move the key to the end of the queue
+        self._order.pop(key, None)
+        self._order[key] = None
+
+    def remove(self, key):
+        self._order.pop(key, None)
+
+    def victim(self):
+        return next(iter(self._order), None)
+
+
+class LFUPolicy(IEvictionPolicy):
+    """
+    Least frequently used key is evicted first.
+    Least recently used key is evicted if several keys have the same frequency.
+    All operations are O(1)
+    """
+    def __init__(self):
+        self._frequency = {}
+        self._buckets = {}  # frequency => ordered set of keys
+        self._min_frequency = 0
+
+    def _link(self, key, frequency):
+        self._frequency[key] = frequency
+        self._buckets.setdefault(frequency, OrderedDict())[key] = None
+
+    def _unlink(self, key):
+        frequency = self._frequency.pop(key)
+        bucket = self._buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[frequency]
+        return frequency
+
+    def add(self, key):
+        self._link(key, 1)
+        self._min_frequency = 1
+
+    def hit(self, key):
+        if key not in self._frequency:
+            return self.add(key)
+        frequency = self._unlink(key)
+        self._link(key, frequency + 1)
+        if frequency == self._min_frequency and frequency not in self._buckets:
+            self._min_frequency = frequency + 1
+
+    def remove(self, key):
+        if key in self._frequency:
+            self._unlink(key)
+
+    def victim(self):
+        if not self._buckets:
+            return None
+        if self._min_frequency not in self._buckets:
+            # min frequency bucket was emptied by remove
+            self._min_frequency = min(self._buckets)
+        return next(iter(self._buckets[self._min_frequency]))
+
+
+EVICTION_POLICIES = {
+    LRU: LRUPolicy,
+    LFU: LFUPolicy
+}
+
+
+def estimate_size(value):
+    """
+    Estimate a memory size of the value in bytes
+    :param value: any python object
+    :return: size in bytes
+    """
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class EvictionTracker(object):
+    """
+    Keeps an in-memory service bounded.
+    Tracks keys of the service, their size and expiration time
+    and decides which of them have to be evicted.
+    Expired keys are swept from an expiration heap in small batches on each `collect` call
+    so the sweep cost is amortized over service operations.
+
+    Tracker is not thread-safe, service have to serialize tracker calls.
+    """
+    SWEEP_BATCH_SIZE = 100  # max count of expired keys removed by one collect call
+    evicted_metric_name = 'memory.evicted'
+    entries_metric_name = 'memory.entries'
+    bytes_metric_name = 'memory.bytes'
+
+    def __init__(self, max_entries=None, max_bytes=None, policy=LRU,
+                 size_func=None, metrics=None, name=None):
+        """
+        :param max_entries: max count of keys in the service. None - unlimited
+        :param max_bytes: max estimated size of all values in bytes. None - unlimited
+        :param policy: eviction policy name: 'lru' or 'lfu'
+        :param size_func: function that estimates a value size in bytes
+        :type size_func: (object) -> int
+        :type metrics: pypipes.service.metric.IMetrics
+        :param name: service name, is used as a metric tag
+        """
+        if policy not in EVICTION_POLICIES:
+            raise ValueError('Unknown eviction policy {!r}. Available policies: {}'.format(
+                policy, ', '.join(sorted(EVICTION_POLICIES))))
+        self.max_entries = max_entries and int(max_entries)
+        self.max_bytes = max_bytes and int(max_bytes)
+        self._policy = EVICTION_POLICIES[policy]()
+        self._size_func = size_func or estimate_size
+        self._metrics = metrics
+        self._tags = {'service': name} if name else {}
+
+        self._keys = set()
+        self._sizes = {}
+        self._bytes = 0
+        self._expires_at = {}
+        self._expiration_heap = []  # (expiration time, sequence, key)
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    @property
+    def total_bytes(self):
+        return self._bytes
+
+    def add(self, key, value=None, expires_at=None):
+        """
+        Track a new or updated key
+        :param key: key
+        :param value: key value. Is used to estimate a memory size if max_bytes is limited.
+        :param expires_at: key expiration timestamp or None if key never expires
+        """
+        if key in self._keys:
+            self._policy.hit(key)
+        else:
+            self._keys.add(key)
+            self._policy.add(key)
+
+        if self.max_bytes:
+            size = self._size_func(value)
+            self._bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+
+        if expires_at:
+            if self._expires_at.get(key) != expires_at:
+                self._expires_at[key] = expires_at
+                heapq.heappush(self._expiration_heap, (expires_at, next(self._sequence), key))
+        else:
+            self._expires_at.pop(key, None)
+
+    def hit(self, key):
+        """
+        Register a read access to the key
+        :param key: key
+        """
+        if key in self._keys:
+            self._policy.hit(key)
+
+    def remove(self, key):
+        """
+        Stop tracking of the key. Does nothing if key is not tracked.
+        :param key: key
+        """
+        if key in self._keys:
+            self._keys.discard(key)
+            self._policy.remove(key)
+            self._bytes -= self._sizes.pop(key, 0)
+            self._expires_at.pop(key, None)
+
+    def collect(self, now=None):
+        """
+        Collect keys that have to be evicted from the service.
+        Returned keys are not tracked anymore.
+        :param now: current timestamp
+        :return: list of keys to evict
+        :rtype: list
+        """
+        now = now or time.time()
+        expired = []
+        heap = self._expiration_heap
+        while heap and heap[0][0] <= now and len(expired) < self.SWEEP_BATCH_SIZE:
+            expires_at, _, key = heapq.heappop(heap)
+            if self._expires_at.get(key) == expires_at:
+                # skip outdated heap records of keys that were updated or removed
+                self.remove(key)
+                expired.append(key)
+
+        evicted = []
+        while ((self.max_entries and len(self._keys) > self.max_entries) or
+               (self.max_bytes and self._bytes > self.max_bytes)):
+            key = self._policy.victim()
+            if key is None:
+                break
+            self.remove(key)
+            evicted.append(key)
+
+        if len(heap) > 2 * len(self._expires_at) + self.SWEEP_BATCH_SIZE:
+            # too many outdated records in the heap, rebuild it
+            self._expiration_heap = [(expires_at, next(self._sequence), key)
+                                     for key, expires_at in self._expires_at.items()]
+            heapq.heapify(self._expiration_heap)
+
+        if expired or evicted:
+            self._report(expired, evicted)
+        return expired + evicted
+
+    def _report(self, expired, evicted):
+        if not self._metrics:
+            return
+        if expired:
+            self._metrics.increment(self.evicted_metric_name, len(expired),
+                                    tags=dict(self._tags, reason='expired'))
+        if evicted:
+            self._metrics.increment(self.evicted_metric_name, len(evicted),
+                                    tags=dict(self._tags, reason='capacity'))
+        self._metrics.gauge(self.entries_metric_name, len(self._keys), tags=self._tags)
+        if self.max_bytes:
+            self._metrics.gauge(self.bytes_metric_name, self._bytes, tags=self._tags)
@@ -0,0 +1,249 @@
+import hashlib
+import time
+import zlib
+from collections import namedtuple
+from datetime import timedelta
+from email.utils import parsedate_tz, mktime_tz
+
+import six
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from pypipes.service import key
+
+DEFAULT_STALE_TTL = 600  # keep stale response for 10 min to revalidate it
+DEFAULT_VARY_HEADERS = ('Accept', 'Authorization')
+DEFAULT_CACHE_METHODS = ('GET', 'HEAD')
+MIN_COMPRESS_SIZE = 512  # bytes
+COMPRESS_LEVEL = 6
+
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+
+def parse_cache_control(headers):
+    """
+    Parse Cache-Control header
+    :param headers: http headers
+    :return: dict of cache directives {<lower-case name>: <value or ''>}
+    """
+    directives = {}
+    for directive in (headers.get('Cache-Control') or '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip().strip('"')
+    return directives
+
+
+def parse_http_date(value):
+    """
+    :param value: http date string
+    :return: unix timestamp or None if value is not a valid date
+    """
+    parsed = value and parsedate_tz(value)
+    return mktime_tz(parsed) if parsed else None
+
+
+def get_freshness_ttl(headers):
+    """
+    Freshness lifetime of a response defined by Cache-Control and Expires headers
+    :param headers: response headers
+    :return: ttl in seconds or None if headers don't define it
+    """
+    directives = parse_cache_control(headers)
+    if 'no-cache' in directives:
+        return 0
+    if 'max-age' in directives:
+        try:
+            return max(int(directives['max-age']), 0)
+        except ValueError:
+            return 0
+    if 'Expires' in headers:
+        expires = parse_http_date(headers['Expires'])
+        if expires is None:
+            # invalid date means that the response is already expired
+            return 0
+        date = parse_http_date(headers.get('Date'))
+        if date is None:
+            date = time.time()
+        return max(int(expires - date), 0)
+    return None
+
+
+class HttpCacheEntry(namedtuple('HttpCacheEntry', ['status_code', 'reason', 'url', 'headers',
+                                                   'body', 'compressed', 'vary',
+                                                   'fresh_until'])):
+    """
+    Compact cached http response: status, headers and optionally compressed body
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_response(cls, request, response, fresh_ttl):
+        """
+        :type request: requests.PreparedRequest
+        :type response: requests.Response
+        :param fresh_ttl: time in seconds while response is fresh
+        :rtype: HttpCacheEntry
+        """
+        body = response.content or b''
+        compressed = len(body) >= MIN_COMPRESS_SIZE
+        if compressed:
+            body = zlib.compress(body, COMPRESS_LEVEL)
+        vary = tuple((name, request.headers.get(name)) for name in _vary_names(response.headers))
+        return cls(response.status_code, response.reason, response.url,
+                   list(response.headers.items()), body, compressed, vary,
+                   time.time() + fresh_ttl)
+
+    def is_fresh(self):
+        return time.time() < self.fresh_until
+
+    def matches(self, request):
+        """
+        Check that request has the same values of headers listed in response Vary header
+        :type request: requests.PreparedRequest
+        """
+        return all(request.headers.get(name) == value for name, value in self.vary)
+
+    def validators(self):
+        """
+        Conditional request headers that revalidate the response
+        :return: dict of headers
+        """
+        headers = CaseInsensitiveDict(self.headers)
+        validators = {}
+        if headers.get('ETag'):
+            validators['If-None-Match'] = headers['ETag']
+        if headers.get('Last-Modified'):
+            validators['If-Modified-Since'] = headers['Last-Modified']
+        return validators
+
+    def refresh(self, not_modified):
+        """
+        Update the entry with headers of 304 (Not Modified) response
+        :type not_modified: requests.Response
+        :rtype: HttpCacheEntry
+        """
+        headers = CaseInsensitiveDict(self.headers)
+        headers.update(not_modified.headers)
+        return self._replace(headers=list(headers.items()))
+
+    def to_response(self, request, response_class):
+        """
+        Build a response object from cached entry
+        :type request: requests.PreparedRequest
+        :param response_class: class of response object
+        :rtype: requests.Response
+        """
+        response = response_class()
+        response.status_code = self.status_code
+        response.reason = self.reason
+        response.url = self.url
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = zlib.decompress(self.body) if self.compressed else self.body
+        response.request = request
+        response.elapsed = timedelta(0)
+        response.from_cache = True
+        return response
+
+
+def _vary_names(headers):
+    return [name.strip() for name in (headers.get('Vary') or '').split(',') if name.strip()]
+
+
+class HttpCache(object):
+    """
+    Stores compact http responses in a cache service.
+    Only responses of GET and HEAD requests are cached by default.
+    Cache key is built from request method, url, body and headers the response may vary on.
+    Response freshness is defined by its Cache-Control and Expires headers.
+    Stale response that has ETag or Last-Modified header is kept for a while,
+    so the client may revalidate it with a conditional request.
+    """
+    def __init__(self, cache, default_ttl=60, stale_ttl=DEFAULT_STALE_TTL,
+                 vary_headers=DEFAULT_VARY_HEADERS, cache_methods=DEFAULT_CACHE_METHODS):
+        """
+        :param cache: cache service
+        :type cache: pypipes.service.cache.ICache
+        :param default_ttl: freshness ttl of a response without cache headers
+        :param stale_ttl: how long a stale response is kept for revalidation
+        :param vary_headers: request headers that are always included into a cache key
+        :param cache_methods: http methods which responses may be cached
+        """
+        self.cache = cache
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.vary_headers = vary_headers
+        self.cache_methods = cache_methods
+
+    def may_cache(self, request):
+        """
+        Check if response of the request may be cached
+        :type request: requests.PreparedRequest
+        :return: True if the request method is cacheable and its body is a part of the cache key
+        """
+        # stream or file body can't be read into a cache key without consuming it
+        return (request.method in self.cache_methods and
+                (request.body is None or isinstance(request.body, (bytes, six.text_type))))
+
+    def get_key(self, request):
+        """
+        :type request: requests.PreparedRequest
+        :return: cache key of the request
+        """
+        digest = hashlib.md5(request.url.encode('utf-8'))
+        for name in self.vary_headers:
+            value = request.headers.get(name)
+            if value:
+                digest.update(six.ensure_binary('\n{}: {}'.format(name, value)))
+        if request.body:
+            digest.update(b'\n\n')
+            digest.update(six.ensure_binary(request.body))
+        return key(request.method, digest.hexdigest())
+
+    def get(self, request):
+        """
+        Lookup a cached response of the request
+        :type request: requests.PreparedRequest
+        :return: cached response entry or None if it's missed
+        :rtype: HttpCacheEntry
+        """
+        if any(name in request.headers for name in CONDITIONAL_HEADERS):
+            # caller validates its own copy of the response
+            return None
+        if not self.may_cache(request):
+            return None
+        entry = self.cache.get(self.get_key(request))
+        if entry is not None and entry.matches(request):
+            return entry
+        return None
+
+    def save(self, request, response, ttl=None):
+        """
+        Save a response of the request into the cache
+        :type request: requests.PreparedRequest
+        :type response: requests.Response
+        :param ttl: freshness ttl of the response.
+            If ttl is None, it is defined by response headers or the default ttl is used.
+        :return: True if response is saved
+        """
+        if not self.may_cache(request):
+            return False
+        if not 200 <= response.status_code < 300:
+            # only a final successful response has a content that may be reused
+            return False
+        directives = parse_cache_control(response.headers)
+        if 'no-store' in directives or '*' in _vary_names(response.headers):
+            return False
+        if ttl is None:
+            ttl = get_freshness_ttl(response.headers)
+            if ttl is None:
+                ttl = self.default_ttl
+        expires_in = ttl
+        if 'ETag' in response.headers or 'Last-Modified' in response.headers:
+            expires_in += self.stale_ttl
+        if expires_in <= 0:
+            return False
+        entry = HttpCacheEntry.from_response(request, response, ttl)
+        self.cache.save(self.get_key(request), entry, expires_in=expires_in)
+        return True
@@ -1,8 +1,13 @@
+import random
 import re
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import six
+from requests.adapters import HTTPAdapter
+from six.moves.urllib.parse import urljoin
 
 try:
     import httplib as HTTPStatus
@@ -10,10 +15,17 @@ except ImportError:
     from http import HTTPStatus
 
 from pypipes.context.factory import LazyContext, LazyContextPoolFactory
-from pypipes.exceptions import ExtendedException
+from pypipes.exceptions import ExtendedException, RetryMessageException
+from pypipes.service.circuit_breaker import CircuitBreaker
+from pypipes.service.http_cache import HttpCache, parse_http_date
+from pypipes.service.paginator import Paginator, DEFAULT_CHECKPOINT_PERIOD
 
 RE_HOST = re.compile('https?://([^/#?]+).*')
 
+DEFAULT_CONCURRENCY = 10  # same as default connection pool size of requests
+
+TOO_MANY_REQUESTS = 429
+
 
 def extract_api_name(url):
     """
@@ -23,34 +35,133 @@ def extract_api_name(url):
     return host
 
 
+def follow_next_link(response):
+    """
+    Get a request of next page by `next` link of Link header
+    :type response: requests.Response
+    :return: request update or None if it's the last page
+    """
+    next_link = response.links.get('next')
+    if not next_link:
+        return None
+    # next link already contains all query parameters
+    return {'url': urljoin(response.url, next_link['url']), 'params': None}
+
+
+def parse_retry_after(value):
+    """
+    :param value: value of Retry-After header, delay in seconds or http date
+    :return: delay in seconds or None if value is invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        retry_time = parse_http_date(value)
+        return None if retry_time is None else max(retry_time - time.time(), 0)
+
+
+class RetryPolicy(object):
+    """
+    Defines which failed requests are retried and how soon.
+    Delay between retries grows exponentially with a random jitter,
+    so parallel clients don't retry a failing api at once.
+    Retry-After header of a response overrides the delay.
+    """
+    retriable_statuses = frozenset([HTTPStatus.REQUEST_TIMEOUT, TOO_MANY_REQUESTS])
+
+    def __init__(self, backoff=0.1, max_backoff=10, max_wait=5):
+        """
+        :param backoff: delay in seconds before first retry
+        :param max_backoff: max delay in seconds between retries
+        :param max_wait: max delay in seconds that the client may wait before a retry.
+            If the api asks to wait longer with Retry-After header, the request is not retried.
+        """
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait
+
+    def is_retriable(self, response):
+        return (response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR or
+                response.status_code in self.retriable_statuses)
+
+    def get_delay(self, retries, response=None):
+        """
+        :param retries: number of the retry
+        :type response: requests.Response
+        :return: delay in seconds before the retry
+        """
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return retry_after
+        delay = min(self.backoff * 2 ** (retries - 1), self.max_backoff)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def sleep(self, retries, response=None):
+        time.sleep(self.get_delay(retries, response))
+
+
 class HttpClient(requests.Session):
     """Augmented version of requests.Session which emits metrics around outgoing API calls"""
 
     request_latency_metric_name = 'api.out.latency'
 
-    def __init__(self, api_name=None, metrics=None, cache=None, cache_ttl=None, max_retries=3):
+    def __init__(self, api_name=None, metrics=None, cache=None, cache_ttl=None, max_retries=3,
+                 concurrency=DEFAULT_CONCURRENCY, retry_policy=None, circuit_breaker=None):
         """
         :type metrics: pypipes.service.metric.IMetrics
         :type cache: pypipes.service.cache.ICache
         :param cache_ttl: cache expiration time in seconds
+            of a response that doesn't define it with Cache-Control or Expires header
         :param max_retries: how many times the client should retry a request on error.
+        :param concurrency: max count of parallel requests sent by `map` and `gather`.
+            Connection pool of the client keeps this count of connections per host.
+        :param retry_policy: defines delays between request retries
+        :type retry_policy: RetryPolicy
+        :param circuit_breaker: stops requests to the api while it's failing
+        :type circuit_breaker: pypipes.service.circuit_breaker.CircuitBreaker
         """
         super(HttpClient, self).__init__()
         self.api_name = api_name
         self._metrics = metrics
         self._cache = cache
         self._cache_ttl = cache_ttl or 60  # cache for 1 min by default
+        self._http_cache = cache and HttpCache(cache, default_ttl=self._cache_ttl)
         self._max_retries = int(max_retries or 0)
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._circuit_breaker = circuit_breaker
+        self._concurrency = max(int(concurrency or DEFAULT_CONCURRENCY), 1)
+        if self._concurrency != DEFAULT_CONCURRENCY:
+            # parallel requests should not wait for or discard pooled connections
+            adapter = HTTPAdapter(pool_maxsize=self._concurrency)
+            self.mount('https://', adapter)
+            self.mount('http://', adapter)
 
     def _cached_response(self, request):
+        """
+        :type request: requests.PreparedRequest
+        :rtype: pypipes.service.http_cache.HttpCacheEntry
+        """
         if self._cache and self._may_cache(request):
-            return self._cache.get(request.url)
+            return self._http_cache.get(request)
 
     def _cache_response(self, request, response):
         if self._cache and self._may_cache(request, response):
-            ttl = self._get_cache_ttl(request, response)
-            ttl = self._cache_ttl if ttl is None else ttl
-            self._cache.save(request.url, response, expires_in=ttl)
+            # response headers define the ttl if it's not defined by the client
+            self._http_cache.save(request, response, self._get_cache_ttl(request, response))
+
+    def _revalidated_response(self, request, cached, not_modified):
+        """
+        Refresh cached response that is not modified since it was cached
+        :type request: requests.PreparedRequest
+        :type cached: pypipes.service.http_cache.HttpCacheEntry
+        :type not_modified: requests.Response
+        """
+        response = cached.refresh(not_modified).to_response(request, HttpResponse)
+        self._cache_response(request, response)
+        return response
 
     def _may_cache(self, request, response=None):
         """
@@ -60,8 +171,10 @@ class HttpClient(requests.Session):
         :return: return True if response may be cached
         """
         # any successful request may be cached
-        return ((HTTPStatus.OK <= response.status_code < HTTPStatus.BAD_REQUEST)
-                if response else True)
+        # note that failed response is falsy.
+        # 304 (Not Modified) is an answer to a conditional request, it's not a response content
+        return ((HTTPStatus.OK <= response.status_code < HTTPStatus.MULTIPLE_CHOICES)
+                if response is not None else True)
 
     def _get_cache_ttl(self, request, response):
         """
@@ -105,6 +218,101 @@ class HttpClient(requests.Session):
             auth=auth, timeout=timeout, allow_redirects=allow_redirects, proxies=proxies,
             hooks=hooks, stream=stream, verify=verify, cert=cert, json=json)
 
+    def map(self, requests, concurrency=None):
+        """
+        Send several requests in parallel.
+        Each request is sent with `request` method, so it's measured, cached and retried
+        the same way as a single request.
+
+        Usage:
+        responses = http_client.map([('GET', url1), ('GET', url2, {'params': {'id': 1}}),
+                                     {'method': 'POST', 'url': url3, 'json': data}])
+
+        :param requests: request list. Each request is a dictionary of `request` method arguments
+            or a tuple (method, url) or (method, url, kwargs)
+        :param concurrency: max count of parallel requests.
+            It can't exceed concurrency of the client that is a size of its connection pool.
+        :return: list of responses in the order of requests
+        :raise: the first error of a failed request
+        """
+        return self._run_parallel(self._send_request, requests, concurrency)
+
+    def gather(self, requests, concurrency=None):
+        """
+        Send several requests in parallel like `map` does,
+        but failed request doesn't interrupt other ones.
+        :return: list of responses or exceptions in the order of requests
+        """
+        return self._run_parallel(self._try_send_request, requests, concurrency)
+
+    def paginate(self, method, url, next_request=follow_next_link, start=None, prefetch=True,
+                 checkpoint=None, checkpoint_every=DEFAULT_CHECKPOINT_PERIOD, **kwargs):
+        """
+        Stream responses of a paginated list request.
+        Next page is requested in background while current page is processed.
+
+        Usage:
+        for response in http_client.paginate('GET', url, params={'limit': 100}):
+            for item in response.json():
+                yield item
+
+        :param method: request method
+        :param url: url of the first page
+        :param next_request: function(response) that returns a request of next page
+            as a dictionary of `request` arguments that update the first page request,
+            or None if it's the last page. Follows `next` link of Link header by default.
+        :param start: a request update to start from, e.g. a checkpoint of previous stream
+        :param prefetch: request next page in background
+        :param checkpoint: function(request_update) that saves the stream position,
+            see pypipes.service.paginator.Paginator
+        :param checkpoint_every: checkpoint the position once in this count of pages
+        :param kwargs: `request` arguments of the first page
+        :return: iterator of responses
+        :rtype: pypipes.service.paginator.Paginator
+        """
+        def fetch_page(request_update):
+            request_args = dict(kwargs, method=method, url=url)
+            request_args.update(request_update or {})
+            response = self._send_request(request_args)
+            response.raise_for_status()
+            return response
+
+        return Paginator(fetch_page, next_request, token=start, prefetch=prefetch,
+                         checkpoint=checkpoint, checkpoint_every=checkpoint_every)
+
+    def _send_request(self, request_args):
+        if isinstance(request_args, dict):
+            return self.request(**request_args)
+        method, url = request_args[:2]
+        kwargs = request_args[2] if len(request_args) > 2 else {}
+        return self.request(method, url, **kwargs)
+
+    def _try_send_request(self, request_args):
+        try:
+            return self._send_request(request_args)
+        except Exception as e:
+            return e
+
+    def _run_parallel(self, func, requests, concurrency=None):
+        requests = list(requests)
+        pool_size = min(concurrency or self._concurrency, self._concurrency, len(requests))
+        if pool_size <= 1:
+            return [func(request_args) for request_args in requests]
+
+        if _is_gevent_patched():
+            # threads are greenlets if gevent has patched the threading,
+            # gevent pool is a lighter way to run them
+            import gevent.pool
+            pool = gevent.pool.Pool(pool_size)
+            return pool.map(func, requests)
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(pool_size)
+        try:
+            return pool.map(func, requests, chunksize=1)
+        finally:
+            pool.close()
+
     def send(self, request, **kwargs):
         if not hasattr(request, 'metric_tags'):
             # request is not properly prepared. Maybe it's a redirected request.
@@ -113,9 +321,16 @@ class HttpClient(requests.Session):
         steam = kwargs.get('stream')
 
         # Check cache to see if we've looked this up already
-        cached = not steam and self._cached_response(request)
-        if cached:
-            return cached
+        cached = None if steam else self._cached_response(request)
+        if cached is not None:
+            if cached.is_fresh():
+                return cached.to_response(request, HttpResponse)
+            # ask the server if stale response is still valid
+            request.headers.update(cached.validators())
+
+        if self._circuit_breaker:
+            # raise CircuitOpenException if the api is failing now
+            self._circuit_breaker.check()
 
         tags = dict(request.metric_tags)
         retries = 0
@@ -124,29 +339,94 @@ class HttpClient(requests.Session):
             start = time.time()
             try:
                 result = HttpResponse.wrap(super(HttpClient, self).send(request, **kwargs))
-                if ((result.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR or
-                        result.status_code == HTTPStatus.REQUEST_TIMEOUT) and
-                        retries <= self._max_retries):
-                    # retry request
-                    tags['retries'] = retries
-                    continue
-                if self._metrics:
-                    tags['status'] = result.status_code
-                    self._metrics.timing(self.request_latency_metric_name,
-                                         (time.time() - start) * 1000, tags=tags)
-                if not steam:
-                    self._cache_response(request, result)
-                return result
             except Exception as e:
                 if retries <= self._max_retries:
                     tags['retries'] = retries
+                    self._retry_policy.sleep(retries)
                     continue
+                if self._circuit_breaker:
+                    self._circuit_breaker.failure()
                 if self._metrics:
                     tags['error'] = e.__class__.__name__
                     self._metrics.timing(self.request_latency_metric_name,
                                          (time.time() - start) * 1000, tags=tags)
                 raise
 
+            retry_in = None
+            if self._retry_policy.is_retriable(result):
+                retry_in = self._retry_policy.get_delay(retries, result)
+                if retries <= self._max_retries and retry_in <= self._retry_policy.max_wait:
+                    # retry request
+                    tags['retries'] = retries
+                    time.sleep(retry_in)
+                    continue
+            if self._circuit_breaker:
+                if result.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+                    self._circuit_breaker.failure()
+                else:
+                    self._circuit_breaker.success()
+            if self._metrics:
+                tags['status'] = result.status_code
+                self._metrics.timing(self.request_latency_metric_name,
+                                     (time.time() - start) * 1000, tags=tags)
+            if result.status_code == TOO_MANY_REQUESTS:
+                # api asks to slow down, retry the message later
+                raise TooManyRequestsError(
+                    'Too many requests to {}'.format(tags.get('api_name')),
+                    retry_in=retry_in, response=result, request=request)
+            if cached is not None and result.status_code == HTTPStatus.NOT_MODIFIED:
+                return self._revalidated_response(request, cached, result)
+            if not steam:
+                self._cache_response(request, result)
+            return result
+
+
+class AsyncHttpClient(HttpClient):
+    """
+    Non-blocking version of HttpClient.
+    Every request method returns a future of a response immediately
+    and the request is sent by a worker of the client.
+    Requests are measured, cached and retried the same way as HttpClient does it.
+
+    Usage:
+    futures = [http_client.get(url) for url in urls]
+    ...  # do some other work while responses are being received
+    responses = [future.result() for future in futures]
+
+    A future may also be awaited in a coroutine with `asyncio.wrap_future(future)`
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Accepts HttpClient arguments.
+        Client concurrency is a count of worker threads that send requests
+        and a size of connection pool that keeps alive connections to a host.
+        Workers are greenlets if gevent has patched the threading.
+        """
+        super(AsyncHttpClient, self).__init__(*args, **kwargs)
+        self._executor = ThreadPoolExecutor(self._concurrency)
+
+    def request(self, *args, **kwargs):
+        """
+        Send a request in background
+        :return: future of a response
+        :rtype: concurrent.futures.Future
+        """
+        return self._executor.submit(super(AsyncHttpClient, self).request, *args, **kwargs)
+
+    def _send_request(self, request_args):
+        # map and gather wait for their responses anyway
+        return super(AsyncHttpClient, self)._send_request(request_args).result()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        super(AsyncHttpClient, self).close()
+
+
+def _is_gevent_patched():
+    monkey = sys.modules.get('gevent.monkey')
+    return bool(monkey and monkey.is_module_patched('socket'))
+
 
 class HttpResponse(requests.models.Response):
     sensitive_headers = ['Authorization']
@@ -222,7 +502,15 @@ class ExtendedHTTPError(ExtendedException, requests.HTTPError):
     pass
 
 
-def create_http_client(http_client_name=None, metrics=None, cache=None, config=None):
+class TooManyRequestsError(RetryMessageException, ExtendedHTTPError):
+    """
+    Api responded with 429 (Too Many Requests) status.
+    The error is a RetryMessageException, so a processor message is retried later
+    in `retry_in` seconds or a processor is suspended if it's wrapped with `suspended_guard`.
+    """
+
+
+def create_http_client(http_client_name=None, metrics=None, cache=None, config=None, lock=None):
     """
     Initialize an http client
 
@@ -231,7 +519,15 @@ def create_http_client(http_client_name=None, metrics=None, cache=None, config=N
         'default': {
             'cache': {'enabled': True,
                       'ttl': 600},
-            'max_retries': 5
+            'max_retries': 5,
+            'retry': {'backoff': 0.1,  # first retry delay
+                      'max_backoff': 10,
+                      'max_wait': 5},  # don't wait for a longer Retry-After
+            'circuit_breaker': {'enabled': True,
+                                'failure_threshold': 5,
+                                'recovery_time': 30},
+            'concurrency': 20,
+            'async': False  # set True to create an AsyncHttpClient
             }
     })
 
@@ -239,13 +535,19 @@ def create_http_client(http_client_name=None, metrics=None, cache=None, config=N
     :type metrics: pypipes.service.metric.IMetrics
     :type cache: pypipes.context.pool.IContextPool[ICache]
     :type config: pypipes.config.Config
+    :param lock: lock service pool, lock.circuit_breaker shares circuit breaker state
+    :type lock: pypipes.context.pool.IContextPool[pypipes.service.lock.ILock]
     :return: http client context for infrastructure
-    :rtype: HttpClient
+    :rtype: HttpClient | AsyncHttpClient
     """
     client_config = config and config.requests.get_section(http_client_name or 'default')
     cache_ttl = None
     max_retries = 0
+    concurrency = None
     client_cache = None
+    retry_policy = None
+    circuit_breaker = None
+    client_class = HttpClient
     api_name = http_client_name
 
     if client_config:
@@ -253,13 +555,24 @@ def create_http_client(http_client_name=None, metrics=None, cache=None, config=N
             client_cache = cache.http
             cache_ttl = client_config.cache.get('ttl')
         max_retries = client_config.get('max_retries')
+        concurrency = client_config.get('concurrency')
         api_name = client_config.get('api_name', api_name)
-
-    return HttpClient(api_name=api_name,
-                      metrics=metrics,
-                      cache=client_cache,
-                      cache_ttl=cache_ttl,
-                      max_retries=max_retries)
+        retry_policy = RetryPolicy(**client_config.retry)
+        breaker_config = dict(client_config.circuit_breaker)
+        if lock and breaker_config.pop('enabled', False):
+            circuit_breaker = CircuitBreaker(lock.circuit_breaker, api_name or 'default',
+                                             **breaker_config)
+        if client_config.get('async'):
+            client_class = AsyncHttpClient
+
+    return client_class(api_name=api_name,
+                        metrics=metrics,
+                        cache=client_cache,
+                        cache_ttl=cache_ttl,
+                        max_retries=max_retries,
+                        concurrency=concurrency,
+                        retry_policy=retry_policy,
+                        circuit_breaker=circuit_breaker)
 
 
 http_client_context = LazyContext(create_http_client)
@@ -1,6 +1,10 @@
 import logging
+import math
+import time
+import uuid
+from collections import deque
 from datetime import datetime, timedelta
-from threading import Lock
+from threading import Condition, Lock
 
 from pypipes.context.config import client_config
 from pypipes.service.base import ComplexKey
@@ -11,6 +15,21 @@ from pypipes.context.factory import ContextPoolFactory, LazyContextPoolFactory
 logger = logging.getLogger(__name__)
 
 
+def _get_wait_time(lock_time, deadline):
+    """
+    Calculate how long a lock waiter may sleep
+    :param lock_time: lock expiration time in seconds or True if lock never expires
+    :param deadline: wait deadline timestamp or None if wait is infinite
+    :return: wait time in seconds, None - wait infinitely, 0 - deadline is reached
+    """
+    # wake up when the lock expires if nobody releases it
+    wait_time = lock_time if lock_time and lock_time is not True else None
+    if deadline:
+        remaining = max(deadline - time.time(), 0)
+        wait_time = remaining if wait_time is None else min(wait_time, remaining)
+    return wait_time
+
+
 class ILock(object):
 
     def acquire(self, name, expire_in=None):
@@ -61,12 +80,67 @@ class ILock(object):
         """
         raise NotImplementedError()
 
+    def wait(self, name, timeout=None):
+        """
+        Block until the lock is released or expired
+        :param name: lock name
+        :param timeout: max wait time in seconds. None - wait infinitely
+        :return: True if lock is not set anymore, False if timeout expired
+        """
+        raise NotImplementedError()
+
+    def acquire_wait(self, name, expire_in=None, timeout=None):
+        """
+        Acquire a lock waiting till it's released by current owner.
+        Waiters acquire the lock in FIFO order.
+        :param name: lock name
+        :param expire_in: lock expiration time in seconds
+        :param timeout: max wait time in seconds. None - wait infinitely
+        :return: True if lock was acquired, False if timeout expired
+        """
+        raise NotImplementedError()
+
+    def acquire_token(self, name, expire_in=None):
+        """
+        Try to acquire a lock and get a fencing token.
+        Fencing tokens of a lock increase with every acquisition,
+        so a storage may reject writes of a lock owner that has already lost the lock.
+        :param name: lock name
+        :param expire_in: lock expiration time in seconds
+        :return: fencing token if lock was successfully acquired, otherwise None
+        :rtype: int
+        """
+        raise NotImplementedError()
+
+    def renew(self, name, token, expire_in):
+        """
+        Prolong the lock if it's still owned by the token owner
+        :param name: lock name
+        :param token: fencing token returned by acquire_token
+        :param expire_in: lock expiration time in seconds
+        :return: True if lock is prolonged, False if lock is lost
+        """
+        raise NotImplementedError()
+
+    def release_token(self, name, token):
+        """
+        Release the lock if it's still owned by the token owner
+        :param name: lock name
+        :param token: fencing token returned by acquire_token
+        :return: True if lock released, False if lock is lost
+        """
+        raise NotImplementedError()
+
 
 class MemLock(ILock):
     def __init__(self):
         super(MemLock, self).__init__()
         self._locks = {}
+        self._owners = {}  # lock key => fencing token of lock owner
+        self._tokens = {}  # lock key => last issued fencing token
+        self._queues = {}  # lock key => FIFO queue of lock waiters
         self._sync = Lock()
+        self._released = Condition(self._sync)
 
     def acquire(self, key, expire_in=None):
         with self._sync:
@@ -79,6 +153,7 @@ class MemLock(ILock):
     def set(self, key, expire_in=None):
         with self._sync:
             self._set_lock(key, expire_in)
+            self._owners.pop(key, None)
 
     def get(self, key):
         with self._sync:
@@ -96,11 +171,73 @@ class MemLock(ILock):
     def release(self, key):
         with self._sync:
             if self._get_lock(key):
-                del self._locks[key]
+                self._release_lock(key)
                 return True
             else:
                 return False
 
+    def acquire_token(self, key, expire_in=None):
+        with self._sync:
+            if self._get_lock(key):
+                return None
+            self._set_lock(key, expire_in)
+            token = self._tokens[key] = self._tokens.get(key, 0) + 1
+            self._owners[key] = token
+            return token
+
+    def renew(self, key, token, expire_in):
+        with self._sync:
+            if self._get_lock(key) and self._owners.get(key) == token:
+                self._set_lock(key, expire_in)
+                return True
+            return False
+
+    def release_token(self, key, token):
+        with self._sync:
+            if self._get_lock(key) and self._owners.get(key) == token:
+                self._release_lock(key)
+                return True
+            return False
+
+    def wait(self, key, timeout=None):
+        deadline = timeout and time.time() + timeout
+        with self._sync:
+            while True:
+                lock_time = self._get_lock(key)
+                if not lock_time:
+                    return True
+                wait_time = _get_wait_time(lock_time, deadline)
+                if wait_time == 0:
+                    return False
+                self._released.wait(wait_time)
+
+    def acquire_wait(self, key, expire_in=None, timeout=None):
+        deadline = timeout and time.time() + timeout
+        with self._sync:
+            if not self._queues.get(key) and not self._get_lock(key):
+                self._set_lock(key, expire_in)
+                return True
+
+            ticket = object()
+            queue = self._queues.setdefault(key, deque())
+            queue.append(ticket)
+            try:
+                while True:
+                    lock_time = self._get_lock(key)
+                    if not lock_time and queue[0] is ticket:
+                        self._set_lock(key, expire_in)
+                        return True
+                    wait_time = _get_wait_time(lock_time, deadline)
+                    if wait_time == 0:
+                        return False
+                    self._released.wait(wait_time)
+            finally:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[key]
+                # let next waiter check the lock
+                self._released.notify_all()
+
     def _get_lock(self, key):
         lock_timeout = self._locks.get(key)
         if not lock_timeout:
@@ -112,15 +249,62 @@ class MemLock(ILock):
         else:
             # lock expired
             del self._locks[key]
+            self._owners.pop(key, None)
             return False
 
+    def _release_lock(self, key):
+        del self._locks[key]
+        self._owners.pop(key, None)
+        self._released.notify_all()
+
     def _set_lock(self, key, expire_in=None):
         self._locks[key] = (datetime.now() + timedelta(seconds=expire_in)
                             if expire_in else True)
 
 
+def _now_ms():
+    return int(time.time() * 1000)
+
+
 class RedisLock(RedisClient, ComplexKey, ILock):
     lua_get = None
+    lua_release = None
+    lua_acquire_token = None
+    lua_renew = None
+    lua_release_token = None
+    lua_acquire_wait = None
+    lua_leave_queue = None
+
+    # max wait time of acquire_wait, it's used when timeout is not set
+    MAX_WAIT_TIME = 3600
+    # a waiter keeps its place in the queue while it renews its lease at least once in this time
+    WAITER_LEASE = 10
+
+    # lua functions to manage a FIFO queue of lock waiters.
+    # Each waiter is a "<wait deadline in ms>:<unique id>" string in the queue list,
+    # it's alive while "<queue>:<waiter>:lease" key exists
+    # and is notified about lock release by a push into "<queue>:<waiter>" list.
+    LUA_WAITER_FUNCTIONS = """
+             local function get_first_waiter(queue, now)
+                 -- drop waiters that have already given up or have crashed
+                 local waiter = redis.call('lindex', queue, 0)
+                 while waiter and (tonumber(string.match(waiter, '^(%d+):')) <= now or
+                                   redis.call('exists', queue .. ':' .. waiter .. ':lease') == 0) do
+                     redis.call('lpop', queue)
+                     redis.call('del', queue .. ':' .. waiter)
+                     waiter = redis.call('lindex', queue, 0)
+                 end
+                 return waiter
+             end
+
+             local function notify_waiter(queue, now)
+                 local waiter = get_first_waiter(queue, now)
+                 if waiter then
+                     redis.call('rpush', queue .. ':' .. waiter, 1)
+                     redis.call('pexpire', queue .. ':' .. waiter, 60000)
+                 end
+             end
+         """
 
     # KEYS[1] - lock name
     # return TTL value if lock has expiration time
@@ -138,6 +322,103 @@ class RedisLock(RedisClient, ComplexKey, ILock):
              return expiration
          """
 
+    # KEYS[1] - lock name, KEYS[2] - waiters queue
+    # ARGV[1] - current time in milliseconds
+    # notify lock waiters via a lock name channel and first waiter in the queue
+    # return 1 if lock released, 0 if lock not found
+    LUA_RELEASE_SCRIPT = """
+             local result = redis.call('del', KEYS[1])
+             if result == 1 then
+                 redis.call('publish', KEYS[1], 'released')
+                 notify_waiter(KEYS[2], tonumber(ARGV[1]))
+             end
+             return result
+         """
+
+    # KEYS[1] - lock name, KEYS[2] - waiters queue
+    # ARGV[1] - waiter, ARGV[2] - current time in milliseconds,
+    # ARGV[3] - expiration time in milliseconds, 0 - no expiration
+    # ARGV[4] - waiter lease time in milliseconds
+    # return 1 if lock acquired, 0 if lock is set or other waiter is first in the queue
+    LUA_ACQUIRE_WAIT_SCRIPT = """
+             local now = tonumber(ARGV[2])
+             local lease = KEYS[2] .. ':' .. ARGV[1] .. ':lease'
+             local waiter = get_first_waiter(KEYS[2], now)
+             if redis.call('exists', KEYS[1]) == 0 and (not waiter or waiter == ARGV[1]) then
+                 if waiter then
+                     redis.call('lpop', KEYS[2])
+                 end
+                 redis.call('del', KEYS[2] .. ':' .. ARGV[1], lease)
+                 if ARGV[3] == '0' then
+                     redis.call('set', KEYS[1], 1)
+                 else
+                     redis.call('set', KEYS[1], 1, 'px', ARGV[3])
+                 end
+                 return 1
+             end
+             -- renew the waiter lease, the waiter is queued again if its lease has expired
+             if redis.call('set', lease, 1, 'px', ARGV[4], 'xx') == false then
+                 redis.call('set', lease, 1, 'px', ARGV[4])
+                 redis.call('rpush', KEYS[2], ARGV[1])
+                 local ttl = tonumber(string.match(ARGV[1], '^(%d+):')) - now
+                 if redis.call('pttl', KEYS[2]) < ttl then
+                     redis.call('pexpire', KEYS[2], ttl)
+                 end
+             end
+             return 0
+         """
+
+    # KEYS[1] - lock name, KEYS[2] - waiters queue
+    # ARGV[1] - waiter, ARGV[2] - current time in milliseconds
+    # remove the waiter from the queue and pass the turn to next waiter if lock is free
+    LUA_LEAVE_QUEUE_SCRIPT = """
+             redis.call('lrem', KEYS[2], 0, ARGV[1])
+             redis.call('del', KEYS[2] .. ':' .. ARGV[1], KEYS[2] .. ':' .. ARGV[1] .. ':lease')
+             if redis.call('exists', KEYS[1]) == 0 then
+                 notify_waiter(KEYS[2], tonumber(ARGV[2]))
+             end
+             return 1
+         """
+
+    # KEYS[1] - lock name, KEYS[2] - fencing token counter
+    # ARGV[1] - expiration time in milliseconds, 0 - no expiration
+    # return fencing token if lock acquired, 0 if lock is already set
+    LUA_ACQUIRE_TOKEN_SCRIPT = """
+             if redis.call('exists', KEYS[1]) == 1 then
+                 return 0
+             end
+             local token = redis.call('incr', KEYS[2])
+             if ARGV[1] == '0' then
+                 redis.call('set', KEYS[1], token)
+             else
+                 redis.call('set', KEYS[1], token, 'px', ARGV[1])
+             end
+             return token
+         """
+
+    # KEYS[1] - lock name
+    # ARGV[1] - fencing token, ARGV[2] - expiration time in milliseconds
+    # return 1 if lock prolonged, 0 if lock is owned by someone else or not found
+    LUA_RENEW_SCRIPT = """
+             if redis.call('get', KEYS[1]) == ARGV[1] then
+                 return redis.call('pexpire', KEYS[1], ARGV[2])
+             end
+             return 0
+         """
+
+    # KEYS[1] - lock name, KEYS[2] - waiters queue
+    # ARGV[1] - fencing token, ARGV[2] - current time in milliseconds
+    # return 1 if lock released, 0 if lock is owned by someone else or not found
+    LUA_RELEASE_TOKEN_SCRIPT = """
+             if redis.call('get', KEYS[1]) == ARGV[1] then
+                 redis.call('del', KEYS[1])
+                 redis.call('publish', KEYS[1], 'released')
+                 notify_waiter(KEYS[2], tonumber(ARGV[2]))
+                 return 1
+             end
+             return 0
+         """
+
     def __init__(self, prefix=None, client=None, **kwargs):
         ComplexKey.__init__(self, prefix)
         RedisClient.__init__(self, client=client, **kwargs)
@@ -147,6 +428,22 @@ class RedisLock(RedisClient, ComplexKey, ILock):
     def register_scripts(cls, redis):
         if cls.lua_get is None:
             cls.lua_get = redis.register_script(cls.LUA_GET_SCRIPT)
+        if cls.lua_release is None:
+            cls.lua_release = redis.register_script(cls.LUA_WAITER_FUNCTIONS +
+                                                    cls.LUA_RELEASE_SCRIPT)
+        if cls.lua_acquire_wait is None:
+            cls.lua_acquire_wait = redis.register_script(cls.LUA_WAITER_FUNCTIONS +
+                                                         cls.LUA_ACQUIRE_WAIT_SCRIPT)
+        if cls.lua_leave_queue is None:
+            cls.lua_leave_queue = redis.register_script(cls.LUA_WAITER_FUNCTIONS +
+                                                        cls.LUA_LEAVE_QUEUE_SCRIPT)
+        if cls.lua_acquire_token is None:
+            cls.lua_acquire_token = redis.register_script(cls.LUA_ACQUIRE_TOKEN_SCRIPT)
+        if cls.lua_renew is None:
+            cls.lua_renew = redis.register_script(cls.LUA_RENEW_SCRIPT)
+        if cls.lua_release_token is None:
+            cls.lua_release_token = redis.register_script(cls.LUA_WAITER_FUNCTIONS +
+                                                          cls.LUA_RELEASE_TOKEN_SCRIPT)
 
     def acquire(self, name, expire_in=None):
         key = self.format_key(name)
@@ -181,7 +478,81 @@ class RedisLock(RedisClient, ComplexKey, ILock):
     def release(self, name):
         key = self.format_key(name)
         logger.debug('Release lock: %s', key)
-        return bool(self.redis.delete(key))
+        return bool(self.lua_release(keys=[key, self.format_key(name, 'queue')],
+                                     args=[_now_ms()],
+                                     client=self.redis))
+
+    def wait(self, name, timeout=None):
+        key = self.format_key(name)
+        logger.debug('Wait lock: %s', key)
+        deadline = timeout and time.time() + timeout
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            # subscribe before lock check to not miss a release notification
+            pubsub.subscribe(key)
+            while True:
+                lock_time = self.get(name)
+                if not lock_time:
+                    return True
+                wait_time = _get_wait_time(lock_time, deadline)
+                if wait_time == 0:
+                    return False
+                pubsub.get_message(timeout=wait_time)
+        finally:
+            pubsub.close()
+
+    def acquire_wait(self, name, expire_in=None, timeout=None):
+        """
+        Acquire a lock waiting till it's released by current owner.
+        Waiters acquire the lock in FIFO order and are woken up by BLPOP
+        from a personal notification list.
+        A waiter renews its lease in the queue at least every WAITER_LEASE / 2 seconds,
+        so a crashed waiter blocks the queue for WAITER_LEASE seconds at most.
+        :param timeout: max wait time in seconds. None - wait up to MAX_WAIT_TIME
+        """
+        key = self.format_key(name)
+        queue_key = self.format_key(name, 'queue')
+        logger.debug('Wait and set lock: %s', key)
+        deadline = time.time() + (self.MAX_WAIT_TIME if timeout is None else timeout)
+        waiter = '{}:{}'.format(int(deadline * 1000), uuid.uuid4().hex)
+        expiration = int(expire_in * 1000) if expire_in else 0
+        lease = int(self.WAITER_LEASE * 1000)
+        while True:
+            if self.lua_acquire_wait(keys=[key, queue_key],
+                                     args=[waiter, _now_ms(), expiration, lease],
+                                     client=self.redis):
+                return True
+            wait_time = _get_wait_time(self.get(name), deadline)
+            if wait_time == 0:
+                self.lua_leave_queue(keys=[key, queue_key], args=[waiter, _now_ms()],
+                                     client=self.redis)
+                return False
+            # BLPOP timeout has to be an integer number of seconds,
+            # the waiter wakes up in time to renew its lease
+            self.redis.blpop(['{}:{}'.format(queue_key, waiter)],
+                             timeout=int(math.ceil(min(wait_time, self.WAITER_LEASE / 2.0))))
+
+    def acquire_token(self, name, expire_in=None):
+        key = self.format_key(name)
+        logger.debug('Set lock with fencing token: %s', key)
+        timeout = int(expire_in * 1000) if expire_in else 0
+        token = self.lua_acquire_token(keys=[key, self.format_key(name, 'token')],
+                                       args=[timeout],
+                                       client=self.redis)
+        return int(token) or None
+
+    def renew(self, name, token, expire_in):
+        key = self.format_key(name)
+        logger.debug('Renew lock: %s', key)
+        return bool(self.lua_renew(keys=[key], args=[token, int(expire_in * 1000)],
+                                   client=self.redis))
+
+    def release_token(self, name, token):
+        key = self.format_key(name)
+        logger.debug('Release lock: %s', key)
+        return bool(self.lua_release_token(keys=[key, self.format_key(name, 'queue')],
+                                           args=[token, _now_ms()],
+                                           client=self.redis))
 
 
 memory_lock_pool = ContextPoolFactory(lambda name: MemLock())
@@ -143,7 +143,12 @@ class DataDogMetrics(IMetrics):
         :type tags: dict
         """
         self.default_tags = tags
-        self.client = get_datadog_statsd(config)
+        self._config = config
+
+    @property
+    def client(self):
+        # datadog is imported when a first metric is sent
+        return get_datadog_statsd(self._config)
 
     def _format_tags(self, tags=None):
         if tags:
@@ -1,22 +1,35 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import stat
+import sys
+import tempfile
+from copy import copy
+from threading import Lock
+
 try:
     from urlparse import urljoin
 except ImportError:
     from urllib.parse import urljoin
 
-from bravado.client import SwaggerClient
-from bravado.requests_client import RequestsClient
 from pypipes.exceptions import InvalidConfigException
 from pypipes.service.http_client import HttpClient, extract_api_name
+from pypipes.service.paginator import Paginator, DEFAULT_CHECKPOINT_PERIOD
 
 from pypipes.context.factory import LazyContextPoolFactory
 
+logger = logging.getLogger(__name__)
+
 
 def create_client(url,
                   api_name=None, use_models=False,
                   metrics=None, cache=None,
                   operation_cache_ttl=None,
                   operation_cache_ttl_map=None,
-                  max_retries=3):
+                  max_retries=3,
+                  spec_cache_dir=None):
     """
     Creates a thin client for accessing OpenAPI-based services
     :param url: api root or url of open_api specification. Example 'http://localhost:80/'
@@ -30,7 +43,15 @@ def create_client(url,
         otherwise `operation_cache_ttl` value is used
     :type operation_cache_ttl_map: dict[str, int]
     :param use_models: use Python classes (models) instead of dicts
+    :param spec_cache_dir: local directory where parsed specifications are saved,
+        so a next worker process doesn't parse the specification again.
+        Saved specifications are unpickled, so the directory must be owned by the worker user
+        and not writable by other users, otherwise it's ignored.
+    :rtype: pypipes.service.swagger_client.ApiClient
     """
+    # bravado is imported when a first client is created
+    from pypipes.service.swagger_client import ApiClient, OperationRequestsClient
+
     if api_name is None:
         api_name = extract_api_name(url)
     url = urljoin(url, 'swagger.json')
@@ -41,8 +62,176 @@ def create_client(url,
                                          operation_cache_ttl=operation_cache_ttl,
                                          operation_cache_ttl_map=operation_cache_ttl_map,
                                          max_retries=max_retries)
-    return SwaggerClient.from_url(url, http_client=http_client,
-                                  config={'use_models': use_models})
+    swagger_spec = spec_registry.get_spec(url, http_client, config={'use_models': use_models},
+                                          cache_dir=spec_cache_dir)
+    return ApiClient(swagger_spec, http_client)
+
+
+class SpecRegistry(object):
+    """
+    Process-wide registry of parsed OpenAPI specifications.
+
+    Specification parsing and validation takes a while,
+    so each specification is parsed once and shared by all clients of the api.
+    Parsed specification may be saved into a private local directory
+    where it's found by a content hash of the specification.
+    """
+    def __init__(self):
+        self._specs = {}
+        self._spec_locks = {}  # spec key => lock held while the specification is loaded
+        self._sync = Lock()
+
+    def clear(self):
+        with self._sync:
+            self._specs.clear()
+
+    def get_spec(self, url, http_client, config=None, cache_dir=None):
+        """
+        Get parsed specification
+        :param url: specification url
+        :param http_client: http client that loads the specification
+        :type http_client: bravado.http_client.HttpClient
+        :param config: bravado config
+        :param cache_dir: local directory of parsed specifications
+        :rtype: bravado_core.spec.Spec
+        """
+        config = dict(config or {})
+        spec_key = (url, json.dumps(config, sort_keys=True))
+        with self._sync:
+            swagger_spec = self._specs.get(spec_key)
+            if swagger_spec is not None:
+                return swagger_spec
+            spec_lock = self._spec_locks.setdefault(spec_key, Lock())
+
+        # a slow specification download doesn't block clients of other apis
+        with spec_lock:
+            with self._sync:
+                swagger_spec = self._specs.get(spec_key)
+            if swagger_spec is None:
+                swagger_spec = self._load_spec(url, http_client, config, cache_dir)
+                with self._sync:
+                    self._specs[spec_key] = swagger_spec
+                    self._spec_locks.pop(spec_key, None)
+        return swagger_spec
+
+    def _load_spec(self, url, http_client, config, cache_dir):
+        from bravado.client import SwaggerClient
+        from bravado.swagger_model import Loader
+        from bravado_core import version as bravado_core_version
+
+        spec_dict = Loader(http_client).load_spec(url)
+        spec_path = None
+        if cache_dir and self._is_private_dir(cache_dir):
+            content = json.dumps([spec_dict, config, bravado_core_version], sort_keys=True)
+            spec_path = os.path.join(
+                cache_dir, '{}.spec'.format(hashlib.sha1(content.encode('utf-8')).hexdigest()))
+            swagger_spec = self._read_spec(spec_path)
+            if swagger_spec:
+                swagger_spec.http_client = http_client
+                swagger_spec.origin_url = url
+                return swagger_spec
+
+        swagger_spec = SwaggerClient.from_spec(spec_dict, url, http_client, config).swagger_spec
+        if spec_path:
+            self._write_spec(spec_path, swagger_spec)
+        return swagger_spec
+
+    @staticmethod
+    def _is_private_dir(cache_dir):
+        # parsed specifications are unpickled,
+        # so other users must not be able to put a file into the directory
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir, 0o700)
+            dir_stat = os.stat(cache_dir)
+        except OSError:
+            logger.exception('Failed to create a specification cache directory %s', cache_dir)
+            return False
+        if ((hasattr(os, 'getuid') and dir_stat.st_uid != os.getuid()) or
+                dir_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+            logger.warning('Specification cache directory %s is ignored, '
+                           'it has to be owned and writable by current user only', cache_dir)
+            return False
+        return True
+
+    @staticmethod
+    def _read_spec(spec_path):
+        if not os.path.exists(spec_path):
+            return None
+        try:
+            with open(spec_path, 'rb') as spec_file:
+                return pickle.load(spec_file)
+        except Exception:
+            logger.exception('Failed to read a parsed specification from %s', spec_path)
+            return None
+
+    @staticmethod
+    def _write_spec(spec_path, swagger_spec):
+        # http client is not a part of specification and may be not serializable
+        swagger_spec = copy(swagger_spec)
+        swagger_spec.http_client = None
+        spec_dir = os.path.dirname(spec_path)
+        try:
+            # write a temporary file and rename it, so other processes never read a partial file
+            with tempfile.NamedTemporaryFile(dir=spec_dir, delete=False) as spec_file:
+                pickle.dump(swagger_spec, spec_file, pickle.HIGHEST_PROTOCOL)
+            os.rename(spec_file.name, spec_path)
+        except Exception:
+            logger.exception('Failed to save a parsed specification into %s', spec_path)
+
+
+spec_registry = SpecRegistry()
+
+
+if sys.version_info < (3, 7):
+    # module __getattr__ is not supported, so the moved class is imported eagerly
+    from pypipes.service.swagger_client import OperationRequestsClient  # noqa: F401
+else:
+    def __getattr__(name):
+        """
+        Import OperationRequestsClient moved to pypipes.service.swagger_client on first use,
+        so bravado is not imported with this module (PEP 562)
+        """
+        if name == 'OperationRequestsClient':
+            from pypipes.service.swagger_client import OperationRequestsClient
+            return OperationRequestsClient
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def paginate_operation(operation, next_token, token_param='cursor', start=None, prefetch=True,
+                       checkpoint=None, checkpoint_every=DEFAULT_CHECKPOINT_PERIOD, **op_kwargs):
+    """
+    Stream results of a paginated list operation.
+    Next page is requested in background while current page is processed.
+
+    Usage:
+    pages = paginate_operation(api.items.list_items, lambda result: result['next_cursor'],
+                               token_param='cursor', limit=100)
+    for result in pages:
+        for item in result['items']:
+            yield item
+
+    :param operation: api operation
+    :param next_token: function(result) that returns a token of next page
+        or None if it's the last page
+    :param token_param: name of operation parameter that receives the page token
+    :param start: token of the first page, e.g. a checkpoint of previous stream
+    :param prefetch: request next page in background
+    :param checkpoint: function(token) that saves the stream position,
+        see pypipes.service.paginator.Paginator
+    :param checkpoint_every: checkpoint the position once in this count of pages
+    :param op_kwargs: operation parameters
+    :return: iterator of operation results
+    :rtype: pypipes.service.paginator.Paginator
+    """
+    def fetch_page(token):
+        params = dict(op_kwargs)
+        if token is not None:
+            params[token_param] = token
+        return operation(**params).response().result
+
+    return Paginator(fetch_page, next_token, token=start, prefetch=prefetch,
+                     checkpoint=checkpoint, checkpoint_every=checkpoint_every)
 
 
 class OpenApiSession(HttpClient):
@@ -96,19 +285,6 @@ class OpenApiSession(HttpClient):
         return prepared_request
 
 
-class OperationRequestsClient(RequestsClient):
-    """
-    This RequestsClient attaches an operation ID to the request
-    for later use in OpenApiSession
-    """
-    def request(self, request_params, operation=None, request_config=None):
-        future = super(OperationRequestsClient, self).request(request_params,
-                                                              operation=operation,
-                                                              request_config=request_config)
-        future.future.request.operation_id = operation.operation_id if operation else None
-        return future
-
-
 def configure_api_client_factory(api_name, config, cache=None, metrics=None):
     """
     A factory that creates api client by its config
@@ -122,7 +298,9 @@ def configure_api_client_factory(api_name, config, cache=None, metrics=None):
             "use_models": False,
             "operation_cache_ttl_map": {
                 "api.health": 60  # cache health request for 1 min
-            }
+            },
+            # keep parsed specification in a private directory of the worker user
+            "spec_cache_dir": "/var/lib/worker/specs"
         },
         "org_profile": {
             "url": "http://localhost:80/org_profile/"
@@ -133,7 +311,7 @@ def configure_api_client_factory(api_name, config, cache=None, metrics=None):
     :type metrics: pypipes.service.metric.IMetrics
     :type cache: pypipes.context.pool.IContextPool[pypipes.service.cache.ICache]
     :return: API client
-    :rtype: SwaggerClient
+    :rtype: pypipes.service.swagger_client.ApiClient
     """
     cache = cache and cache.api  # get api cache from cache context pool
     api_config = config.api.get_section(api_name)
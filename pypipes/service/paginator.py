@@ -0,0 +1,88 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEFAULT_CHECKPOINT_PERIOD = 10  # pages
+
+
+class Paginator(object):
+    """
+    Streams pages of a list operation.
+
+    Next page is requested in background while the caller processes current page,
+    so a processor that emits messages per page doesn't wait for each page request.
+    The page token that the stream should be resumed from is passed into `checkpoint`
+    callback once in `checkpoint_every` pages, and also when a page request fails.
+
+    Usage with a cursor context:
+
+    @cursor()
+    @pipe_processor
+    def list_items(response, cursor=None):
+        pages = Paginator(fetch_page, next_token, token=cursor,
+                          checkpoint=lambda token: setattr(response, 'cursor', token))
+        for page in pages:
+            for item in page['items']:
+                yield item
+
+    Errors of page requests are raised to the processor,
+    so only RetryMessageException (e.g. TooManyRequestsError or CircuitOpenException)
+    sends the message back through a broker and the stream is resumed from the cursor.
+    """
+    def __init__(self, fetch_page, next_token, token=None, prefetch=True,
+                 checkpoint=None, checkpoint_every=DEFAULT_CHECKPOINT_PERIOD):
+        """
+        :param fetch_page: function(token) that returns a page
+        :param next_token: function(page) that returns a token of next page
+            or None if it's the last page
+        :param token: token of the first page, None - start from the beginning
+        :param prefetch: request next page in background
+        :param checkpoint: function(token) that saves a token of the stream position.
+            It receives None when the stream is complete.
+        :param checkpoint_every: checkpoint the position once in this count of pages
+        """
+        self.fetch_page = fetch_page
+        self.next_token = next_token
+        self.token = token  # token of current page
+        self.prefetch = prefetch
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+
+    def _fetch(self, executor, token):
+        if executor:
+            return executor.submit(self.fetch_page, token)
+        future = Future()
+        try:
+            future.set_result(self.fetch_page(token))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _checkpoint(self, token):
+        if self.checkpoint:
+            self.checkpoint(token)
+
+    def __iter__(self):
+        executor = ThreadPoolExecutor(1) if self.prefetch else None
+        token = self.token
+        future = self._fetch(executor, token)
+        pages = 0
+        try:
+            while future is not None:
+                try:
+                    page = future.result()
+                except Exception:
+                    # all previous pages are processed, resume from the failed page
+                    if pages:
+                        self._checkpoint(token)
+                    raise
+                next_token = self.next_token(page)
+                future = None if next_token is None else self._fetch(executor, next_token)
+                self.token = token
+                yield page
+                pages += 1
+                token = next_token
+                if future is not None and pages % self.checkpoint_every == 0:
+                    self._checkpoint(token)
+            self._checkpoint(None)
+        finally:
+            if executor:
+                executor.shutdown(wait=False)
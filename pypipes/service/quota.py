@@ -31,6 +31,7 @@ class UnlimitedQuota(IQuota):
 
 class Quota(IQuota):
     _repr_period = None
+    period_key = None  # distinguishes counters of several quotas combined in a MultiQuota
 
     def __init__(self, quota_name, rate_counter, limit, threshold):
         """
@@ -44,14 +45,19 @@ class Quota(IQuota):
         self._limit = limit
         self._threshold = threshold
         self._repr_period = '{} sec'.format(threshold)
+        self.period_key = '{}s'.format(threshold)
 
     def __repr__(self):
         return '{}({}, {}/{})'.format(self.__class__.__name__, self.name,
                                       self._limit, self._repr_period)
 
     def consume(self, key=None):
+        # only counters that respect a limit accept it, custom counters may not support it
+        limit = ({'limit': self._limit}
+                 if getattr(self._rate_counter, 'respects_limit', False) else {})
         value, expires_in = self._rate_counter.increment(key or 'default',
-                                                         threshold=self._threshold)
+                                                         threshold=self._threshold,
+                                                         **limit)
         if value > self._limit:
             raise QuotaExceededException(self.name,
                                          quota_name=self.name,
@@ -64,6 +70,7 @@ class HourQuota(Quota):
         super(HourQuota, self).__init__(quota_name, rate_counter, limit, self.calc_threshold)
         self._delta = timedelta(hours=hours)
         self._repr_period = '{} h'.format(hours)
+        self.period_key = '{}h'.format(hours)
 
     def calc_threshold(self):
         # calc a threshold - time in seconds till end of a hour
@@ -76,6 +83,7 @@ class DayQuota(Quota):
         super(DayQuota, self).__init__(quota_name, rate_counter, limit, self.calc_threshold)
         self._delta = timedelta(days=days)
         self._repr_period = '{} d'.format(days)
+        self.period_key = '{}d'.format(days)
 
     def calc_threshold(self):
         # calc a threshold - time in seconds till end of a hour
@@ -89,6 +97,7 @@ class MonthQuota(Quota):
         super(MonthQuota, self).__init__(quota_name, rate_counter, limit, self.calc_threshold)
         self._months = months
         self._repr_period = '{} mon'.format(months)
+        self.period_key = '{}m'.format(months)
 
     def calc_threshold(self):
         # calc a threshold - time in seconds till first day of next month
@@ -101,6 +110,45 @@ class MonthQuota(Quota):
                             day=1, month=month, year=year) - now).total_seconds()
 
 
+class MultiQuota(IQuota):
+    """
+    Several quotas (e.g. hour, day and month limits) consumed together.
+    All quota counters are incremented by one rate counter call,
+    that is a single round trip for a redis rate counter.
+    A call rejected by any quota is not counted by the others.
+    """
+    def __init__(self, quota_name, rate_counter, quotas):
+        """
+        :param quota_name: quota name
+        :type rate_counter: pypipes.service.rate_counter.IRateCounter
+        :param quotas: combined quotas
+        :type quotas: list[Quota]
+        """
+        self.name = quota_name
+        self._rate_counter = rate_counter
+        self._quotas = quotas
+
+    def __repr__(self):
+        return '{}({}, {})'.format(self.__class__.__name__, self.name,
+                                   ', '.join('{}/{}'.format(quota._limit, quota._repr_period)
+                                             for quota in self._quotas))
+
+    def consume(self, key=None):
+        counter_name = key or 'default'
+        results = self._rate_counter.increment_many(
+            [('{}:{}'.format(counter_name, quota.period_key), quota._threshold, quota._limit)
+             for quota in self._quotas])
+        retry_in = [expires_in
+                    for quota, (value, expires_in) in zip(self._quotas, results)
+                    if value > quota._limit]
+        if retry_in:
+            # retry when all exceeded quotas are renewed
+            raise QuotaExceededException(self.name,
+                                         quota_name=self.name,
+                                         quota_key=key,
+                                         retry_in=max(retry_in))
+
+
 class QuotaPool(ContextPoolFactory):
     _rate_counter_pool = None
     _config = None
@@ -123,20 +171,38 @@ class QuotaPool(ContextPoolFactory):
             return self._default_quota
         return self._create_quota_counter(quota_name, **quota_config)
 
-    def _create_quota_counter(self, quota_name, limit=0, months=0, days=0, hours=0, threshold=0):
-        if limit <= 0:
-            return UnlimitedQuota()
+    @staticmethod
+    def _get_quota_type(months=0, days=0, hours=0, threshold=0):
         if months > 0:
-            quota_class, counter_name, value = MonthQuota, 'month_quota', months
+            return MonthQuota, 'month_quota', months
         elif days > 0:
-            quota_class, counter_name, value = DayQuota, 'day_quota', days
+            return DayQuota, 'day_quota', days
         elif hours > 0:
-            quota_class, counter_name, value = HourQuota, 'hour_quota', hours
+            return HourQuota, 'hour_quota', hours
         else:
-            quota_class, counter_name, value = Quota, 'quota', threshold or 60
+            return Quota, 'quota', threshold or 60
+
+    def _create_quota_counter(self, quota_name, limit=0, months=0, days=0, hours=0, threshold=0,
+                              limits=None):
+        if limits:
+            return self._create_multi_quota(quota_name, limits)
+        if limit <= 0:
+            return UnlimitedQuota()
+        quota_class, counter_name, value = self._get_quota_type(months, days, hours, threshold)
         return quota_class(quota_name, self._rate_counter_pool[counter_name],
                            limit, value)
 
+    def _create_multi_quota(self, quota_name, limits):
+        rate_counter = self._rate_counter_pool['multi_quota']
+        quotas = []
+        for params in limits:
+            params = dict(params)
+            limit = params.pop('limit', 0)
+            if limit > 0:
+                quota_class, _, value = self._get_quota_type(**params)
+                quotas.append(quota_class(quota_name, rate_counter, limit, value))
+        return MultiQuota(quota_name, rate_counter, quotas) if quotas else UnlimitedQuota()
+
 
 def quota_pool_factory(config, rate_counter):
     """
@@ -144,7 +210,8 @@ def quota_pool_factory(config, rate_counter):
     :type config: pypipes.config.Config
     :param rate_counter: IContextPool of IRateCounter services
         QuotaPool may use 'month_quota', 'day_quota', 'hour_quota'
-        or 'quota' named service from rate_counter pool depending on quota configuration
+        or 'quota' named service from rate_counter pool depending on quota configuration.
+        A quota configured with a list of `limits` uses 'multi_quota' service
     :type rate_counter: IContextPool[pypipes.service.rate_counter.IRateCounter]
     :return: quota context pool
     :rtype: QuotaPool
@@ -1,51 +1,134 @@
+import logging
+import math
 import time
+import uuid
+from collections import deque
 from datetime import datetime, timedelta
-from threading import Lock
+from threading import Condition, Lock, Thread
 
+from pypipes.context import IContextFactory, try_apply_context
 from pypipes.context.config import client_config
 from pypipes.service.base import ComplexKey
-from pypipes.service.base_client import MemcachedClient, get_memcached_client
+from pypipes.service.base_client import MemcachedClient, RedisClient, get_memcached_client, \
+    get_redis_client
+from pypipes.service.eviction import EvictionTracker, LRU
 
 from pypipes.context.factory import ContextPoolFactory, LazyContextPoolFactory
 
+logger = logging.getLogger(__name__)
+
 
 class IRateCounter(object):
-    def increment(self, name, value=1, threshold=1):
+    respects_limit = False  # True if increments that exceed a limit are not counted
+
+    def increment(self, name, value=1, threshold=1, limit=None):
         """
         Increment a rate counter. Counter expires in `threshold` period
         :param name: counter name
         :param value: increment on value
         :param threshold: threshold period in seconds or callable that returns a threshold
+        :param limit: max counter value in threshold period.
+            Fixed window counters ignore the limit.
+            Window counters don't count an increment that exceeds the limit
+            and return a time when the increment should be retried instead of expiration time.
         :return: (counter value, time till counter expiration in seconds)
         :rtype: (int, float)
         """
         raise NotImplementedError()
 
+    def increment_many(self, counters, value=1):
+        """
+        Increment several rate counters at once.
+        Increments are counted only if none of the counters exceeds its limit,
+        otherwise all counters are left unchanged.
+        :param counters: list of (counter name, threshold, limit) tuples
+        :param value: increment on value
+        :return: list of (counter value, time till counter expiration in seconds)
+            in the same order as counters
+        :rtype: list[(int, float)]
+        """
+        def increment_one(name, value, threshold, limit):
+            # fixed window counters may not accept a limit
+            if self.respects_limit:
+                return self.increment(name, value=value, threshold=threshold, limit=limit)
+            return self.increment(name, value=value, threshold=threshold)
+
+        results = [increment_one(name, value, threshold, limit)
+                   for name, threshold, limit in counters]
+        exceeded = [limit is not None and counter > limit
+                    for (_, _, limit), (counter, _) in zip(counters, results)]
+        if any(exceeded):
+            # roll back counted increments, window counters don't count rejected ones
+            for (name, threshold, limit), rejected in zip(counters, exceeded):
+                if not (rejected and self.respects_limit):
+                    increment_one(name, -value, threshold, limit)
+        return results
+
 
 class MemoryRateCounter(IRateCounter):
-    def __init__(self):
+    def __init__(self, max_entries=None, policy=LRU, metrics=None, name=None):
+        """
+        :param max_entries: max count of active counters. None - unlimited
+            Note that an evicted counter starts a new period on next increment.
+        :param policy: eviction policy 'lru' or 'lfu'
+        :type metrics: pypipes.service.metric.IMetrics
+        :param name: rate counter service name, is used as a metric tag
+        """
         self.counters = {}
         self._sync = Lock()
+        self._tracker = EvictionTracker(max_entries=max_entries, policy=policy, metrics=metrics,
+                                        name='rate_counter.{}'.format(name) if name else 'rate_counter')
 
-    def increment(self, name, value=1, threshold=1):
-        with self._sync:
-            current_time = int(time.time())
-            current_value, expiration_time = None, None
-            if name in self.counters:
-                current_value, expiration_time = self.counters[name]
-                if expiration_time <= current_time:
-                    current_value = None
+    def _get_counter(self, name, threshold, current_time):
+        """
+        :return: (current counter value or None if counter is expired, expiration time)
+        """
+        if name in self.counters:
+            current_value, expiration_time = self.counters[name]
+            if expiration_time > current_time:
+                return current_value, expiration_time
+        if callable(threshold):
+            threshold = threshold()
+        return None, current_time + int(threshold)
 
-            if current_value:
-                result = current_value + value
-            else:
-                result = value
-                if callable(threshold):
-                    threshold = threshold()
-                expiration_time = current_time + int(threshold)
-            self.counters[name] = (result, expiration_time)
+    def _increment(self, name, value, threshold, current_time):
+        current_value, expiration_time = self._get_counter(name, threshold, current_time)
+        if current_value:
+            result = current_value + value
+            self._tracker.hit(name)
+        else:
+            result = value
+            self._tracker.add(name, expires_at=expiration_time)
+        self.counters[name] = (result, expiration_time)
         return result, expiration_time - current_time
 
+    def _collect(self):
+        # drop expired counters and counters that exceed the limit
+        for evicted_name in self._tracker.collect():
+            self.counters.pop(evicted_name, None)
+
+    def increment(self, name, value=1, threshold=1, limit=None):
+        with self._sync:
+            result = self._increment(name, value, threshold, int(time.time()))
+            self._collect()
+        return result
+
+    def increment_many(self, counters, value=1):
+        with self._sync:
+            current_time = int(time.time())
+            checks = []
+            for name, threshold, limit in counters:
+                current_value, expiration_time = self._get_counter(name, threshold, current_time)
+                checks.append(((current_value or 0) + value, expiration_time - current_time))
+            if any(limit is not None and counter > limit
+                   for (_, _, limit), (counter, _) in zip(counters, checks)):
+                # a counter exceeds its limit, none is incremented
+                return checks
+            results = [self._increment(name, value, threshold, current_time)
+                       for name, threshold, _ in counters]
+            self._collect()
+        return results
+
 
 class MemcachedRateCounter(MemcachedClient, ComplexKey, IRateCounter):
     MAX_KEY_LENGTH = 250  # memcached key length is limited
@@ -54,11 +137,12 @@ class MemcachedRateCounter(MemcachedClient, ComplexKey, IRateCounter):
         ComplexKey.__init__(self, prefix)
         MemcachedClient.__init__(self, client, **memcached_params)
 
-    def increment(self, name, value=1, threshold=1):
+    def increment(self, name, value=1, threshold=1, limit=None):
         counter_key = self.format_key(name, 'c')
         expiration_key = self.format_key(name, 'e')
         try:
-            result = self.memcached.incr(counter_key, value)
+            result = (self.memcached.incr(counter_key, value) if value >= 0 else
+                      self.memcached.decr(counter_key, -value))
             result = result and self.memcached.get_multi([counter_key, expiration_key])
             if not result:
                 raise KeyError('counter expired')
@@ -83,9 +167,634 @@ class MemcachedRateCounter(MemcachedClient, ComplexKey, IRateCounter):
             return value, threshold
 
 
+def _get_threshold(threshold):
+    return float(threshold() if callable(threshold) else threshold)
+
+
+class RedisRateCounter(RedisClient, ComplexKey, IRateCounter):
+    """
+    Fixed window rate counter.
+    Increment, expiration read and initialization of a counter are done by one atomic lua script
+    and several counters are incremented in a single round trip.
+    """
+    lua_increment = None
+
+    # KEYS - counter names
+    # ARGV[1] - increment value, ARGV[i + 1] - threshold of KEYS[i] in milliseconds,
+    # ARGV[#KEYS + i + 1] - limit of KEYS[i] (-1 - unlimited)
+    # counters are incremented only if none of them exceeds its limit
+    # return list of {counter value, milliseconds till counter expiration}
+    LUA_INCREMENT_SCRIPT = """
+             local value = tonumber(ARGV[1])
+             local result = {}
+             local exceeded = false
+             for i, key in ipairs(KEYS) do
+                 local counter = tonumber(redis.call('get', key) or '0') + value
+                 local ttl = redis.call('pttl', key)
+                 if ttl < 0 then
+                     ttl = tonumber(ARGV[i + 1])
+                 end
+                 local limit = tonumber(ARGV[#KEYS + i + 1])
+                 if limit >= 0 and counter > limit then
+                     exceeded = true
+                 end
+                 result[i] = {counter, ttl}
+             end
+             if not exceeded then
+                 for i, key in ipairs(KEYS) do
+                     redis.call('incrby', key, value)
+                     if redis.call('pttl', key) < 0 then
+                         redis.call('pexpire', key, result[i][2])
+                     end
+                 end
+             end
+             return result
+         """
+
+    def __init__(self, prefix=None, client=None, **redis_params):
+        ComplexKey.__init__(self, prefix)
+        RedisClient.__init__(self, client, **redis_params)
+        RedisRateCounter.register_scripts(self.redis)
+
+    @classmethod
+    def register_scripts(cls, redis):
+        if cls.lua_increment is None:
+            cls.lua_increment = redis.register_script(cls.LUA_INCREMENT_SCRIPT)
+
+    def increment(self, name, value=1, threshold=1, limit=None):
+        # fixed window counter ignores the limit
+        return self.increment_many([(name, threshold, None)], value=value)[0]
+
+    def increment_many(self, counters, value=1):
+        if not counters:
+            return []
+        keys = [self.format_key(name) for name, _, _ in counters]
+        # thresholds are rounded to seconds like in other fixed window counters
+        thresholds = [int(_get_threshold(threshold)) * 1000 for _, threshold, _ in counters]
+        limits = [-1 if limit is None else int(limit) for _, _, limit in counters]
+        result = self.lua_increment(keys=keys, args=[int(value)] + thresholds + limits,
+                                    client=self.redis)
+        return [(int(counter), ttl / 1000.0) for counter, ttl in result]
+
+
+class MemoryWindowRateCounter(IRateCounter):
+    """
+    Base class of in-memory rate counters that respect a limit.
+    Increments that exceed the limit are not counted.
+    Retries of rejected increments are spread one emission interval (threshold / limit)
+    apart so suspended messages come back at the allowed rate instead of all at once.
+    """
+    EPSILON = 1e-6  # tolerance of float time calculations
+    respects_limit = True
+
+    def __init__(self, max_entries=None, policy=LRU, metrics=None, name=None):
+        """
+        :param max_entries: max count of active counters. None - unlimited
+        :param policy: eviction policy 'lru' or 'lfu'
+        :type metrics: pypipes.service.metric.IMetrics
+        :param name: rate counter service name, is used as a metric tag
+        """
+        self.counters = {}
+        self._retry_slots = {}  # counter name => time of next free retry slot
+        self._sync = Lock()
+        self._tracker = EvictionTracker(max_entries=max_entries, policy=policy, metrics=metrics,
+                                        name='rate_counter.{}'.format(name) if name else 'rate_counter')
+
+    def _increment(self, name, value, threshold, limit, now, commit=True):
+        """
+        Increment a counter if the limit allows it
+        :param commit: False - only check the increment, the counter is left unchanged
+        :return: (counter value, seconds till expiration or retry,
+                  counter expiration timestamp or None if increment is rejected)
+        """
+        raise NotImplementedError()
+
+    def _spread_retry(self, name, now, retry_at, interval, threshold):
+        slot = max(self._retry_slots.get(name, 0), retry_at)
+        if slot > retry_at + threshold:
+            # retry slots are booked for a whole window ahead, start over
+            slot = retry_at
+        self._retry_slots[name] = slot + interval
+        return slot - now
+
+    def _track(self, name, now, threshold, limit, result, expires_in, expires_at):
+        if expires_at:
+            self._tracker.add(name, expires_at=expires_at)
+        elif name in self._tracker:
+            self._tracker.hit(name)
+            expires_in = self._spread_retry(name, now, now + expires_in,
+                                            threshold / max(limit, 1), threshold)
+        return result, max(expires_in, 0)
+
+    def _collect(self):
+        for evicted_name in self._tracker.collect():
+            self.counters.pop(evicted_name, None)
+            self._retry_slots.pop(evicted_name, None)
+
+    def increment(self, name, value=1, threshold=1, limit=None):
+        threshold = _get_threshold(threshold)
+        with self._sync:
+            now = time.time()
+            result = self._track(name, now, threshold, limit,
+                                 *self._increment(name, value, threshold, limit, now))
+            self._collect()
+        return result
+
+    def increment_many(self, counters, value=1):
+        counters = [(name, _get_threshold(threshold), limit)
+                    for name, threshold, limit in counters]
+        with self._sync:
+            now = time.time()
+            checks = [self._increment(name, value, threshold, limit, now, commit=False)
+                      for name, threshold, limit in counters]
+            if all(expires_at for _, _, expires_at in checks):
+                checks = [self._increment(name, value, threshold, limit, now)
+                          for name, threshold, limit in counters]
+                results = [self._track(name, now, threshold, limit, *check)
+                           for (name, threshold, limit), check in zip(counters, checks)]
+            else:
+                # a counter exceeds its limit, none is incremented
+                results = [self._track(name, now, threshold, limit, *check) if not check[2]
+                           else (check[0], max(check[1], 0))
+                           for (name, threshold, limit), check in zip(counters, checks)]
+            self._collect()
+        return results
+
+
+class MemorySlidingLogRateCounter(MemoryWindowRateCounter):
+    """
+    Sliding window log.
+    Keeps a timestamp of every increment made in last `threshold` seconds.
+    Counter value is exact but memory usage is proportional to the limit.
+    """
+    def _increment(self, name, value, threshold, limit, now, commit=True):
+        total, log = self.counters.get(name) or (0, deque())
+        while log and log[0][0] <= now - threshold:
+            total -= log.popleft()[1]
+        result = total + value
+
+        if limit is not None and result > limit:
+            if name in self.counters:
+                self.counters[name] = (total, log)
+            # retry when enough units leave the window
+            released, retry_at = 0, now
+            for timestamp, units in log:
+                released += units
+                retry_at = timestamp + threshold
+                if released >= result - limit:
+                    break
+            return result, retry_at - now, None
+
+        if not commit:
+            return result, (log[0][0] if log else now) + threshold - now, now + threshold
+        log.append((now, value))
+        self.counters[name] = (result, log)
+        return result, log[0][0] + threshold - now, now + threshold
+
+
+class MemorySlidingWindowRateCounter(MemoryWindowRateCounter):
+    """
+    Sliding window counter.
+    Approximates the count of increments in last `threshold` seconds
+    by a weighted sum of current and previous fixed window counters.
+    Takes constant memory per counter.
+    """
+    def _increment(self, name, value, threshold, limit, now, commit=True):
+        window = int(now // threshold)
+        window_start = window * threshold
+        previous, current = 0, 0
+        state = self.counters.get(name)  # (window, previous counter, current counter)
+        if state and state[0] == window:
+            previous, current = state[1], state[2]
+        elif state and state[0] == window - 1:
+            previous = state[2]
+
+        estimate = previous * (1 - (now - window_start) / threshold) + current + value
+        result = int(math.ceil(estimate - self.EPSILON))
+        if limit is not None and result > limit:
+            if current + value <= limit:
+                # retry when the previous window weight decreases enough
+                retry_at = window_start + threshold * (
+                    1 - float(limit - current - value) / previous)
+            elif value <= limit:
+                # retry in the next window when the current window becomes the previous one
+                retry_at = window_start + threshold * (2 - float(limit - value) / current)
+            else:
+                retry_at = window_start + 2 * threshold
+            return result, retry_at - now, None
+
+        if commit:
+            self.counters[name] = (window, previous, current + value)
+        return result, window_start + threshold - now, window_start + 2 * threshold
+
+
+class MemoryGCRARateCounter(MemoryWindowRateCounter):
+    """
+    Generic cell rate algorithm.
+    Keeps only a theoretical arrival time of next increment,
+    allows a burst of up to `limit` increments and then
+    one increment per emission interval (threshold / limit).
+    Requires a limit.
+    """
+    def _increment(self, name, value, threshold, limit, now, commit=True):
+        if not limit:
+            raise ValueError('GCRA rate counter requires a limit')
+        interval = threshold / limit
+        arrival_time = max(self.counters.get(name, now), now) + value * interval
+        result = int(math.ceil((arrival_time - now) / interval - self.EPSILON))
+        if result > limit:
+            return result, arrival_time - threshold - now, None
+
+        if commit:
+            self.counters[name] = arrival_time
+        return result, arrival_time - now, arrival_time
+
+
+class RedisWindowRateCounter(RedisClient, ComplexKey, IRateCounter):
+    """
+    Base class of redis rate counters that respect a limit.
+    Each increment is done by an atomic lua script.
+    """
+    lua_increment = None
+    LUA_INCREMENT_SCRIPT = None
+    respects_limit = True
+
+    # a lua function that spreads retries of rejected increments
+    # one emission interval apart, see MemoryWindowRateCounter
+    LUA_SPREAD_RETRY = """
+             local function spread_retry(key, now, retry_at, interval, threshold)
+                 local slot = math.max(tonumber(redis.call('get', key) or '0'), retry_at)
+                 if slot > retry_at + threshold then
+                     slot = retry_at
+                 end
+                 redis.call('set', key, tostring(slot + interval),
+                            'px', math.ceil((slot + interval - now) * 1000))
+                 return tostring(slot - now)
+             end
+         """
+
+    def __init__(self, prefix=None, client=None, **redis_params):
+        ComplexKey.__init__(self, prefix)
+        RedisClient.__init__(self, client, **redis_params)
+        self.register_scripts(self.redis)
+
+    @classmethod
+    def register_scripts(cls, redis):
+        if cls.lua_increment is None:
+            cls.lua_increment = redis.register_script(cls.LUA_SPREAD_RETRY +
+                                                      cls.LUA_INCREMENT_SCRIPT)
+
+    def _get_keys(self, name, now, threshold):
+        raise NotImplementedError()
+
+    def _get_args(self, now, threshold, value, limit):
+        return [repr(now), repr(threshold), int(value), -1 if limit is None else int(limit)]
+
+    def increment(self, name, value=1, threshold=1, limit=None):
+        threshold = _get_threshold(threshold)
+        now = time.time()
+        result, expires_in = self.lua_increment(keys=self._get_keys(name, now, threshold),
+                                                args=self._get_args(now, threshold, value, limit),
+                                                client=self.redis)
+        return int(result), max(float(expires_in), 0)
+
+
+class RedisSlidingLogRateCounter(RedisWindowRateCounter):
+    """
+    Sliding window log, see MemorySlidingLogRateCounter.
+    Increments are saved in a sorted set, window total is kept in a separate key.
+    """
+    # KEYS[1] - log sorted set, KEYS[2] - window total, KEYS[3] - retry slot
+    # ARGV: now, threshold, value, limit (-1 - unlimited), unique member id
+    # return {counter value, seconds till expiration or retry}
+    LUA_INCREMENT_SCRIPT = """
+             local now = tonumber(ARGV[1])
+             local threshold = tonumber(ARGV[2])
+             local value = tonumber(ARGV[3])
+             local limit = tonumber(ARGV[4])
+             local expired = redis.call('zrangebyscore', KEYS[1], '-inf', now - threshold)
+             if #expired > 0 then
+                 local released = 0
+                 for i = 1, #expired do
+                     released = released + tonumber(string.match(expired[i], ':(-?%d+)$'))
+                 end
+                 redis.call('zremrangebyscore', KEYS[1], '-inf', now - threshold)
+                 redis.call('decrby', KEYS[2], released)
+             end
+             local result = tonumber(redis.call('get', KEYS[2]) or '0') + value
+
+             if limit >= 0 and result > limit then
+                 local log = redis.call('zrange', KEYS[1], 0, -1, 'withscores')
+                 local released, retry_at = 0, now
+                 for i = 1, #log, 2 do
+                     released = released + tonumber(string.match(log[i], ':(-?%d+)$'))
+                     retry_at = tonumber(log[i + 1]) + threshold
+                     if released >= result - limit then
+                         break
+                     end
+                 end
+                 return {result, spread_retry(KEYS[3], now, retry_at,
+                                              threshold / math.max(limit, 1), threshold)}
+             end
+
+             redis.call('zadd', KEYS[1], now, ARGV[5] .. ':' .. value)
+             redis.call('incrby', KEYS[2], value)
+             local ttl = math.ceil(threshold * 1000)
+             redis.call('pexpire', KEYS[1], ttl)
+             redis.call('pexpire', KEYS[2], ttl)
+             local first = redis.call('zrange', KEYS[1], 0, 0, 'withscores')
+             return {result, tostring(tonumber(first[2]) + threshold - now)}
+         """
+
+    def _get_keys(self, name, now, threshold):
+        return [self.format_key(name, 'l'), self.format_key(name, 't'),
+                self.format_key(name, 'r')]
+
+    def _get_args(self, now, threshold, value, limit):
+        args = super(RedisSlidingLogRateCounter, self)._get_args(now, threshold, value, limit)
+        return args + [uuid.uuid4().hex]
+
+
+class RedisSlidingWindowRateCounter(RedisWindowRateCounter):
+    """
+    Sliding window counter, see MemorySlidingWindowRateCounter.
+    Each fixed window counter is a separate redis key.
+    """
+    # KEYS[1] - previous window counter, KEYS[2] - current window counter, KEYS[3] - retry slot
+    # ARGV: now, threshold, value, limit (-1 - unlimited), current window start
+    # return {counter value, seconds till expiration or retry}
+    LUA_INCREMENT_SCRIPT = """
+             local now = tonumber(ARGV[1])
+             local threshold = tonumber(ARGV[2])
+             local value = tonumber(ARGV[3])
+             local limit = tonumber(ARGV[4])
+             local window_start = tonumber(ARGV[5])
+             local previous = tonumber(redis.call('get', KEYS[1]) or '0')
+             local current = tonumber(redis.call('get', KEYS[2]) or '0')
+             local estimate = previous * (1 - (now - window_start) / threshold) + current + value
+             local result = math.ceil(estimate - 0.000001)
+
+             if limit >= 0 and result > limit then
+                 local retry_at
+                 if current + value <= limit then
+                     retry_at = window_start + threshold * (1 - (limit - current - value) / previous)
+                 elseif value <= limit then
+                     retry_at = window_start + threshold * (2 - (limit - value) / current)
+                 else
+                     retry_at = window_start + 2 * threshold
+                 end
+                 return {result, spread_retry(KEYS[3], now, retry_at,
+                                              threshold / math.max(limit, 1), threshold)}
+             end
+
+             redis.call('incrby', KEYS[2], value)
+             redis.call('pexpire', KEYS[2],
+                        math.ceil((window_start + 2 * threshold - now) * 1000))
+             return {result, tostring(window_start + threshold - now)}
+         """
+
+    def _get_keys(self, name, now, threshold):
+        window = int(now // threshold)
+        return [self.format_key(name, window - 1), self.format_key(name, window),
+                self.format_key(name, 'r')]
+
+    def _get_args(self, now, threshold, value, limit):
+        args = super(RedisSlidingWindowRateCounter, self)._get_args(now, threshold, value, limit)
+        return args + [repr(int(now // threshold) * threshold)]
+
+
+class RedisGCRARateCounter(RedisWindowRateCounter):
+    """
+    Generic cell rate algorithm, see MemoryGCRARateCounter.
+    Requires a limit.
+    """
+    # KEYS[1] - theoretical arrival time, KEYS[2] - retry slot
+    # ARGV: now, threshold, value, limit
+    # return {counter value, seconds till expiration or retry}
+    LUA_INCREMENT_SCRIPT = """
+             local now = tonumber(ARGV[1])
+             local threshold = tonumber(ARGV[2])
+             local value = tonumber(ARGV[3])
+             local limit = tonumber(ARGV[4])
+             local interval = threshold / limit
+             local arrival_time = math.max(tonumber(redis.call('get', KEYS[1]) or '0'), now)
+             arrival_time = arrival_time + value * interval
+             local result = math.ceil((arrival_time - now) / interval - 0.000001)
+
+             if result > limit then
+                 return {result, spread_retry(KEYS[2], now, arrival_time - threshold,
+                                              interval, threshold)}
+             end
+
+             redis.call('set', KEYS[1], tostring(arrival_time),
+                        'px', math.ceil((arrival_time - now) * 1000))
+             return {result, tostring(arrival_time - now)}
+         """
+
+    def _get_keys(self, name, now, threshold):
+        return [self.format_key(name, 'a'), self.format_key(name, 'r')]
+
+    def increment(self, name, value=1, threshold=1, limit=None):
+        if not limit:
+            raise ValueError('GCRA rate counter requires a limit')
+        return super(RedisGCRARateCounter, self).increment(name, value, threshold, limit)
+
+
+class RateLease(object):
+    """
+    A chunk of rate counter units leased from a shared counter.
+    Units are numbered by the shared counter so each unit keeps its global order.
+    """
+    def __init__(self, last_unit, size, expires_at):
+        self.next_unit = last_unit - size + 1
+        self.last_unit = last_unit
+        self.expires_at = expires_at
+
+    @property
+    def remaining(self):
+        return self.last_unit - self.next_unit + 1
+
+    def is_valid(self, now):
+        return self.expires_at > now and self.remaining > 0
+
+    def take(self, value):
+        """
+        Take units from the lease
+        :return: global number of last taken unit
+        """
+        self.next_unit += value
+        return self.next_unit - 1
+
+
+class LeasedRateCounter(IRateCounter):
+    """
+    Local token bucket that leases chunks of units from a shared rate counter.
+    The shared counter is incremented once per `lease_size` local increments
+    and the next chunk is leased in background when the current one is almost consumed.
+
+    Every local increment returns a global number of the unit it has taken,
+    so a rate limit is never exceeded because of leasing.
+    Units leased but not consumed till the counter period end are lost,
+    therefore each worker may under-admit up to `lease_size` units per period.
+    A window counter with a limit rejects a whole lease, so `lease_size` has to be
+    much lower than the limit.
+    """
+    REFILL_TIMEOUT = 1  # max time in seconds to wait for a background refill
+
+    def __init__(self, rate_counter, lease_size=10, refill_threshold=0.5):
+        """
+        :param rate_counter: shared rate counter
+        :type rate_counter: IRateCounter
+        :param lease_size: count of units leased from the shared counter at once
+        :param refill_threshold: part of lease that if left triggers a background lease refill.
+            0 - disable background refill.
+        """
+        assert lease_size > 0
+        self._rate_counter = rate_counter
+        self._lease_size = int(lease_size)
+        self._refill_at = int(lease_size * refill_threshold)
+        self._leases = {}
+        self._next_leases = {}
+        self._refilling = set()
+        self._sync = Lock()
+        self._refilled = Condition(self._sync)
+
+    @property
+    def respects_limit(self):
+        # custom shared counters may not define it
+        return getattr(self._rate_counter, 'respects_limit', False)
+
+    def _lease(self, name, size, threshold, limit=None, now=None):
+        # only counters that respect a limit accept it
+        limit_kwargs = {'limit': limit} if self.respects_limit else {}
+        last_unit, expires_in = self._rate_counter.increment(name, value=size,
+                                                             threshold=threshold, **limit_kwargs)
+        if limit is not None and last_unit > limit and self.respects_limit:
+            # shared counter rejected the lease, reject local increments till the retry time
+            last_unit = limit + size
+        return RateLease(last_unit, size, (now or time.time()) + expires_in)
+
+    def _refill(self, name, threshold, limit):
+        lease = None
+        try:
+            lease = self._lease(name, self._lease_size, threshold, limit)
+        except Exception:
+            logger.exception('Failed to refill rate counter lease: %s', name)
+        finally:
+            with self._sync:
+                if lease:
+                    self._next_leases[name] = lease
+                self._refilling.discard(name)
+                self._refilled.notify_all()
+
+    def _get_lease(self, name, now):
+        lease = self._leases.get(name)
+        if lease and lease.is_valid(now):
+            return lease
+        lease = self._next_leases.pop(name, None)
+        if lease and lease.is_valid(now):
+            self._leases[name] = lease
+            return lease
+        self._leases.pop(name, None)
+        return None
+
+    def increment(self, name, value=1, threshold=1, limit=None):
+        now = time.time()
+        with self._sync:
+            lease = self._get_lease(name, now)
+            while not lease and name in self._refilling:
+                # the next lease is being leased right now, wait for it
+                self._refilled.wait(self.REFILL_TIMEOUT)
+                lease = self._get_lease(name, now)
+            if lease and lease.remaining >= value:
+                result = lease.take(value)
+                if (self._refill_at and lease.remaining <= self._refill_at and
+                        name not in self._refilling and name not in self._next_leases):
+                    # lease the next chunk in advance
+                    self._refilling.add(name)
+                    refill = Thread(target=self._refill, args=(name, threshold, limit))
+                    refill.daemon = True
+                    refill.start()
+                return result, lease.expires_at - now
+
+            # take the rest of current lease
+            if lease:
+                value -= lease.remaining
+                lease.take(lease.remaining)
+
+        # current lease is exhausted, lease a new chunk from the shared counter
+        lease = self._lease(name, max(self._lease_size, value), threshold, limit, now)
+        with self._sync:
+            self._leases[name] = lease
+            result = lease.take(value)
+        return result, lease.expires_at - now
+
+
+class LeasedRateCounterPool(IContextFactory):
+    """
+    Lazy pool of LeasedRateCounter services built over a pool of shared rate counters.
+    Local leases are kept by the pool object so they survive between messages.
+
+    Usage:
+        context = {'rate_counter': LeasedRateCounterPool(memcached_rate_pool, lease_size=20)}
+    """
+    def __init__(self, rate_counter_pool, **lease_params):
+        """
+        :param rate_counter_pool: pool of shared rate counters or lazy pool factory
+        :type rate_counter_pool: IContextPool[IRateCounter] | IContextFactory
+        :param lease_params: LeasedRateCounter parameters
+        """
+        self._rate_counter_pool = rate_counter_pool
+        self._lease_params = lease_params
+        self._counters = {}
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self._rate_counter_pool)
+
+    def __call__(self, context_dict):
+        def _get_counter(name):
+            if name not in self._counters:
+                shared_pool = try_apply_context(self._rate_counter_pool, context_dict)
+                self._counters[name] = LeasedRateCounter(shared_pool[name], **self._lease_params)
+            return self._counters[name]
+        return ContextPoolFactory(_get_counter)
+
+
 memory_rate_pool = ContextPoolFactory(lambda name: MemoryRateCounter())
+# memory rate counter limited by config.memory.rate_counter.<name> parameters
+bounded_memory_rate_pool = LazyContextPoolFactory(
+    lambda name, memory_config=client_config.memory, metrics=None:
+    MemoryRateCounter(metrics=metrics, name=name, **memory_config.rate_counter[name]))
+# window rate counters limited by config.memory.rate_counter.<name> parameters
+memory_sliding_log_rate_pool = LazyContextPoolFactory(
+    lambda name, memory_config=client_config.memory, metrics=None:
+    MemorySlidingLogRateCounter(metrics=metrics, name=name, **memory_config.rate_counter[name]))
+memory_sliding_window_rate_pool = LazyContextPoolFactory(
+    lambda name, memory_config=client_config.memory, metrics=None:
+    MemorySlidingWindowRateCounter(metrics=metrics, name=name,
+                                   **memory_config.rate_counter[name]))
+memory_gcra_rate_pool = LazyContextPoolFactory(
+    lambda name, memory_config=client_config.memory, metrics=None:
+    MemoryGCRARateCounter(metrics=metrics, name=name, **memory_config.rate_counter[name]))
+local_redis_rate_pool = ContextPoolFactory(RedisRateCounter)  # service name => prefix
+redis_rate_pool = LazyContextPoolFactory(
+    lambda name, redis_config=client_config.redis:
+    RedisRateCounter('r:{}'.format(name),
+                     client=get_redis_client(redis_config.rate_counter[name])))
 local_memcached_rate_pool = ContextPoolFactory(MemcachedRateCounter)  # service name => prefix
 memcached_rate_pool = LazyContextPoolFactory(
     lambda name, memcached_config=client_config.memcached:
     MemcachedRateCounter('r:{}'.format(name),
                          client=get_memcached_client(memcached_config.rate_counter[name])))
+redis_sliding_log_rate_pool = LazyContextPoolFactory(
+    lambda name, redis_config=client_config.redis:
+    RedisSlidingLogRateCounter('r:{}'.format(name),
+                               client=get_redis_client(redis_config.rate_counter[name])))
+redis_sliding_window_rate_pool = LazyContextPoolFactory(
+    lambda name, redis_config=client_config.redis:
+    RedisSlidingWindowRateCounter('r:{}'.format(name),
+                                  client=get_redis_client(redis_config.rate_counter[name])))
+redis_gcra_rate_pool = LazyContextPoolFactory(
+    lambda name, redis_config=client_config.redis:
+    RedisGCRARateCounter('r:{}'.format(name),
+                         client=get_redis_client(redis_config.rate_counter[name])))
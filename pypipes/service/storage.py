@@ -4,8 +4,10 @@ from copy import deepcopy
 from threading import Lock
 
 from pypipes.context.config import client_config
+from pypipes.exceptions import StaleFencingTokenException
 from pypipes.service.base import ComplexKey
 from pypipes.service.base_client import RedisClient, get_redis_client
+from pypipes.service.eviction import EvictionTracker, LRU
 from pypipes.service.hash import IHash
 
 from pypipes.context.factory import ContextPoolFactory, LazyContextPoolFactory
@@ -20,7 +22,7 @@ class IStorage(IHash):
     # inherits get and delete methods from IHash
     # interface of the save method is extended but still compatible with IHash.save
 
-    def save(self, primary_id, item, aliases=None, collections=None):
+    def save(self, primary_id, item, aliases=None, collections=None, fencing_token=None):
         """
         Save item
         :param item: item value
@@ -29,6 +31,10 @@ class IStorage(IHash):
         :type aliases: list(string)
         :param collections: list of collections to include the item
         :type collections: list(string)
+        :param fencing_token: fencing token of item lock owner.
+            The token is checked and saved with the item atomically,
+            the write is rejected if the item was saved with a greater token.
+        :raise: StaleFencingTokenException
         :return:
         """
         raise NotImplementedError()
@@ -82,27 +88,52 @@ class IStorage(IHash):
 
 
 class MemStorage(IStorage):
-    def __init__(self):
+    def __init__(self, max_entries=None, max_bytes=None, policy=LRU, metrics=None, name=None):
+        """
+        :param max_entries: max count of stored items. None - unlimited
+        :param max_bytes: max estimated size of stored items in bytes. None - unlimited
+        :param policy: eviction policy 'lru' or 'lfu'
+        :type metrics: pypipes.service.metric.IMetrics
+        :param name: storage name, is used as a metric tag
+        """
         self._storage = {}
         self._aliases = {}
         self._collections = defaultdict(set)
+        self._fencing_tokens = {}  # primary id => last fencing token of the item
         self._sync = Lock()
+        self._tracker = EvictionTracker(max_entries=max_entries, max_bytes=max_bytes,
+                                        policy=policy, metrics=metrics,
+                                        name='storage.{}'.format(name) if name else 'storage')
 
-    def save(self, primary_id, item, aliases=None, collections=None):
+    def save(self, primary_id, item, aliases=None, collections=None, fencing_token=None):
         aliases = aliases or []
         collections = collections or []
         with self._sync:
+            last_token = self._fencing_tokens.get(primary_id)
+            if fencing_token is not None:
+                if last_token is not None and last_token > fencing_token:
+                    raise StaleFencingTokenException(
+                        'Item {} is owned by fencing token {}, got {}'.format(
+                            primary_id, last_token, fencing_token))
+                last_token = fencing_token
             self._delete_alias(primary_id)
             self._delete_item(primary_id)
             for alias_id in aliases:
                 self._delete_alias(alias_id)
             # save the item
-            self._storage[primary_id] = (deepcopy(item), set(aliases), set(collections))
+            item = deepcopy(item)
+            self._storage[primary_id] = (item, set(aliases), set(collections))
+            self._tracker.add(primary_id, item)
             # create item aliases
             self._aliases.update((alias_id, primary_id) for alias_id in aliases)
             # append the item into collections
             for collection_id in collections:
                 self._collections[collection_id].add(primary_id)
+            if last_token is not None:
+                self._fencing_tokens[primary_id] = last_token
+            # evict items that exceed storage limits
+            for evicted_id in self._tracker.collect():
+                self._delete_item(evicted_id)
 
     def get(self, key, default=None):
         result = self.get_item(key)
@@ -115,6 +146,7 @@ class MemStorage(IStorage):
 
     def _get_item(self, primary_id):
         if primary_id and primary_id in self._storage:
+            self._tracker.hit(primary_id)
             return StorageItem(primary_id, *deepcopy(self._storage[primary_id]))
         else:
             return None
@@ -127,10 +159,17 @@ class MemStorage(IStorage):
     def _delete_item(self, primary_id):
         if primary_id and primary_id in self._storage:
             _, alias_ids, collection_ids = self._storage.pop(primary_id)
+            self._tracker.remove(primary_id)
+            self._fencing_tokens.pop(primary_id, None)
             for alias_id in alias_ids:
                 self._aliases.pop(alias_id, None)
             for collection_id in collection_ids:
-                self._collections[collection_id].discard(collection_id)
+                collection = self._collections.get(collection_id)
+                if collection is not None:
+                    collection.discard(primary_id)
+                    if not collection:
+                        # do not keep empty collections in memory
+                        del self._collections[collection_id]
             return True
         else:
             return False
@@ -155,7 +194,7 @@ class MemStorage(IStorage):
     def get_collection(self, collection_id, only_ids=False):
         with self._sync:
             items = tuple(self._get_item(primary_id)
-                          for primary_id in self._collections[collection_id])
+                          for primary_id in self._collections.get(collection_id, ()))
         for item in items:
             if item:
                 yield item[0] if only_ids else item
@@ -181,11 +220,22 @@ class RedisStorage(RedisClient, ComplexKey, IStorage):
     # KEYS[1] - item id
     # KEYS[2] - alias id
     # ARGV[1] - item value
+    # ARGV[2] - fencing token or empty string
     # ...
     # ARGV[n] - item alias or collection
     # ARGV[n+1] - 'c' if ARGV[n] is a collection id, 'a' if ARGV[n] is an alias id
-    # return 1 if item created, 0 if existing item updated
+    # return 1 if item created, 0 if existing item updated,
+    # -1 if item is saved with a greater fencing token
     LUA_SAVE_SCRIPT = """
+          -- check the fencing token, the last token is kept in 'f' field of the item
+          local last_token = tonumber(redis.call('hget', KEYS[1], 'f'))
+          local token = tonumber(ARGV[2])
+          if token then
+            if last_token and last_token > token then
+              return -1
+            end
+            last_token = token
+          end
           -- delete alias if exists
           local primary = redis.call('get', KEYS[2])
           if primary then
@@ -210,7 +260,10 @@ class RedisStorage(RedisClient, ComplexKey, IStorage):
           end
           -- save new item
           redis.call('hset', KEYS[1], 'i', ARGV[1])
-          for i = 2, table.getn(ARGV), 2 do
+          if last_token then
+            redis.call('hset', KEYS[1], 'f', last_token)
+          end
+          for i = 3, table.getn(ARGV), 2 do
             local key, type = ARGV[i], ARGV[i + 1]
             redis.call('hset', KEYS[1], key, type)
             if type == 'a' then
@@ -406,19 +459,24 @@ class RedisStorage(RedisClient, ComplexKey, IStorage):
         return StorageItem(self._extract_id(primary_id.decode(), self.ITEM_PREFIX),
                            item, aliases, collections)
 
-    def save(self, primary_id, item, aliases=None, collections=None):
+    def save(self, primary_id, item, aliases=None, collections=None, fencing_token=None):
         item_key = self._item_key(primary_id)
         alias_key = self._alias_key(primary_id)
 
         logger.debug('Save item: %s', primary_id)
-        args = []
+        args = ['' if fencing_token is None else int(fencing_token)]
         for alias in aliases or []:
             args.extend((self._alias_key(alias), 'a'))
         for collection in collections or []:
             args.extend((self._collection_key(collection), 'c'))
-        return bool(self.lua_save(keys=[item_key, alias_key],
-                                  args=[self._serialize(item)] + args,
-                                  client=self.redis))
+        result = self.lua_save(keys=[item_key, alias_key],
+                               args=[self._serialize(item)] + args,
+                               client=self.redis)
+        if result < 0:
+            raise StaleFencingTokenException(
+                'Item {} is owned by a fencing token greater than {}'.format(
+                    primary_id, fencing_token))
+        return bool(result)
 
     def get(self, key, default=None):
         result = self.get_item(key)
@@ -480,6 +538,10 @@ class RedisStorage(RedisClient, ComplexKey, IStorage):
 
 
 memory_storage_pool = ContextPoolFactory(lambda name: MemStorage())
+# memory storage limited by config.memory.storage.<name> parameters: max_entries, max_bytes, policy
+bounded_memory_storage_pool = LazyContextPoolFactory(
+    lambda name, memory_config=client_config.memory, metrics=None:
+    MemStorage(metrics=metrics, name=name, **memory_config.storage[name]))
 local_redis_storage_pool = ContextPoolFactory(RedisStorage)  # service name => redis prefix
 redis_storage_pool = LazyContextPoolFactory(
     lambda name, redis_config=client_config.redis:
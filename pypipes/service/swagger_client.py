@@ -0,0 +1,70 @@
+# bravado based part of OpenAPI client.
+# It's imported when a first client is created, see pypipes.service.openapi_client.create_client
+from bravado.client import SwaggerClient, ResourceDecorator, CallableOperation, \
+    construct_request
+from bravado.config import RequestConfig
+from bravado.requests_client import RequestsClient
+from bravado.warning import warn_for_deprecated_op
+
+
+class OperationRequestsClient(RequestsClient):
+    """
+    This RequestsClient attaches an operation ID to the request
+    for later use in OpenApiSession
+    """
+    def request(self, request_params, operation=None, request_config=None):
+        future = super(OperationRequestsClient, self).request(request_params,
+                                                              operation=operation,
+                                                              request_config=request_config)
+        future.future.request.operation_id = operation.operation_id if operation else None
+        return future
+
+
+class ApiClient(SwaggerClient):
+    """
+    SwaggerClient that shares a parsed specification and its operations with other clients
+    and sends operation requests with its own http client.
+    """
+    def __init__(self, swagger_spec, http_client):
+        """
+        :type swagger_spec: bravado_core.spec.Spec
+        :type http_client: bravado.http_client.HttpClient
+        """
+        bravado_config = swagger_spec.config['bravado']
+        super(ApiClient, self).__init__(
+            swagger_spec, also_return_response=bravado_config.also_return_response)
+        self.http_client = http_client
+        self.also_return_response = bravado_config.also_return_response
+
+    def _get_resource(self, item):
+        resource = self.swagger_spec.resources.get(item)
+        if not resource:
+            raise AttributeError(
+                'Resource {0} not found. Available resources: {1}'
+                .format(item, ', '.join(dir(self))))
+        return ApiResource(resource, self.http_client, self.also_return_response)
+
+
+class ApiResource(ResourceDecorator):
+    def __init__(self, resource, http_client, also_return_response=False):
+        super(ApiResource, self).__init__(resource, also_return_response)
+        self.http_client = http_client
+
+    def __getattr__(self, name):
+        return ApiOperation(getattr(self.resource, name), self.http_client,
+                            self.also_return_response)
+
+
+class ApiOperation(CallableOperation):
+    def __init__(self, operation, http_client, also_return_response=False):
+        super(ApiOperation, self).__init__(operation, also_return_response)
+        self.http_client = http_client
+
+    def __call__(self, **op_kwargs):
+        warn_for_deprecated_op(self.operation)
+        request_options = op_kwargs.pop('_request_options', {})
+        request_config = RequestConfig(request_options, self.also_return_response)
+        request_params = construct_request(self.operation, request_options, **op_kwargs)
+        return self.http_client.request(request_params,
+                                        operation=self.operation,
+                                        request_config=request_config)
@@ -36,7 +36,7 @@ setup(
         'gevent': ['gevent==1.4.0'],
         'celery': ['celery==4.3.0'],
         'swagger': ['bravado==10.4.1'],
-        'api': ['requests>=2.22.0'],
+        'api': ['requests>=2.22.0', 'futures>=3.0; python_version < "3"'],
         'redis': ['redis==4.4.4'],
         'memcached': ['python-memcached==1.59'],
         'crypto': ['pycrypto==2.6.1'],
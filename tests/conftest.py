@@ -14,7 +14,10 @@ from pypipes.service.counter import MemCounter, RedisCounter
 from pypipes.service.cursor_storage import CursorStorage, VersionedCursorStorage, ICursorStorage
 from pypipes.service.lock import RedisLock, MemLock, ILock
 from pypipes.service.metric import DataDogMetrics, LogMetrics, MetricDecorator
-from pypipes.service.rate_counter import MemoryRateCounter, MemcachedRateCounter
+from pypipes.service.rate_counter import MemoryRateCounter, MemcachedRateCounter, \
+    LeasedRateCounter, MemorySlidingLogRateCounter, MemorySlidingWindowRateCounter, \
+    MemoryGCRARateCounter, RedisSlidingLogRateCounter, RedisSlidingWindowRateCounter, \
+    RedisGCRARateCounter, RedisRateCounter
 from pypipes.service.storage import RedisStorage, MemStorage
 
 
@@ -184,7 +187,13 @@ def metrics(request):
 
 
 # ------------------------ IRateCounter fixtures
-RATE_COUNTER_LIST = ['memory_rate_counter', 'memcached_rate_counter']
+RATE_COUNTER_LIST = ['memory_rate_counter', 'memcached_rate_counter', 'redis_rate_counter',
+                     'leased_rate_counter',
+                     'memory_sliding_log_rate_counter', 'redis_sliding_log_rate_counter']
+WINDOW_RATE_COUNTER_LIST = ['memory_sliding_log_rate_counter', 'redis_sliding_log_rate_counter',
+                            'memory_sliding_window_rate_counter',
+                            'redis_sliding_window_rate_counter',
+                            'memory_gcra_rate_counter', 'redis_gcra_rate_counter']
 
 
 @pytest.fixture
@@ -197,11 +206,56 @@ def memcached_rate_counter(memcached_client):
     return MemcachedRateCounter('r:test', client=memcached_client)
 
 
+@pytest.fixture
+def redis_rate_counter(redis_client):
+    return RedisRateCounter('r:test', client=redis_client)
+
+
+@pytest.fixture
+def leased_rate_counter():
+    return LeasedRateCounter(MemoryRateCounter(), lease_size=10)
+
+
+@pytest.fixture
+def memory_sliding_log_rate_counter():
+    return MemorySlidingLogRateCounter()
+
+
+@pytest.fixture
+def redis_sliding_log_rate_counter(redis_client):
+    return RedisSlidingLogRateCounter('r:test', client=redis_client)
+
+
+@pytest.fixture
+def memory_sliding_window_rate_counter():
+    return MemorySlidingWindowRateCounter()
+
+
+@pytest.fixture
+def redis_sliding_window_rate_counter(redis_client):
+    return RedisSlidingWindowRateCounter('r:test', client=redis_client)
+
+
+@pytest.fixture
+def memory_gcra_rate_counter():
+    return MemoryGCRARateCounter()
+
+
+@pytest.fixture
+def redis_gcra_rate_counter(redis_client):
+    return RedisGCRARateCounter('r:test', client=redis_client)
+
+
 @pytest.fixture(params=RATE_COUNTER_LIST)
 def rate_counter(request):
     return request.getfixturevalue(request.param)
 
 
+@pytest.fixture(params=WINDOW_RATE_COUNTER_LIST)
+def window_rate_counter(request):
+    return request.getfixturevalue(request.param)
+
+
 # ---------------------------------------
 OBJECTS = {
     'int': 100,
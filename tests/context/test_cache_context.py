@@ -0,0 +1,118 @@
+from threading import Thread
+from time import sleep
+
+import pytest
+from mock import Mock
+
+from pypipes.context import LazyContextCollection
+from pypipes.context.cache import cached_lazy_context, SingleFlight, MetaValue
+from pypipes.context.pool import ContextPool
+from pypipes.exceptions import RetryMessageException
+from pypipes.service.cache import MemoryCache
+from pypipes.service.lock import MemLock
+
+
+@pytest.fixture
+def context_services():
+    return {'cache': ContextPool(MemoryCache()),
+            'lock': ContextPool(MemLock())}
+
+
+def run_in_threads(func, count):
+    results = []
+    threads = [Thread(target=lambda: results.append(func())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight():
+    factory = Mock(side_effect=lambda: sleep(0.2) or 'value')
+    flights = SingleFlight()
+    results = run_in_threads(lambda: flights.do('key', factory, timeout=5), 10)
+    assert results == ['value'] * 10
+    assert factory.call_count == 1
+
+
+def test_single_flight_error():
+    flights = SingleFlight()
+
+    def factory():
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        flights.do('key', factory)
+    # next flight calls the factory again
+    assert flights.do('key', lambda: 'value') == 'value'
+
+
+def test_cached_lazy_context_coalescing(context_services):
+    calls = []
+
+    @cached_lazy_context(expires_in=60)
+    def slow_context():
+        calls.append(1)
+        sleep(0.2)
+        return 'value'
+
+    def get_context():
+        return LazyContextCollection(context_services, context=slow_context)['context']
+
+    assert run_in_threads(get_context, 10) == ['value'] * 10
+    assert len(calls) == 1
+
+
+def test_cached_lazy_context_wait_for_other_process(context_services):
+    @cached_lazy_context(expires_in=60, generation_time=5, wait_timeout=2)
+    def my_context():
+        return 'value'
+
+    lock = context_services['lock'].default
+    cache = context_services['cache'].default
+    # other process is generating the context right now
+    lock.acquire("my_context.{}", expire_in=5)
+
+    def other_process():
+        sleep(0.2)
+        cache.save("my_context.{}", ('other_value', None, None))
+        lock.release("my_context.{}")
+
+    thread = Thread(target=other_process)
+    thread.start()
+    assert LazyContextCollection(context_services, context=my_context)['context'] == 'other_value'
+    thread.join()
+
+
+def test_cached_lazy_context_locked(context_services):
+    @cached_lazy_context(expires_in=60)
+    def locked_context():
+        return MetaValue('value', lock_on=100, expires_in=1)
+
+    collection = LazyContextCollection(context_services, context=locked_context)
+    assert collection['context'] == 'value'
+    sleep(1)
+    # context expired and the factory is still locked
+    with pytest.raises(RetryMessageException):
+        LazyContextCollection(context_services, context=locked_context)['context']
+
+
+def test_cached_lazy_context_stale(context_services):
+    values = iter(['value1', 'value2'])
+
+    @cached_lazy_context(expires_in=1, generation_time=1, stale_ttl=10)
+    def stale_context():
+        return next(values)
+
+    def get_context():
+        return LazyContextCollection(context_services, context=stale_context)['context']
+
+    assert get_context() == 'value1'
+    sleep(1.1)
+    # other processor is refreshing the context, stale context is served
+    context_services['lock'].default.acquire("stale_context.{}", expire_in=1)
+    assert get_context() == 'value1'
+
+    context_services['lock'].default.release("stale_context.{}")
+    assert get_context() == 'value2'
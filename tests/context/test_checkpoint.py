@@ -0,0 +1,63 @@
+import pytest
+from mock import call
+
+from pypipes.context.checkpoint import checkpoint
+from pypipes.processor import pipe_processor
+from pypipes.service.storage import MemStorage
+
+
+class StreamInterrupted(Exception):
+    pass
+
+
+def _stream_processor(fail_at=None, resume=False):
+    @checkpoint(every=2)
+    @pipe_processor
+    def stream(checkpoint):
+        start = checkpoint.resume() if resume else 0
+        for value in range(start, 5):
+            if value == fail_at:
+                raise StreamInterrupted()
+            yield {'value': value}
+    return stream
+
+
+def _emitted_values(infrastructure_mock):
+    return [args[2]['value'] for args, _ in infrastructure_mock.send_message.call_args_list]
+
+
+@pytest.mark.parametrize('resume', [False, True], ids=['replay', 'resume'])
+def test_checkpoint_resume(response_mock, infrastructure_mock, resume):
+    storage = MemStorage()
+    injections = {'processor_id': 'processor_id',
+                  'message': {'key': 'value'},
+                  'response': response_mock,
+                  'storage': {'checkpoint': storage}}
+
+    with pytest.raises(StreamInterrupted):
+        _stream_processor(fail_at=3, resume=resume).process(injections)
+    assert _emitted_values(infrastructure_mock) == [0, 1, 2]
+    infrastructure_mock.send_message.reset_mock()
+
+    # next attempt doesn't emit messages that are already emitted
+    _stream_processor(resume=resume).process(injections)
+    assert _emitted_values(infrastructure_mock) == [3, 4]
+    # checkpoint is deleted when the stream is complete
+    assert storage._storage == {}
+
+
+def test_stream_throttle(response_mock, infrastructure_mock, program_mock):
+    @pipe_processor
+    def stream():
+        for value in range(2):
+            yield {'value': value}
+
+    stream.process({'response': response_mock})
+    # stream is paced by the next processor backlog
+    assert infrastructure_mock.mock_calls == [
+        call.send_message(program_mock, 'next_processor_id', {'value': 0},
+                          priority=None, start_in=None),
+        call.throttle(program_mock, 'next_processor_id'),
+        call.send_message(program_mock, 'next_processor_id', {'value': 1},
+                          priority=None, start_in=None),
+        call.throttle(program_mock, 'next_processor_id')]
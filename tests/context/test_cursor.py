@@ -1,7 +1,13 @@
+from threading import Timer
+from time import sleep
+
 import pytest
 
+from pypipes.context.factory import ContextPoolFactory
+from pypipes.service.lock import MemLock
 from pypipes.context import context, message
 from pypipes.context.cursor import cursor
+from pypipes.exceptions import DropMessageException, StaleFencingTokenException
 from pypipes.processor import pipe_processor
 
 
@@ -100,3 +106,69 @@ def test_cursor_parametrized(response_mock, cursor_storage_mock, lock_pool_mock,
                                      'response': response_mock,
                                      'lock': lock_pool_mock,
                                      'cursor_storage': cursor_storage_mock})
+
+
+def test_cursor_heartbeat(response_mock, plain_cursor_storage):
+    lock_service = MemLock()
+    lock_pool = ContextPoolFactory(lambda name: lock_service)
+
+    @cursor(guard_expire_in=0.2, heartbeat_interval=0.05)
+    @pipe_processor
+    def long_processor(response):
+        sleep(0.3)  # lock is renewed in background
+        assert lock_service.acquire_token('processor_id', 1) is None
+        response.cursor = 'NEW CURSOR VALUE'
+
+    long_processor.process({'processor_id': 'processor_id',
+                            'response': response_mock,
+                            'lock': lock_pool,
+                            'cursor_storage': plain_cursor_storage})
+
+    assert plain_cursor_storage.get('processor_id') == 'NEW CURSOR VALUE'
+    # cursor is saved with a lock fencing token
+    with pytest.raises(StaleFencingTokenException):
+        plain_cursor_storage.save('processor_id', 'STALE CURSOR VALUE', fencing_token=0)
+    assert lock_service.get('processor_id') is False
+
+
+def test_cursor_heartbeat_lock_lost(response_mock, infrastructure_mock, plain_cursor_storage):
+    lock_service = MemLock()
+    lock_pool = ContextPoolFactory(lambda name: lock_service)
+
+    @cursor(guard_expire_in=0.2, heartbeat_interval=0.05)
+    @pipe_processor
+    def long_processor(response):
+        # the lock expires and is acquired by another processor
+        lock_service.release('processor_id')
+        assert lock_service.acquire_token('processor_id', 1) == 2
+        sleep(0.1)
+        response.emit_message({'key': 'value'})
+
+    with pytest.raises(DropMessageException):
+        long_processor.process({'processor_id': 'processor_id',
+                                'response': response_mock,
+                                'lock': lock_pool,
+                                'cursor_storage': plain_cursor_storage})
+    # the processor can't emit messages after the lock is lost
+    infrastructure_mock.send_message.assert_not_called()
+    # the lock of the new owner is not released
+    assert lock_service.get('processor_id')
+
+
+def test_cursor_wait_timeout(response_mock, plain_cursor_storage):
+    lock_service = MemLock()
+    lock_pool = ContextPoolFactory(lambda name: lock_service)
+    lock_service.acquire('processor_id')
+    Timer(0.1, lock_service.release, args=('processor_id',)).start()
+
+    @cursor(wait_timeout=1)
+    @pipe_processor
+    def update_cursor_processor(response):
+        # the lock is acquired after a short wait without message retry
+        response.cursor = 'NEW CURSOR VALUE'
+
+    update_cursor_processor.process({'processor_id': 'processor_id',
+                                     'response': response_mock,
+                                     'lock': lock_pool,
+                                     'cursor_storage': plain_cursor_storage})
+    assert plain_cursor_storage.get('processor_id') == 'NEW CURSOR VALUE'
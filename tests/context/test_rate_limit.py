@@ -0,0 +1,35 @@
+import pytest
+from mock import Mock
+
+from pypipes.context.pool import ContextPool
+from pypipes.context.rate_limit import rate_limit_guard
+from pypipes.exceptions import RetryMessageException
+from pypipes.processor import pipe_processor
+from pypipes.service.lock import MemLock
+
+
+class CustomRateCounter(object):
+    # rate counter implemented before increment got a limit parameter
+    def __init__(self):
+        self.counters = {}
+
+    def increment(self, name, value=1, threshold=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+        return self.counters[name], threshold
+
+
+def test_rate_limit_guard_custom_counter():
+    @rate_limit_guard(2, rate_threshold=10)
+    @pipe_processor
+    def processor():
+        return {}
+
+    rate_counter = CustomRateCounter()
+    injections = {'processor_id': 'processor',
+                  'rate_counter': ContextPool(default=rate_counter),
+                  'lock': ContextPool(default=MemLock())}
+    for _ in range(2):
+        processor.process(dict(injections, response=Mock()))
+    with pytest.raises(RetryMessageException):
+        processor.process(dict(injections, response=Mock()))
+    assert rate_counter.counters == {'processor': 3}
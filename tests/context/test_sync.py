@@ -0,0 +1,112 @@
+from mock import Mock
+
+from pypipes.context.pool import ContextPool
+from pypipes.context.sync import Barrier, Sync, complete_path
+from pypipes.infrastructure.inline import RunInline
+from pypipes.processor import pipe_processor
+from pypipes.processor.collection import Items
+from pypipes.processor.event import Event
+from pypipes.program import Program
+from pypipes.service.counter import MemCounter
+
+
+def test_barrier_fan_out():
+    shared_counter = MemCounter()
+    counter = Mock(wraps=shared_counter)
+    root = Barrier(counter, group_size=100)
+    paths = [root.count_job() for _ in range(1000)]
+    # one round trip per group of jobs
+    assert counter.increment_many.call_count == 10
+    assert len(set(path[-1] for path in paths)) == 10
+
+    # emitted jobs are done before the root job
+    assert not any(complete_path(counter, path) for path in paths)
+    assert root.complete() is True
+    # all barrier counters are deleted
+    assert shared_counter.counters == {}
+
+
+def test_barrier_tree():
+    counter = MemCounter()
+    root = Barrier(counter, group_size=2)
+    child_paths = [root.count_job() for _ in range(3)]
+    assert root.complete() is False
+
+    children = [Barrier(counter, path, group_size=2) for path in child_paths]
+    grandchild_path = children[0].count_job()
+    assert children[0].complete() is False
+    assert children[1].complete() is False
+    assert children[2].complete() is False
+
+    # the last job of the tree completes the root barrier
+    assert complete_path(counter, grandchild_path) is True
+    assert counter.counters == {}
+
+
+def test_barrier_without_jobs():
+    counter = Mock(wraps=MemCounter())
+    assert Barrier(counter).complete() is True
+    counter.increment.assert_not_called()
+
+
+def test_wait_all_inline():
+    done = []
+
+    @pipe_processor
+    def start():
+        return {'job_id': 1}
+
+    @pipe_processor
+    def fan_out():
+        for value in range(30):
+            yield {'value': value}
+
+    @pipe_processor
+    def double(message):
+        return {'value': message['value'] * 2}
+
+    @pipe_processor
+    def finish(message):
+        done.append(dict(message))
+
+    pipeline = Event.on_start >> start >> Sync(fan_out >> double).wait_all >> finish
+    program = Program(name='sync', pipelines={'pipeline': pipeline})
+    counter = MemCounter()
+    infrastructure = RunInline({'counter': ContextPool(default=counter)})
+    infrastructure.load(program)
+    infrastructure.start(program)
+
+    # next processor receives one message when all synchronised jobs are done
+    assert done == [{'job_id': 1}]
+    assert counter.counters == {}
+
+
+def test_wait_all_batch_inline():
+    done = []
+    values = []
+
+    @pipe_processor
+    def start():
+        return {'job_id': 1}
+
+    @pipe_processor
+    def double(message):
+        values.append(message['v'])
+        return {'value': message['v'] * 2}
+
+    @pipe_processor
+    def finish(message):
+        done.append(dict(message))
+
+    pipeline = (Event.on_start >> start >>
+                Sync(Items(range(30), 'v').for_each_chunk(10) >> double).wait_all >> finish)
+    program = Program(name='sync', pipelines={'pipeline': pipeline})
+    counter = MemCounter()
+    infrastructure = RunInline({'counter': ContextPool(default=counter)})
+    infrastructure.load(program)
+    infrastructure.start(program)
+
+    # a batch message is counted as one synchronised job
+    assert sorted(values) == list(range(30))
+    assert done == [{'job_id': 1}]
+    assert counter.counters == {}
@@ -0,0 +1,37 @@
+import pytest
+from mock import Mock
+
+from pypipes.exceptions import CircuitOpenException
+from pypipes.service.circuit_breaker import CircuitBreaker
+from pypipes.service.lock import MemLock
+
+
+def test_circuit_breaker():
+    lock = Mock(wraps=MemLock())
+    breaker = CircuitBreaker(lock, 'api', failure_threshold=2, recovery_time=10,
+                             check_interval=60)
+    breaker.check()
+    breaker.failure()
+    # closed state is not checked again during check interval
+    breaker.check()
+    assert lock.get.call_count == 1
+
+    breaker.failure()
+    with pytest.raises(CircuitOpenException) as exc_info:
+        breaker.check()
+    assert 9 <= exc_info.value.retry_in <= 10
+
+    # half-open circuit is opened by a first failure
+    lock.release('api')
+    breaker.check()
+    breaker.failure()
+    with pytest.raises(CircuitOpenException):
+        breaker.check()
+
+    # successful call resets the failure count
+    lock.release('api')
+    breaker.check()
+    breaker.success()
+    breaker.failure()
+    breaker.check()
+    assert lock.get('api') is False
@@ -15,3 +15,11 @@ def test_delete(counter):
 
 def test_delete_unknown(counter):
     counter.delete('unknown')
+
+
+def test_increment_get_many(counter):
+    counter.increment('counter1', 5)
+    assert counter.increment_many({'counter1': 2, 'counter2': -1}) == {'counter1': 7,
+                                                                      'counter2': -1}
+    assert counter.get_many(['counter1', 'counter2', 'counter3']) == {
+        'counter1': 7, 'counter2': -1, 'counter3': 0}
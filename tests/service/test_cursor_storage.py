@@ -1,3 +1,6 @@
+import pytest
+
+from pypipes.exceptions import StaleFencingTokenException
 from pypipes.service.cursor_storage import VersionedCursorStorage, CursorStorage
 
 
@@ -73,3 +76,11 @@ def test_versioned_cursor(memory_storage):
     assert cursor_storage_2_0_0.get('cursor1') == 'cursor1 for 2.0.0'
     assert cursor_storage_2_0_0.get('cursor2') == 'cursor2 for 1.0.0'
     assert cursor_storage_2_0_0.get('cursor3') == 'cursor3 value'
+
+
+def test_fencing_token(cursor_storage):
+    cursor_storage.save('key1', 'value1', fencing_token=1)
+    cursor_storage.save('key1', 'value2', fencing_token=2)
+    with pytest.raises(StaleFencingTokenException):
+        cursor_storage.save('key1', 'stale value', fencing_token=1)
+    assert cursor_storage.get('key1') == 'value2'
@@ -0,0 +1,103 @@
+from time import sleep
+
+import pytest
+from mock import Mock
+
+from pypipes.service.cache import MemoryCache
+from pypipes.service.counter import MemCounter
+from pypipes.service.eviction import EvictionTracker, LRU, LFU
+from pypipes.service.rate_counter import MemoryRateCounter
+from pypipes.service.storage import MemStorage
+
+
+def test_lru_eviction():
+    tracker = EvictionTracker(max_entries=2, policy=LRU)
+    tracker.add('key1')
+    tracker.add('key2')
+    tracker.hit('key1')
+    tracker.add('key3')
+    assert tracker.collect() == ['key2']
+    assert 'key1' in tracker and 'key3' in tracker
+    assert len(tracker) == 2
+
+
+def test_lfu_eviction():
+    tracker = EvictionTracker(max_entries=2, policy=LFU)
+    tracker.add('key1')
+    tracker.add('key2')
+    tracker.hit('key2')
+    tracker.hit('key1')
+    tracker.hit('key1')
+    tracker.add('key3')
+    assert tracker.collect() == ['key3']
+
+    tracker.add('key4')
+    tracker.remove('key2')
+    assert tracker.collect() == []
+    tracker.add('key5')
+    assert tracker.collect() == ['key4']
+
+
+def test_max_bytes_eviction():
+    tracker = EvictionTracker(max_bytes=10, size_func=len)
+    tracker.add('key1', 'a' * 4)
+    tracker.add('key2', 'b' * 4)
+    assert tracker.collect() == []
+    assert tracker.total_bytes == 8
+
+    tracker.add('key1', 'a' * 7)  # update existing key
+    assert tracker.collect() == ['key2']
+    assert tracker.total_bytes == 7
+
+
+def test_expiration_sweep():
+    metrics = Mock()
+    tracker = EvictionTracker(metrics=metrics, name='test')
+    tracker.add('key1', expires_at=100)
+    tracker.add('key2', expires_at=200)
+    tracker.add('key3')
+    tracker.add('key2', expires_at=300)  # key2 expiration is prolonged
+
+    assert tracker.collect(now=250) == ['key1']
+    metrics.increment.assert_called_once_with('memory.evicted', 1,
+                                              tags={'service': 'test', 'reason': 'expired'})
+    assert tracker.collect(now=350) == ['key2']
+    assert list(tracker._keys) == ['key3']
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        EvictionTracker(policy='unknown')
+
+
+def test_memory_cache_limits():
+    cache = MemoryCache(max_entries=2)
+    cache.save('key1', 'value1')
+    cache.save_many({'key2': 'value2', 'key3': 'value3'})
+    assert len(cache.storage) == 2
+
+    cache.save('key4', 'value4', expires_in=1)
+    sleep(1.1)
+    cache.save('key5', 'value5')
+    # expired value is swept
+    assert 'key4' not in cache.storage
+
+
+@pytest.mark.parametrize('service', [
+    MemCounter(max_entries=10),
+    MemoryRateCounter(max_entries=10)], ids=['counter', 'rate_counter'])
+def test_memory_counters_limits(service):
+    for i in range(100):
+        service.increment('key{}'.format(i))
+    assert len(service.counters) == 10
+
+
+def test_memory_storage_limits():
+    storage = MemStorage(max_entries=1)
+    storage.save('item1', 'value1', aliases=['alias1'], collections=['collection'])
+    storage.save('item2', 'value2', aliases=['alias2'], collections=['collection'])
+
+    assert storage.get('alias1') is None
+    assert storage.get('alias2') == 'value2'
+    assert list(storage.get_collection('collection', only_ids=True)) == ['item2']
+    assert storage._aliases == {'alias2': 'item2'}
@@ -0,0 +1,116 @@
+import io
+import time
+
+import pytest
+from requests import Request, Response
+from requests.structures import CaseInsensitiveDict
+
+from pypipes.service.cache import MemoryCache
+from pypipes.service.http_cache import HttpCache, get_freshness_ttl, parse_cache_control
+
+
+def _request(method='GET', url='http://url.com/path', **kwargs):
+    return Request(method, url, **kwargs).prepare()
+
+
+def _response(request, status_code=200, body=b'body', **headers):
+    response = Response()
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = body
+    response.request = request
+    response.url = request.url
+    return response
+
+
+def test_parse_cache_control():
+    assert parse_cache_control({'Cache-Control': 'Private, max-age="60", no-transform'}) == {
+        'private': '', 'max-age': '60', 'no-transform': ''}
+    assert parse_cache_control({}) == {}
+
+
+@pytest.mark.parametrize('headers, ttl', [
+    ({}, None),
+    ({'Cache-Control': 'max-age=60'}, 60),
+    ({'Cache-Control': 'max-age=60', 'Expires': 'Thu, 01 Jan 1970 00:00:00 GMT'}, 60),
+    ({'Cache-Control': 'no-cache, max-age=60'}, 0),
+    ({'Expires': 'Thu, 01 Jan 1970 00:01:00 GMT', 'Date': 'Thu, 01 Jan 1970 00:00:00 GMT'}, 60),
+    ({'Expires': 'Thu, 01 Jan 1970 00:00:00 GMT'}, 0),
+    ({'Expires': '0'}, 0),
+])
+def test_freshness_ttl(headers, ttl):
+    assert get_freshness_ttl(CaseInsensitiveDict(headers)) == ttl
+
+
+def test_http_cache():
+    cache = MemoryCache()
+    http_cache = HttpCache(cache, default_ttl=60)
+    request = _request()
+    body = b'0123456789' * 1000
+    assert http_cache.save(request, _response(request, body=body, ETag='"v1"'))
+
+    # only compressed body is stored
+    entry, expiration_time = cache.storage[http_cache.get_key(request)]
+    assert len(entry.body) < len(body) / 10
+    assert int(expiration_time - time.time()) in (659, 660)  # fresh ttl + stale ttl
+
+    entry = http_cache.get(request)
+    assert entry.is_fresh()
+    assert entry.validators() == {'If-None-Match': '"v1"'}
+    response = entry.to_response(request, Response)
+    assert response.content == body
+    assert response.headers['etag'] == '"v1"'
+
+    # cache key depends on method, body and vary headers
+    assert http_cache.get(_request('POST')) is None
+    assert http_cache.get(_request(headers={'Authorization': 'token'})) is None
+    assert http_cache.get(_request(params={'page': 2})) is None
+    assert http_cache.get(_request(headers={'If-None-Match': '"v0"'})) is None
+
+
+def test_http_cache_headers():
+    http_cache = HttpCache(MemoryCache(), default_ttl=60)
+    request = _request()
+
+    assert not http_cache.save(request, _response(request, **{'Cache-Control': 'no-store'}))
+    assert not http_cache.save(request, _response(request, **{'Cache-Control': 'no-cache'}))
+    assert not http_cache.save(request, _response(request, Vary='*'))
+    # only final successful responses are saved
+    assert not http_cache.save(request, _response(request, 304, body=b'', ETag='"v1"'))
+    assert not http_cache.save(request, _response(request, 301, Location='/new'))
+    assert http_cache.get(request) is None
+
+    # response without validators is stored while it is fresh
+    assert http_cache.save(request, _response(request, Expires='Thu, 01 Jan 1970 00:00:00 GMT'),
+                           ttl=10)
+    assert http_cache.get(request).is_fresh()
+
+    # response must be revalidated
+    http_cache.save(request, _response(request, ETag='"v1"', **{'Cache-Control': 'no-cache'}))
+    assert not http_cache.get(request).is_fresh()
+
+    # response varies on request header
+    http_cache.save(request, _response(request, Vary='Accept-Language'))
+    assert http_cache.get(request)
+    assert http_cache.get(_request(headers={'Accept-Language': 'en'})) is None
+
+
+def test_http_cache_methods():
+    http_cache = HttpCache(MemoryCache(), default_ttl=60)
+
+    # only responses of GET and HEAD requests are cached by default
+    request = _request('POST', data=b'data')
+    assert not http_cache.save(request, _response(request))
+    assert http_cache.get(request) is None
+    request = _request('HEAD')
+    assert http_cache.save(request, _response(request, body=b''))
+    assert http_cache.get(request)
+
+    # request with a file body is not cached
+    http_cache = HttpCache(MemoryCache(), default_ttl=60, cache_methods=('GET', 'POST'))
+    request = _request('POST', data=io.BytesIO(b'data'))
+    assert not http_cache.save(request, _response(request))
+    assert http_cache.get(request) is None
+    request = _request('POST', data=b'data')
+    assert http_cache.save(request, _response(request))
+    assert http_cache.get(request)
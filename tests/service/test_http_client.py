@@ -1,10 +1,22 @@
+import io
+import json
+import threading
+import time
+from email.utils import formatdate
+from concurrent.futures import Future
+
 import pytest
-from mock import Mock
+from mock import Mock, patch
 from requests import Response, Request
+from six.moves import BaseHTTPServer, socketserver
 
 from pypipes.config import Config
+from pypipes.context.factory import ContextPoolFactory
+from pypipes.exceptions import CircuitOpenException, RetryMessageException
+from pypipes.service.circuit_breaker import CircuitBreaker
 from pypipes.service.http_client import create_http_client, HttpClient, HttpResponse, \
-    ExtendedHTTPError
+    ExtendedHTTPError, AsyncHttpClient, http_client_pool, RetryPolicy, TooManyRequestsError
+from pypipes.service.lock import MemLock
 
 
 @pytest.fixture
@@ -18,11 +30,76 @@ def send_mock():
 def http_client(memory_cache, send_mock):
     metrics=Mock()
     cache = memory_cache
-    client = HttpClient(api_name='test', metrics=metrics, cache=cache, max_retries=3)
+    client = HttpClient(api_name='test', metrics=metrics, cache=cache, max_retries=3,
+                        retry_policy=RetryPolicy(backoff=0))
     client.get_adapter = Mock(return_value=Mock(send=send_mock))
     return client
 
 
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep connections alive
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path.startswith('/etag'):
+            return self._send_versioned()
+        if self.path.startswith('/pages'):
+            return self._send_page()
+        time.sleep(0.1)
+        status = 500 if self.path.startswith('/error') else 200
+        body = self.path.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_page(self):
+        page = int(self.path.split('page=')[-1])
+        body = json.dumps([page * 10, page * 10 + 1]).encode('utf-8')
+        self.send_response(200)
+        if page < 3:
+            self.send_header('Link', '</pages?page={}>; rel="next"'.format(page + 1))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_versioned(self):
+        # response must be revalidated each time
+        etag = '"v1"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'max-age=0')
+            self.end_headers()
+            return
+        body = b'versioned' * 100
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'max-age=0')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
 def test_create_http_client_default():
     metrics=Mock()
     config = Config()
@@ -79,10 +156,18 @@ def test_http_client(http_client, send_mock):
     assert response2.status_code == 200
 
 
+def test_http_client_file_body(http_client, send_mock):
+    # request with a file body is sent without the cache lookup
+    for _ in range(2):
+        response = http_client.request('GET', 'http://url.com', data=io.BytesIO(b'data'))
+        assert response.status_code == 200
+    assert send_mock.call_count == 2
+
+
 def test_http_client_error(http_client, send_mock):
     def build_response(request, **kwargs):
         response = Response()
-        response.headers = []
+        response.headers = {}
         response.status_code = 500
         response.request = request
         return response
@@ -127,3 +212,213 @@ def test_http_response():
         response.raise_for_status()
     assert exc_info.value.response == response
     assert exc_info.value.request == request
+
+
+def test_http_client_map(http_client, send_mock):
+    def build_response(request, **kwargs):
+        time.sleep(0.05)
+        response = Response()
+        response.status_code = 404 if request.url.endswith('/3') else 200
+        response.request = request
+        return response
+    send_mock.side_effect = build_response
+
+    urls = ['http://url.com/{}'.format(i) for i in range(10)]
+    start = time.time()
+    responses = http_client.map([('GET', url) for url in urls], concurrency=5)
+    # requests are sent in parallel
+    assert time.time() - start < 0.05 * 5
+    assert [response.request.url for response in responses] == urls
+    assert [response.status_code for response in responses] == [200] * 3 + [404] + [200] * 6
+    assert http_client._metrics.timing.call_count == 10
+
+    # successful responses are cached
+    http_client.map([{'method': 'GET', 'url': url} for url in urls])
+    assert send_mock.call_count == 11
+
+
+def test_http_client_gather(http_client, send_mock):
+    def build_response(request, **kwargs):
+        if request.url.endswith('/1'):
+            raise ValueError('connection error')
+        response = Response()
+        response.status_code = 200
+        response.request = request
+        return response
+    send_mock.side_effect = build_response
+
+    requests = [('GET', 'http://url.com/0'), ('GET', 'http://url.com/1', {'timeout': 1})]
+    with pytest.raises(ValueError):
+        http_client.map(requests)
+
+    responses = http_client.gather(requests)
+    assert responses[0].status_code == 200
+    assert isinstance(responses[1], ValueError)
+
+
+def test_http_client_concurrency():
+    client = HttpClient(concurrency=20)
+    assert client.get_adapter('https://url.com')._pool_maxsize == 20
+    assert client.get_adapter('http://url.com')._pool_maxsize == 20
+
+    client = create_http_client(config=Config({'requests': {'default': {'concurrency': 50}}}))
+    assert client._concurrency == 50
+    assert client.get_adapter('https://url.com')._pool_maxsize == 50
+
+
+def test_create_async_http_client():
+    config = Config({'requests': {'async_client': {'async': True, 'concurrency': 20}}})
+    pool = http_client_pool({'config': config})
+    assert isinstance(pool.async_client, AsyncHttpClient)
+    assert pool.async_client._executor._max_workers == 20
+    assert type(pool.default) is HttpClient
+
+
+def test_async_http_client(stub_server, memory_cache):
+    metrics = Mock()
+    client = AsyncHttpClient(api_name='test', metrics=metrics, cache=memory_cache,
+                             max_retries=2, concurrency=5)
+    url = 'http://127.0.0.1:{}'.format(stub_server.server_port)
+
+    start = time.time()
+    futures = [client.get('{}/item/{}'.format(url, i), tags={'item': i}) for i in range(5)]
+    assert all(isinstance(future, Future) for future in futures)
+    responses = [future.result() for future in futures]
+    # requests are sent in parallel
+    assert time.time() - start < 0.1 * 5
+    assert [response.text for response in responses] == ['/item/{}'.format(i) for i in range(5)]
+    assert sorted(kwargs['tags']['item'] for _, kwargs in metrics.timing.call_args_list) == [
+        0, 1, 2, 3, 4]
+
+    # successful response is cached
+    assert client.get(url + '/item/0').result().text == '/item/0'
+    assert len(stub_server.requests) == 5
+
+    # failed request is retried
+    response = client.get(url + '/error', headers={'Authorization': 'token'}).result()
+    assert response.status_code == 500
+    assert stub_server.requests[5:] == ['/error'] * 3
+    with pytest.raises(ExtendedHTTPError) as exc_info:
+        response.raise_for_status()
+    assert "'Authorization: <...>'" in exc_info.value.extra['cURL']
+    assert 'token' not in exc_info.value.extra['cURL']
+
+    # map waits for responses
+    assert [r.text for r in client.map([('GET', url + '/a'), ('GET', url + '/b')])] == [
+        '/a', '/b']
+    client.close()
+
+
+def test_http_client_revalidation(stub_server, memory_cache):
+    metrics = Mock()
+    client = HttpClient(api_name='test', metrics=metrics, cache=memory_cache)
+    url = 'http://127.0.0.1:{}/etag'.format(stub_server.server_port)
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert not getattr(response, 'from_cache', False)
+
+    # stale response is revalidated
+    for _ in range(2):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.from_cache
+        assert response.text == 'versioned' * 100
+        assert isinstance(response, HttpResponse)
+    assert len(stub_server.requests) == 3
+    assert [kwargs['tags']['status'] for _, kwargs in metrics.timing.call_args_list] == [
+        200, 304, 304]
+
+
+def test_http_client_caller_revalidation(stub_server, memory_cache):
+    client = HttpClient(api_name='test', cache=memory_cache)
+    url = 'http://127.0.0.1:{}/etag'.format(stub_server.server_port)
+
+    # caller validates its own copy of the response
+    response = client.get(url, headers={'If-None-Match': '"v1"'})
+    assert response.status_code == 304
+
+    # 304 response is not cached
+    response = client.get(url)
+    assert response.status_code == 200
+    assert not getattr(response, 'from_cache', False)
+    assert response.text == 'versioned' * 100
+
+
+def test_retry_policy():
+    policy = RetryPolicy(backoff=1, max_backoff=3)
+    assert 0.5 <= policy.get_delay(1) <= 1
+    assert 1 <= policy.get_delay(2) <= 2
+    assert 1.5 <= policy.get_delay(5) <= 3
+
+    response = Response()
+    response.headers = {'Retry-After': '20'}
+    assert policy.get_delay(1, response) == 20
+    response.headers = {'Retry-After': formatdate(time.time() + 60, usegmt=True)}
+    assert 58 < policy.get_delay(1, response) <= 60
+    response.headers = {'Retry-After': 'invalid'}
+    assert 0.5 <= policy.get_delay(1, response) <= 1
+
+
+def test_http_client_too_many_requests(http_client, send_mock):
+    def build_response(request, **kwargs):
+        response = Response()
+        response.headers = {'Retry-After': retry_after.pop(0)}
+        response.status_code = 429
+        response.request = request
+        return response
+    send_mock.side_effect = build_response
+    retry_after = ['1', '1', '60']
+
+    with patch('time.sleep') as sleep_mock:
+        with pytest.raises(TooManyRequestsError) as exc_info:
+            http_client.get('http://url.com')
+    # client waits for short delays only
+    assert sleep_mock.call_args_list == [((1,),), ((1,),)]
+    assert send_mock.call_count == 3
+    assert isinstance(exc_info.value, RetryMessageException)
+    assert exc_info.value.retry_in == 60
+    assert exc_info.value.response.status_code == 429
+
+
+def test_http_client_circuit_breaker(http_client, send_mock):
+    lock = MemLock()
+    http_client._max_retries = 0
+    http_client._circuit_breaker = CircuitBreaker(lock, 'test', failure_threshold=2,
+                                                  recovery_time=30)
+    send_mock.side_effect = ValueError('connection error')
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            http_client.get('http://url.com')
+
+    # circuit is open for all clients of the api
+    client = create_http_client('test', config=Config({'requests': {'test': {
+        'circuit_breaker': {'enabled': True}}}}), lock=ContextPoolFactory(lambda name: lock))
+    for open_client in (http_client, client):
+        with pytest.raises(CircuitOpenException) as exc_info:
+            open_client.get('http://url.com')
+        assert 29 <= exc_info.value.retry_in <= 30
+    assert send_mock.call_count == 2
+
+    # circuit is closed again
+    lock.release('test')
+    send_mock.side_effect = None
+    assert http_client.get('http://url.com').status_code == 200
+    assert http_client._circuit_breaker.failures == 0
+
+
+def test_http_client_paginate(stub_server):
+    client = HttpClient(api_name='test')
+    url = 'http://127.0.0.1:{}/pages'.format(stub_server.server_port)
+    checkpoints = []
+    pages = client.paginate('GET', url, params={'page': 0}, checkpoint=checkpoints.append,
+                            checkpoint_every=2)
+    assert [item for response in pages for item in response.json()] == [
+        0, 1, 10, 11, 20, 21, 30, 31]
+    assert stub_server.requests == ['/pages?page=0', '/pages?page=1', '/pages?page=2',
+                                    '/pages?page=3']
+    assert checkpoints == [{'url': url + '?page=2', 'params': None}, None]
+
+    # resume the stream from a checkpoint
+    pages = client.paginate('GET', url, params={'page': 0}, start=checkpoints[0])
+    assert [item for response in pages for item in response.json()] == [20, 21, 30, 31]
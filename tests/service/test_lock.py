@@ -1,4 +1,5 @@
-from time import sleep
+from threading import Thread, Timer
+from time import sleep, time
 
 
 def test_acquire_release(lock):
@@ -69,3 +70,87 @@ def test_expiration(lock):
 
     # there locks are expired
     assert not any(map(lock.get, ['lock2', 'lock4']))
+
+
+def test_wait(lock):
+    assert lock.wait('lock1', timeout=1) is True  # lock is not set
+
+    lock.acquire('lock1')
+    assert lock.wait('lock1', timeout=0.1) is False
+
+    lock.acquire('lock2', expire_in=0.5)
+    assert lock.wait('lock2', timeout=1) is True  # lock expired
+
+
+def test_wait_release(memory_lock):
+    memory_lock.acquire('lock1')
+    timer = Timer(0.1, memory_lock.release, args=['lock1'])
+    timer.start()
+    start_time = time()
+    assert memory_lock.wait('lock1', timeout=5) is True
+    assert time() - start_time < 1
+    timer.join()
+
+
+def test_fencing_token(lock):
+    token1 = lock.acquire_token('lock1', expire_in=1)
+    assert token1
+    assert lock.acquire_token('lock1', expire_in=1) is None
+    assert lock.renew('lock1', token1, expire_in=1) is True
+
+    sleep(1.1)
+    # lock expired and acquired by other owner
+    token2 = lock.acquire_token('lock1', expire_in=1)
+    assert token2 > token1
+    assert lock.renew('lock1', token1, expire_in=1) is False
+    assert lock.release_token('lock1', token1) is False
+    assert lock.release_token('lock1', token2) is True
+    assert lock.get('lock1') is False
+
+
+def test_acquire_wait(lock):
+    assert lock.acquire_wait('lock1', expire_in=10, timeout=1) is True
+    start = time()
+    assert lock.acquire_wait('lock1', expire_in=10, timeout=0.5) is False
+    assert 0.5 <= time() - start < 2
+
+    Timer(0.2, lock.release, args=('lock1',)).start()
+    assert lock.acquire_wait('lock1', expire_in=10, timeout=5) is True
+    assert lock.get('lock1')
+
+
+def test_acquire_wait_fifo(memory_lock):
+    memory_lock.acquire('lock1')
+    order = []
+
+    def waiter(index):
+        memory_lock.acquire_wait('lock1', timeout=5)
+        order.append(index)
+        memory_lock.release('lock1')
+
+    threads = []
+    for index in range(3):
+        threads.append(Thread(target=waiter, args=(index,)))
+        threads[-1].start()
+        sleep(0.05)  # let the waiter get into the queue
+
+    memory_lock.release('lock1')
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2]
+
+
+def test_acquire_wait_abandoned_waiter(redis_lock):
+    redis_lock.WAITER_LEASE = 1
+    redis_lock.acquire('lock1')
+    # a waiter that waits for an hour joins the queue and crashes
+    waiter = '{}:abandoned'.format(int((time() + 3600) * 1000))
+    assert not redis_lock.lua_acquire_wait(
+        keys=[redis_lock.format_key('lock1'), redis_lock.format_key('lock1', 'queue')],
+        args=[waiter, int(time() * 1000), 0, 1000], client=redis_lock.redis)
+
+    Timer(0.2, redis_lock.release, args=('lock1',)).start()
+    start = time()
+    # next waiter waits for the abandoned one no longer than its lease
+    assert redis_lock.acquire_wait('lock1', timeout=10) is True
+    assert time() - start < 3
@@ -1,8 +1,15 @@
+import os
+from threading import Event, Thread
+
+import pytest
 from bravado.client import SwaggerClient
 from pypipes.config import Config
 from mock import Mock, patch
+from requests import Response
 
-from pypipes.service.openapi_client import configure_api_client_factory
+from pypipes.service import swagger_client
+from pypipes.service.openapi_client import configure_api_client_factory, spec_registry, \
+    paginate_operation, OperationRequestsClient
 
 API_SPEC = {
     'swagger': '2.0',
@@ -27,6 +34,11 @@ API_SPEC = {
 }
 
 
+@pytest.fixture(autouse=True)
+def clear_spec_registry():
+    spec_registry.clear()
+
+
 @patch('bravado.client.Loader.load_spec')
 def test_configure_api_client_factory(load_spec_mock):
     load_spec_mock.return_value = API_SPEC
@@ -75,3 +87,118 @@ def test_configure_api_client_factory_custom_config(load_spec_mock):
     assert http_client._cache == cache.api
     assert http_client._operation_cache_ttl_map == operation_cache_ttl_map
     assert http_client._max_retries == 5
+
+
+def _health_response(request, **kwargs):
+    response = Response()
+    response.status_code = 200
+    response._content = b'{"status": "ok"}'
+    response.headers['Content-Type'] = 'application/json'
+    response.request = request
+    return response
+
+
+@patch('bravado.client.Loader.load_spec')
+def test_api_client_shared_spec(load_spec_mock):
+    load_spec_mock.return_value = API_SPEC
+    config = Config({'api': {'test': {'url': 'http://url.com'},
+                             'other': {'url': 'http://url.com'}}})
+    metrics = {'test': Mock(), 'other': Mock()}
+    clients = [configure_api_client_factory(name, config, metrics=metrics[name])
+               for name in ('test', 'other')]
+
+    # specification is loaded and parsed once
+    load_spec_mock.assert_called_once_with('http://url.com/swagger.json')
+    assert clients[0].swagger_spec is clients[1].swagger_spec
+
+    # each client sends requests with its own session
+    for client in clients:
+        session = client.http_client.session
+        session.get_adapter = Mock(return_value=Mock(send=Mock(side_effect=_health_response)))
+        assert client.health.api_health().response().incoming_response.status_code == 200
+        session.get_adapter.assert_called_once_with(url='http://url.com/health')
+    assert metrics['test'].timing.call_args[1]['tags']['api_name'] == 'test'
+    assert metrics['other'].timing.call_args[1]['tags']['api_name'] == 'other'
+
+
+@patch('bravado.client.Loader.load_spec')
+def test_spec_cache_dir(load_spec_mock, tmpdir):
+    load_spec_mock.return_value = API_SPEC
+    spec_cache_dir = str(tmpdir.join('specs'))
+    config = Config({'api': {'test': {'url': 'http://url.com', 'spec_cache_dir': spec_cache_dir}}})
+    configure_api_client_factory('test', config)
+    assert len(os.listdir(spec_cache_dir)) == 1
+
+    # a new process finds the parsed specification by its content
+    spec_registry.clear()
+    with patch.object(SwaggerClient, 'from_spec') as from_spec_mock:
+        client = configure_api_client_factory('test', config)
+    from_spec_mock.assert_not_called()
+    assert client.swagger_spec.http_client is client.http_client
+    session = client.http_client.session
+    session.get_adapter = Mock(return_value=Mock(send=Mock(side_effect=_health_response)))
+    assert client.health.api_health().response().incoming_response.status_code == 200
+
+    # modified specification is parsed again
+    load_spec_mock.return_value = dict(API_SPEC, info={'title': 'Example API', 'version': '2'})
+    spec_registry.clear()
+    configure_api_client_factory('test', config)
+    assert len(os.listdir(spec_cache_dir)) == 2
+
+
+@patch('bravado.client.Loader.load_spec')
+def test_spec_cache_dir_not_private(load_spec_mock, tmpdir):
+    load_spec_mock.return_value = API_SPEC
+    spec_cache_dir = tmpdir.mkdir('specs')
+    spec_cache_dir.chmod(0o777)
+    config = Config({'api': {'test': {'url': 'http://url.com',
+                                      'spec_cache_dir': str(spec_cache_dir)}}})
+    # other users could put a malicious file into the directory, so it's not used
+    configure_api_client_factory('test', config)
+    assert os.listdir(str(spec_cache_dir)) == []
+
+
+@patch('bravado.client.Loader.load_spec')
+def test_spec_registry_locks(load_spec_mock):
+    slow_url, fast_url = 'http://slow.com/swagger.json', 'http://fast.com/swagger.json'
+    slow_started, slow_loaded = Event(), Event()
+
+    def load_spec(url):
+        if url == slow_url:
+            slow_started.set()
+            slow_loaded.wait(5)
+        return API_SPEC
+
+    load_spec_mock.side_effect = load_spec
+    http_client = Mock()
+    slow_loader = Thread(target=spec_registry.get_spec, args=(slow_url, http_client))
+    slow_loader.start()
+    assert slow_started.wait(5)
+    # a slow specification download doesn't block other specifications
+    assert spec_registry.get_spec(fast_url, http_client)
+    assert slow_loader.is_alive()
+    slow_loaded.set()
+    slow_loader.join(5)
+    assert spec_registry.get_spec(slow_url, http_client)
+    assert load_spec_mock.call_count == 2
+
+
+def test_paginate_operation():
+    def list_items(cursor=0, limit=None):
+        assert limit == 2
+        result = {'items': [cursor, cursor + 1],
+                  'next_cursor': cursor + 2 if cursor < 4 else None}
+        return Mock(response=Mock(return_value=Mock(result=result)))
+
+    pages = paginate_operation(Mock(side_effect=list_items),
+                               lambda result: result['next_cursor'], limit=2)
+    assert [item for result in pages for item in result['items']] == [0, 1, 2, 3, 4, 5]
+
+
+def test_moved_client_classes():
+    # class moved to swagger_client is still available in openapi_client
+    assert OperationRequestsClient is swagger_client.OperationRequestsClient
+
+    class CustomRequestsClient(OperationRequestsClient):
+        pass
+    assert isinstance(CustomRequestsClient(), OperationRequestsClient)
@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+from pypipes.exceptions import RetryMessageException
+from pypipes.service.paginator import Paginator
+
+
+def _fetch_page(token):
+    time.sleep(0.1)
+    return {'items': [token * 10 + i for i in range(2)],
+            'next': token + 1 if token < 4 else None}
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_paginator(prefetch):
+    checkpoints = []
+    pages = Paginator(_fetch_page, lambda page: page['next'], token=0, prefetch=prefetch,
+                      checkpoint=checkpoints.append, checkpoint_every=2)
+    start = time.time()
+    items = []
+    for page in pages:
+        time.sleep(0.1)  # process the page
+        items.extend(page['items'])
+    elapsed = time.time() - start
+
+    assert items == [0, 1, 10, 11, 20, 21, 30, 31, 40, 41]
+    # position is saved periodically and reset when the stream is complete
+    assert checkpoints == [2, 4, None]
+    if prefetch:
+        # next page is fetched while current one is processed
+        assert elapsed < 0.8
+    else:
+        assert elapsed >= 1
+
+
+def test_paginator_error():
+    def fetch_page(token):
+        if token == 3:
+            raise RetryMessageException(retry_in=10)
+        return {'next': token + 1}
+
+    checkpoints = []
+    pages = Paginator(fetch_page, lambda page: page['next'], token=1,
+                      checkpoint=checkpoints.append)
+    with pytest.raises(RetryMessageException):
+        for _ in pages:
+            pass
+    # stream is resumed from the failed page
+    assert checkpoints == [3]
+    assert pages.token == 2
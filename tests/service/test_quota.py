@@ -5,7 +5,8 @@ from pypipes.config import Config
 from pypipes.context.pool import ContextPool
 from pypipes.exceptions import QuotaExceededException
 
-from pypipes.service.quota import Quota, HourQuota, DayQuota, MonthQuota, QuotaPool, UnlimitedQuota
+from pypipes.service.quota import Quota, HourQuota, DayQuota, MonthQuota, QuotaPool, \
+    UnlimitedQuota, MultiQuota
 
 
 def test_quota(memory_rate_counter):
@@ -23,6 +24,23 @@ def test_quota(memory_rate_counter):
     quota.consume('key1')
 
 
+def test_custom_rate_counter_quota():
+    class CustomRateCounter(object):
+        # rate counter implemented before increment got a limit parameter
+        def __init__(self):
+            self.counters = {}
+
+        def increment(self, name, value=1, threshold=1):
+            self.counters[name] = self.counters.get(name, 0) + value
+            return self.counters[name], threshold
+
+    quota = Quota('quota_name', CustomRateCounter(), limit=2, threshold=10)
+    for i in range(2):
+        quota.consume('key1')
+    with pytest.raises(QuotaExceededException):
+        quota.consume('key1')
+
+
 def test_hour_quota(memory_rate_counter):
     quota = HourQuota('quota_name', memory_rate_counter, limit=5)
 
@@ -109,3 +127,28 @@ def test_default_quote_pool(memory_rate_counter):
     # quota is unlimited if no quota configuration
     assert isinstance(pool.default, UnlimitedQuota)
     assert isinstance(pool.any_name, UnlimitedQuota)
+
+
+def test_multi_quota_pool(memory_rate_counter):
+    config = Config({
+        'quota': {
+            'multi': {
+                'limits': [
+                    {'limit': 3, 'threshold': 60},
+                    {'limit': 5, 'hours': 1},
+                    {'limit': 0, 'days': 1}  # unlimited
+                ]
+            }
+        }
+    })
+    pool = QuotaPool(config, ContextPool(memory_rate_counter))
+    assert isinstance(pool.multi, MultiQuota)
+    assert repr(pool.multi) == 'MultiQuota(multi, 3/60 sec, 5/1 h)'
+
+    for _ in range(3):
+        pool.multi.consume('key1')
+    with pytest.raises(QuotaExceededException) as e:
+        pool.multi.consume('key1')
+    assert 0 < e.value.retry_in <= 60
+    # rejected call is not counted by other periods
+    assert memory_rate_counter.counters['key1:1h'][0] == 3
@@ -1,5 +1,14 @@
 from time import sleep
 
+import pytest
+from mock import Mock
+
+from pypipes.context.pool import ContextPool
+from pypipes.exceptions import QuotaExceededException
+from pypipes.service.quota import Quota
+from pypipes.service.rate_counter import MemoryRateCounter, LeasedRateCounter, \
+    LeasedRateCounterPool, MemoryGCRARateCounter, MemorySlidingWindowRateCounter
+
 
 def test_increment(rate_counter):
     result = rate_counter.increment('rate1')
@@ -28,3 +37,134 @@ def test_callable_threshold(rate_counter):
 
     result = rate_counter.increment('rate1', threshold=threshold)
     assert 99 < result[1] <= 100
+
+
+def test_increment_many(rate_counter):
+    rate_counter.increment('rate1', threshold=100)
+    results = rate_counter.increment_many([('rate1', 100, None), ('rate2', 10, None)], value=2)
+    assert [value for value, _ in results] == [3, 2]
+    assert 99 < results[0][1] <= 100
+    assert 9 < results[1][1] <= 10
+
+
+def test_increment_many_limit(rate_counter):
+    counters = [('rate1', 100, 2), ('rate2', 100, 5)]
+    for _ in range(2):
+        rate_counter.increment_many(counters)
+    results = rate_counter.increment_many(counters)
+    assert [value for value, _ in results] == [3, 3]
+
+    # rate1 exceeds its limit, therefore rate2 is not counted either
+    assert rate_counter.increment('rate1', threshold=100)[0] == 3
+    assert rate_counter.increment('rate2', threshold=100)[0] == 3
+
+
+def test_leased_rate_counter():
+    shared_counter = Mock(wraps=MemoryRateCounter())
+    rate_counter = LeasedRateCounter(shared_counter, lease_size=10, refill_threshold=0)
+
+    results = [rate_counter.increment('rate1', threshold=10)[0] for _ in range(25)]
+    assert results == list(range(1, 26))
+    assert shared_counter.increment.call_count == 3
+
+    # other worker leases units from the same shared counter
+    other_counter = LeasedRateCounter(shared_counter, lease_size=10)
+    assert other_counter.increment('rate1', threshold=10)[0] == 31
+
+
+def test_leased_custom_rate_counter():
+    class CustomRateCounter(object):
+        # rate counter implemented before increment got a limit parameter
+        def __init__(self):
+            self.counters = {}
+
+        def increment(self, name, value=1, threshold=1):
+            self.counters[name] = self.counters.get(name, 0) + value
+            return self.counters[name], threshold
+
+    rate_counter = LeasedRateCounter(CustomRateCounter(), lease_size=10, refill_threshold=0)
+    assert not rate_counter.respects_limit
+    results = [rate_counter.increment('rate1', threshold=10, limit=15)[0] for _ in range(20)]
+    assert results == list(range(1, 21))
+
+
+def test_leased_rate_counter_refill():
+    shared_counter = MemoryRateCounter()
+    rate_counter = LeasedRateCounter(shared_counter, lease_size=10, refill_threshold=0.5)
+    for _ in range(5):
+        rate_counter.increment('rate1', threshold=10)
+    sleep(0.1)  # wait for background refill
+    # next lease is already prepared
+    assert shared_counter.increment('rate1', value=0, threshold=10)[0] == 20
+    results = [rate_counter.increment('rate1', threshold=10)[0] for _ in range(10)]
+    assert results == [6, 7, 8, 9, 10, 11, 12, 13, 14, 15]
+
+
+def test_leased_rate_counter_pool(memory_rate_counter):
+    pool = LeasedRateCounterPool(ContextPool(memory_rate_counter), lease_size=10)
+    # pool keeps leased counters between contexts
+    assert pool({})['quota'] is pool({})['quota']
+
+    quota = Quota('quota_name', pool({})['quota'], limit=15, threshold=10)
+    for i in range(15):
+        quota.consume('key1')
+    with pytest.raises(QuotaExceededException):
+        quota.consume('key1')
+
+
+def test_window_rate_counter_limit(window_rate_counter):
+    results = [window_rate_counter.increment('rate1', threshold=1, limit=3)[0]
+               for _ in range(3)]
+    assert results == [1, 2, 3]
+
+    # rejected increments are not counted
+    for _ in range(2):
+        result = window_rate_counter.increment('rate1', threshold=1, limit=3)
+        assert result[0] == 4
+        assert 0 < result[1] <= 2
+
+    sleep(result[1])
+    assert window_rate_counter.increment('rate1', threshold=1, limit=3)[0] <= 3
+
+
+def test_window_rate_counter_spread_retry(window_rate_counter):
+    for _ in range(4):
+        window_rate_counter.increment('rate1', threshold=10, limit=4)
+    retries = [window_rate_counter.increment('rate1', threshold=10, limit=4)[1]
+               for _ in range(3)]
+    # each next retry is scheduled one emission interval later
+    assert retries[1] - retries[0] == pytest.approx(2.5, abs=0.1)
+    assert retries[2] - retries[1] == pytest.approx(2.5, abs=0.1)
+
+
+def test_sliding_window_rate_counter():
+    rate_counter = MemorySlidingWindowRateCounter()
+    now = 1000.5
+    rate_counter.counters['rate1'] = (999, 0, 10)  # previous window is full
+    result = rate_counter._increment('rate1', 1, 1, 10, now)
+    # half of previous window counter is still in the sliding window
+    assert result[0] == 6
+    assert result[2] == 1002
+
+
+def test_gcra_rate_counter():
+    rate_counter = MemoryGCRARateCounter()
+    with pytest.raises(ValueError):
+        rate_counter.increment('rate1', threshold=1)
+
+    quota = Quota('quota_name', rate_counter, limit=5, threshold=1)
+    for _ in range(5):
+        quota.consume('key1')
+    with pytest.raises(QuotaExceededException) as exc_info:
+        quota.consume('key1')
+    # one unit is released each 0.2 sec
+    assert 0.1 < exc_info.value.retry_in <= 0.2
+
+
+def test_leased_window_rate_counter(memory_sliding_log_rate_counter):
+    rate_counter = LeasedRateCounter(memory_sliding_log_rate_counter, lease_size=10,
+                                     refill_threshold=0)
+    results = [rate_counter.increment('rate1', threshold=10, limit=15)[0] for _ in range(11)]
+    # second lease is rejected by the shared counter and its units are never admitted
+    assert results[:10] == list(range(1, 11))
+    assert results[10] > 15
@@ -1,3 +1,6 @@
+import pytest
+
+from pypipes.exceptions import StaleFencingTokenException
 from pypipes.service.storage import StorageItem
 
 
@@ -70,3 +73,15 @@ def test_collections(storage):
     # to delete collection items call delete_collection with delete_items=True parameter
     storage.delete_collection('all_values', delete_items=True)
     assert not storage.get_item('key2')
+
+
+def test_fencing_token(storage):
+    storage.save('key1', 'value1', fencing_token=1)
+    storage.save('key1', 'value2', collections=['collection1'], fencing_token=2)
+    with pytest.raises(StaleFencingTokenException):
+        storage.save('key1', 'stale value', fencing_token=1)
+    # a save without a token keeps the last token
+    storage.save('key1', 'value3', collections=['collection1'])
+    with pytest.raises(StaleFencingTokenException):
+        storage.save('key1', 'stale value', fencing_token=1)
+    assert storage.get_item('key1') == StorageItem('key1', 'value3', set(), {'collection1'})
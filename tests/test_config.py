@@ -0,0 +1,214 @@
+import json
+import os
+import pickle
+import stat
+import time
+from copy import deepcopy
+
+import pytest
+from mock import MagicMock, Mock, patch
+
+from pypipes.config import (Config, ClientConfig, FrozenConfig, FrozenClientConfig, freeze_config,
+                            ConfigWatcher, from_url)
+from pypipes.context.config import config as config_path, client_config
+from pypipes.service import config_singleton
+
+CONFIG = {
+    'celery': {
+        'queue-name': {'processor': '{processor_id}'},
+        'items': 'value',
+    },
+    'redis': {
+        'host': 'localhost',
+        'port': 6379,
+        'storage': {'db': 1},
+        'lock': {'db': 2, 'production': {'host': 'redis.prod'}},
+    },
+}
+
+
+def test_frozen_config():
+    frozen = freeze_config(Config(CONFIG))
+    assert isinstance(frozen, FrozenConfig)
+    assert frozen == CONFIG
+    assert frozen.celery.queue_name.get('processor') == '{processor_id}'
+    # config value can't override a dict method
+    assert frozen.celery['items'] == 'value'
+    assert callable(frozen.celery.items)
+    assert frozen.missing == {}
+    assert frozen.get_section('redis').storage.db == 1
+
+    assert frozen.get_path('celery.queue-name.processor') == '{processor_id}'
+    assert frozen.get_path('redis.lock') == {'db': 2, 'production': {'host': 'redis.prod'}}
+    assert frozen.get_path('redis.cache.db', 0) == 0
+
+    with pytest.raises(TypeError):
+        frozen['celery'] = {}
+    with pytest.raises(TypeError):
+        frozen.celery.update(items=None)
+    with pytest.raises(TypeError):
+        frozen.celery = None
+
+    assert pickle.loads(pickle.dumps(frozen)) == frozen
+    assert deepcopy(frozen).celery.queue_name == frozen.celery.queue_name
+    assert freeze_config(frozen) is frozen
+
+
+def test_frozen_client_config():
+    client = ClientConfig(CONFIG)
+    frozen = freeze_config(client)
+    assert isinstance(frozen, FrozenClientConfig)
+    # inheritance is resolved like ClientConfig does it
+    for service in ('redis', 'cache'):
+        for name in ('storage', 'lock', 'counter'):
+            assert frozen.get_section(service)[name] == client.get_section(service)[name]
+    assert frozen.redis.lock.production.get_level() == {'host': 'redis.prod', 'port': 6379,
+                                                        'db': 2}
+
+    # inherited snapshot is resolved once
+    plain = freeze_config(Config(CONFIG))
+    assert plain.redis.inherited() is plain.redis.inherited()
+    assert plain.redis.inherited()['lock'] == ClientConfig(CONFIG['redis'])['lock']
+
+
+def test_frozen_config_path():
+    frozen = freeze_config(CONFIG)
+    context = {'config': frozen}
+    # config paths return compiled snapshots instead of new config objects
+    assert config_path.celery(context) is frozen.celery
+    assert client_config.redis(context) is frozen.redis.inherited()
+    assert client_config.redis(context)['storage'] == {'host': 'localhost', 'port': 6379,
+                                                       'db': 1}
+    assert isinstance(client_config.redis({'config': Config(CONFIG)}), ClientConfig)
+
+
+class ConfigServer(object):
+    """
+    Serves a json config with ETag validator
+    """
+    def __init__(self, config):
+        self.config = config
+        self.available = True
+        self.requests = []
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.requests.append(headers)
+        if not self.available:
+            raise IOError('Config server is not available')
+        response = MagicMock()
+        response.__enter__.return_value = response
+        etag = str(hash(json.dumps(self.config, sort_keys=True)))
+        if (headers or {}).get('If-None-Match') == etag:
+            response.status_code = 304
+        else:
+            response.status_code = 200
+            response.headers = {'Content-Type': 'application/json', 'ETag': etag}
+            response.content = json.dumps(self.config).encode('utf-8')
+        return response
+
+
+@pytest.fixture
+def config_server():
+    server = ConfigServer(CONFIG)
+    with patch('requests.request', side_effect=server.request):
+        yield server
+
+
+def test_config_watcher(config_server, tmpdir):
+    cache_file = str(tmpdir.join('config.cache'))
+    watcher = ConfigWatcher('http://config/config.json', cache_file=cache_file)
+    redis_change = Mock()
+    celery_change = Mock()
+    watcher.subscribe(redis_change, 'redis.storage')
+    watcher.subscribe(celery_change, 'celery')
+
+    config = watcher.config
+    assert config == CONFIG
+    assert watcher({}) is config
+
+    # config is revalidated with a conditional request
+    assert not watcher.poll()
+    assert watcher.config is config
+    assert config_server.requests[-1] == {'If-None-Match': str(hash(json.dumps(
+        CONFIG, sort_keys=True)))}
+
+    # changed config replaces the snapshot and notifies listeners of changed values only
+    config_server.config = dict(CONFIG, redis=dict(CONFIG['redis'], storage={'db': 3}))
+    assert watcher.poll()
+    assert watcher.config.redis.storage.db == 3
+    redis_change.assert_called_once_with({'db': 3}, {'db': 1})
+    assert not celery_change.called
+
+    # new watcher starts with a local copy when config server is not available
+    config_server.available = False
+    assert ConfigWatcher('http://config/config.json', cache_file=cache_file).config == \
+        config_server.config
+    assert from_url('http://config/config.json', cache_file=cache_file) == config_server.config
+
+    without_copy = ConfigWatcher('http://config/config.json')
+    with pytest.raises(IOError):
+        without_copy.load()
+
+
+def test_config_watcher_local_copy(config_server, tmpdir):
+    cache_file = str(tmpdir.join('cache', 'config.cache'))
+    ConfigWatcher('http://config/config.json', cache_file=cache_file).load()
+
+    # raw config content is saved, its metadata is kept in json
+    assert json.loads(tmpdir.join('cache', 'config.cache').read_binary().decode('utf-8')) == \
+        CONFIG
+    assert json.loads(tmpdir.join('cache', 'config.cache.json').read()) == {
+        'content_type': 'application/json',
+        'validators': {'If-None-Match': str(hash(json.dumps(CONFIG, sort_keys=True)))}}
+    assert stat.S_IMODE(os.stat(str(tmpdir.join('cache'))).st_mode) == 0o700
+
+    # local copy is revalidated with saved validators
+    watcher = ConfigWatcher('http://config/config.json', cache_file=cache_file)
+    watcher._read_cache()
+    assert watcher.config == CONFIG
+    assert not watcher.poll()
+
+
+def test_config_watcher_polling(config_server, tmpdir):
+    cache_file = str(tmpdir.join('config.cache'))
+    ConfigWatcher('http://config/config.json', cache_file=cache_file).load()
+    config_server.requests = []
+
+    config_server.config = {'celery': {'items': 'changed'}}
+    watcher = ConfigWatcher('http://config/config.json', cache_file=cache_file, interval=60)
+    change = Mock()
+    watcher.subscribe(change)
+    watcher.start()
+    try:
+        # startup doesn't wait for the config server, and local copy is revalidated at once
+        for _ in range(50):
+            if change.called:
+                break
+            time.sleep(0.01)
+        assert change.call_count == 1
+        assert watcher.config == {'celery': {'items': 'changed'}}
+    finally:
+        watcher.stop()
+    assert len(config_server.requests) == 1
+
+
+def test_config_singleton_release(config_server):
+    @config_singleton(section='redis')
+    def create_client(config):
+        return dict(config)
+
+    watcher = ConfigWatcher('http://config/config.json')
+    client = create_client(watcher.config.inherited().redis['storage'])
+    assert create_client(watcher.config.inherited().redis['storage']) is client
+
+    # objects are not released when other sections are changed
+    config_server.config = dict(CONFIG, celery={})
+    watcher.poll()
+    assert create_client(watcher.config.inherited().redis['storage']) is client
+
+    previous_config = watcher.config.inherited().redis['storage']
+    config_server.config = dict(CONFIG, redis=dict(CONFIG['redis'], port=6380))
+    watcher.poll()
+    assert create_client(watcher.config.inherited().redis['storage'])['port'] == 6380
+    # object of previous config is released
+    assert create_client(previous_config) is not client
@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+import pytest
+
+BACKENDS = ('celery', 'kombu', 'bravado', 'requests', 'datadog')
+
+
+def _imported_backends(module):
+    code = 'import sys, {}; print(",".join(name for name in {!r} if name in sys.modules))'.format(
+        module, BACKENDS)
+    output = subprocess.check_output([sys.executable, '-c', code], universal_newlines=True)
+    return set(filter(None, output.strip().split(',')))
+
+
+@pytest.mark.parametrize('module, allowed', [
+    ('pypipes.config', set()),
+    ('pypipes.service.storage', set()),
+    ('pypipes.service.metric', set()),
+    ('pypipes.infrastructure.on_celery', set()),
+    ('pypipes.service.openapi_client', {'requests'}),
+])
+def test_lazy_backends(module, allowed):
+    # optional backends are imported on first use only
+    assert _imported_backends(module) <= allowed
@@ -69,3 +69,20 @@ def test_join_attachment():
 
     # processor1 must be not changed
     assert processor1.monitor_events == []
+
+
+def test_pipeline_shares_processors():
+    pipeline1 = processor1 >> processor2
+    pipeline2 = pipeline1 >> processor1
+
+    # processors are not copied by a pipeline join
+    assert list(pipeline2) == [processor1, processor2, processor1]
+    assert pipeline2[0] is processor1 and pipeline2[2] is processor1
+    assert list(pipeline1) == [processor1, processor2]
+
+    # but context managers are applied to the copies only
+    pipeline3 = define(key='value')(pipeline2)
+    assert pipeline3[0] is not processor1
+    assert pipeline3[0].processor_func is processor1.processor_func
+    assert len(pipeline3[0].context_managers) == 1
+    assert processor1.context_managers == []
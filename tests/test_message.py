@@ -0,0 +1,106 @@
+import pickle
+
+import pytest
+from mock import Mock
+
+from pypipes.infrastructure.response.listener import ListenerResponseHandler
+from pypipes.message import FrozenMessage, Message, freeze_message, message_without, \
+    FrozenLazyMessage, EncodedValue, copy_message, pack_message, unpack_message, \
+    enable_message_envelopes
+
+
+@pytest.fixture
+def envelopes():
+    enable_message_envelopes()
+    yield
+    enable_message_envelopes(False)
+
+
+def test_freeze_message():
+    message = Message(key='value')
+    frozen = freeze_message(message)
+    # message object is frozen in place
+    assert frozen is message
+    assert isinstance(frozen, FrozenMessage)
+    with pytest.raises(AttributeError):
+        frozen['key'] = 'new value'
+    with pytest.raises(AttributeError):
+        frozen.pop('key')
+
+    # other dicts are copied
+    message = {'key': 'value'}
+    frozen = freeze_message(message)
+    assert frozen == message
+    assert frozen is not message
+
+
+def test_frozen_message_pickle():
+    frozen = FrozenMessage(key='value')
+    restored = pickle.loads(pickle.dumps(frozen))
+    assert isinstance(restored, FrozenMessage)
+    assert restored == {'key': 'value'}
+
+
+def test_frozen_message_pickle_compatibility():
+    # envelopes are disabled by default, workers of previous versions read plain messages
+    data = pickle.dumps(FrozenMessage(key='value'))
+    assert b'unpack_message' not in data
+    assert type(pickle.loads(data)) is FrozenMessage
+
+    # a lazy message received as an envelope is forwarded as a plain message
+    message = unpack_message(pack_message(FrozenMessage(key='value')))
+    restored = pickle.loads(pickle.dumps(freeze_message(copy_message(message, key2='value2'))))
+    assert type(restored) is FrozenMessage
+    assert restored == {'key': 'value', 'key2': 'value2'}
+
+
+def test_frozen_message_envelope(envelopes):
+    data = pickle.dumps(FrozenMessage(key='value'))
+    enable_message_envelopes(False)
+    # envelopes are read regardless of the setting
+    restored = pickle.loads(data)
+    assert isinstance(restored, FrozenLazyMessage)
+    assert restored == {'key': 'value'}
+
+
+def test_message_without():
+    frozen = FrozenMessage(key1='value1', key2='value2')
+    assert message_without(frozen, 'key3') is frozen
+    assert message_without(frozen, 'key2') == {'key1': 'value1'}
+    assert frozen == {'key1': 'value1', 'key2': 'value2'}
+
+
+def test_emitted_message_is_not_copied():
+    infrastructure = Mock()
+    response = ListenerResponseHandler(infrastructure, Mock(), 'processor_id', {})
+    payload = ['large value']
+    response.emit_message({'key': payload})
+
+    message = infrastructure.send_message.call_args[0][2]
+    assert isinstance(message, FrozenMessage)
+    assert message['key'] is payload
+
+
+def test_lazy_message_decoding(envelopes):
+    data = pickle.dumps(FrozenMessage(key1={'value': 1}, key2=[1, 2]))
+    message = pickle.loads(data)
+    assert isinstance(message, FrozenLazyMessage)
+    assert isinstance(dict.__getitem__(message, 'key1'), EncodedValue)
+
+    # only accessed values are decoded
+    assert message['key2'] == [1, 2]
+    assert isinstance(dict.__getitem__(message, 'key1'), EncodedValue)
+
+    assert message == {'key1': {'value': 1}, 'key2': [1, 2]}
+    assert dict(message) == {'key1': {'value': 1}, 'key2': [1, 2]}
+
+
+def test_lazy_message_pass_through(envelopes):
+    message = pickle.loads(pickle.dumps(FrozenMessage(key1={'value': 1}, key2=[1, 2])))
+    forwarded = freeze_message(copy_message(message, key3='value3'))
+    assert isinstance(forwarded, FrozenLazyMessage)
+
+    # not decoded values are packed into next envelope as is
+    message = unpack_message(pack_message(forwarded))
+    assert isinstance(dict.__getitem__(message, 'key1'), EncodedValue)
+    assert message == {'key1': {'value': 1}, 'key2': [1, 2], 'key3': 'value3'}
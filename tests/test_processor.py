@@ -1,8 +1,20 @@
+import operator
+from itertools import cycle
+
 import pytest
+from pypipes.context import message
 from pypipes.context.define import define
-from mock import Mock
+from mock import Mock, patch, call
 
-from pypipes.processor import Processor, pipe_processor, pipe_attachment, event_processor
+from pypipes.context.sync import GATHER_COMPLETE
+from pypipes.exceptions import DropMessageException, RetryMessageException
+from pypipes.processor import Processor, pipe_processor, pipe_attachment, event_processor, \
+    batch_message, BATCH_MESSAGES
+from pypipes.processor.collection import Items, UniqueFilter
+from pypipes.processor.reduce import Reduce
+from pypipes.service.counter import MemCounter
+from pypipes.service.lock import MemLock
+from pypipes.service.storage import MemStorage
 
 
 class EmitProcessor(Processor):
@@ -120,3 +132,211 @@ def test_event_processor():
         return {}
 
     assert processor.monitor_events == ['event1', 'event2']
+
+
+def _reduce_injections(message, response_mock, storage, lock, counter=None):
+    return {'message': message, 'response': response_mock, 'processor_id': 'reduce',
+            'storage': {'reduce': storage}, 'lock': {'reduce': lock},
+            'counter': {'reduce': counter}}
+
+
+def test_reduce_max_count():
+    processor = Reduce(lambda total, msg: total + msg['amount'], initial=0,
+                       combiner=operator.add, shards=2, max_count=6,
+                       account_id=message.account_id)
+    response_mock = Mock()
+    storage, lock, counter = MemStorage(), MemLock(), MemCounter()
+    with patch('pypipes.processor.reduce.random.randrange', side_effect=cycle([0, 1])):
+        for amount in range(1, 6):
+            processor.process(_reduce_injections({'account_id': 1, 'amount': amount},
+                                                 response_mock, storage, lock, counter))
+        response_mock.emit_message.assert_not_called()
+        assert storage.get('reduce.account_id:1.partial.0') == (9, 3)
+
+        processor.process(_reduce_injections({'account_id': 1, 'amount': 6},
+                                             response_mock, storage, lock, counter))
+    # partial aggregates of all shards are combined into one message
+    response_mock.emit_message.assert_called_once_with({'account_id': 1, 'result': 21})
+    assert storage.get('reduce.account_id:1.partial.0') is None
+    assert storage.get('reduce.account_id:1.partial.1') is None
+    assert counter.counters == {}
+
+
+def test_reduce_window():
+    processor = Reduce(lambda total, msg: total + [msg['event']], initial=[],
+                       window=60, account_id=message.account_id)
+    response_mock = Mock()
+    storage, lock = MemStorage(), MemLock()
+    for event in ('event1', 'event2'):
+        processor.process(_reduce_injections({'account_id': 1, 'event': event},
+                                             response_mock, storage, lock))
+    # the first message of the window schedules a flush
+    response_mock.emit_retry_message.assert_called_once_with(
+        {'account_id': 1, 'event': 'event1'}, _retry_in=60, _reduce_flush=1)
+    response_mock.emit_message.assert_not_called()
+
+    processor.process(_reduce_injections({'account_id': 1, '_reduce_flush': 1},
+                                         response_mock, storage, lock))
+    response_mock.emit_message.assert_called_once_with(
+        {'account_id': 1, 'result': ['event1', 'event2']})
+
+    # next message opens a new window
+    processor.process(_reduce_injections({'account_id': 1, 'event': 'event3'},
+                                         response_mock, storage, lock))
+    assert response_mock.emit_retry_message.call_count == 2
+    response_mock.emit_retry_message.assert_called_with(
+        {'account_id': 1, 'event': 'event3'}, _retry_in=60, _reduce_flush=2)
+
+
+def test_reduce_stale_window_flush():
+    processor = Reduce(lambda total, msg: total + 1, initial=0,
+                       window=60, max_count=2, account_id=message.account_id)
+    response_mock = Mock()
+    storage, lock, counter = MemStorage(), MemLock(), MemCounter()
+    for _ in range(3):
+        processor.process(_reduce_injections({'account_id': 1},
+                                             response_mock, storage, lock, counter))
+    # max_count flush closes the window, the third message is in the next window
+    response_mock.emit_message.assert_called_once_with({'account_id': 1, 'result': 2})
+    assert response_mock.emit_retry_message.call_count == 2
+
+    # scheduled flush of the closed window does nothing
+    processor.process(_reduce_injections({'account_id': 1, '_reduce_flush': 1},
+                                         response_mock, storage, lock, counter))
+    assert response_mock.emit_message.call_count == 1
+    assert storage.get('reduce.account_id:1.partial.0') == (1, 1)
+
+    processor.process(_reduce_injections({'account_id': 1, '_reduce_flush': 2},
+                                         response_mock, storage, lock, counter))
+    response_mock.emit_message.assert_called_with({'account_id': 1, 'result': 1})
+
+
+def test_reduce_flush_locked_shard():
+    processor = Reduce(lambda total, msg: total + 1, initial=0, combiner=operator.add,
+                       shards=2, max_count=2, wait_timeout=0.1, name=message.name)
+    response_mock = Mock()
+    storage, lock, counter = MemStorage(), MemLock(), MemCounter()
+    lock.acquire('reduce.name:a.partial.1')
+    with patch('pypipes.processor.reduce.random.randrange', return_value=0):
+        for _ in range(2):
+            processor.process(_reduce_injections({'name': 'a'}, response_mock, storage, lock,
+                                                 counter))
+    # shard 1 is busy, the flush doesn't delete any partial aggregate
+    response_mock.emit_message.assert_not_called()
+    assert storage.get('reduce.name:a.partial.0') == (2, 2)
+    # the message is already reduced, only the flush is retried
+    response_mock.emit_retry_message.assert_called_once_with(
+        {'name': 'a'}, _retry_in=0.1, **{GATHER_COMPLETE: True})
+
+    lock.release('reduce.name:a.partial.1')
+    processor.process(_reduce_injections({'name': 'a', GATHER_COMPLETE: True},
+                                         response_mock, storage, lock, counter))
+    response_mock.emit_message.assert_called_once_with({'name': 'a', 'result': 2})
+
+
+def test_reduce_gather_complete():
+    processor = Reduce(lambda total, msg: total + 1, initial=0, name=message.name)
+    response_mock = Mock()
+    storage, lock = MemStorage(), MemLock()
+    for name in ('a', 'b', 'a'):
+        processor.process(_reduce_injections({'name': name}, response_mock, storage, lock))
+    processor.process(_reduce_injections({'name': 'a', GATHER_COMPLETE: True},
+                                         response_mock, storage, lock))
+    response_mock.emit_message.assert_called_once_with({'name': 'a', 'result': 2})
+
+
+def test_batch_message():
+    @pipe_processor
+    def single_processor(message):
+        return {'result': message['value'] * 2}
+
+    @pipe_processor(batch=True)
+    def batch_processor(messages):
+        return {'result': [msg['value'] for msg in messages]}
+
+    assert batch_processor.batch
+
+    response_mock = Mock()
+    message = dict(batch_message([{'value': 1}, {'value': 2}]), shared='value')
+    single_processor.process({'response': response_mock, 'message': message})
+    assert response_mock.emit_message.call_args_list == [call({'result': 2}),
+                                                          call({'result': 4})]
+
+    response_mock.reset_mock()
+    batch_processor.process({'response': response_mock, 'message': message})
+    response_mock.emit_message.assert_called_once_with({'result': [1, 2]})
+
+    # regular message is a batch of one message for batch processor
+    response_mock.reset_mock()
+    batch_processor.process({'response': response_mock, 'message': {'value': 3}})
+    response_mock.emit_message.assert_called_once_with({'result': [3]})
+
+
+@pytest.mark.parametrize('error', [DropMessageException, RetryMessageException])
+def test_batch_message_error(error):
+    @pipe_processor
+    def processor(message):
+        if message['value'] == 2:
+            raise error('failed')
+        return {'result': message['value']}
+
+    response_mock = Mock()
+    message = dict(batch_message([{'value': 1}, {'value': 2}, {'value': 3}]), shared='value')
+    processor.process({'response': response_mock, 'message': message})
+    if error is DropMessageException:
+        # only the failed message is dropped
+        assert response_mock.emit_message.call_args_list == [call({'result': 1}),
+                                                              call({'result': 3})]
+        assert not response_mock.emit_retry_message.called
+    else:
+        # processed messages are not retried
+        assert response_mock.emit_message.call_args_list == [call({'result': 1})]
+        response_mock.emit_retry_message.assert_called_once_with(
+            {'shared': 'value'}, _retry_in=None, _batch=[{'value': 2}, {'value': 3}])
+
+
+def test_batch_message_mapping():
+    @pipe_processor
+    def processor(number):
+        return {'result': number}
+
+    response_mock = Mock()
+    program = Mock(message_mapping={'number': message.value})
+    processor.process({'response': response_mock, 'program': program,
+                       'message': batch_message([{'value': 1}, {'value': 2}])})
+    assert response_mock.emit_message.call_args_list == [call({'result': 1}),
+                                                          call({'result': 2})]
+
+
+def test_items_for_each_chunk():
+    response_mock = Mock()
+    processor = Items(range(5), name='number').for_each_chunk(2)
+    processor.process({'response': response_mock, 'message': {'key': 'value'}})
+    chunks = [args[0][BATCH_MESSAGES] for args, _ in response_mock.emit_message.call_args_list]
+    assert [[msg['number'] for msg in chunk] for chunk in chunks] == [[0, 1], [2, 3], [4]]
+    assert chunks[0][0] == {'key': 'value', 'number': 0}
+
+
+def test_unique_filter():
+    unique_filter = UniqueFilter(max_size=2)
+    # unhashable values are supported
+    assert unique_filter({'value': [1, 2]})
+    assert not unique_filter({'value': [1, 2]})
+    assert unique_filter({'value': {'key': 1}})
+    assert unique_filter({'value': 3})
+    # the oldest digest is evicted
+    assert unique_filter({'value': [1, 2]})
+
+
+def test_context_processor_clone():
+    processor = define(a=3)(return_processor)
+    processor2 = processor.clone()
+    processor2.add_monitor('event1')
+    processor2.add_contextmanager(define(b=5))
+
+    # clone shares processor settings but extends its own lists
+    assert processor2.processor_func is processor.processor_func
+    assert processor2.injections_handler is processor.injections_handler
+    assert processor.monitor_events == []
+    assert len(processor.context_managers) == 1
+    assert len(processor2.context_managers) == 2
@@ -77,6 +77,16 @@ def test_program_mapping(program, pipeline1, pipeline2):
     }
 
 
+def test_program_unique_names():
+    program = Program(name='test', pipelines={
+        'pipeline': processor3 >> processor3 >> processor1 >> processor3})
+    program.add_pipeline('pipeline.processor3', processor3 >> processor3)
+    assert list(program.processors) == [
+        'pipeline.processor3', 'pipeline.processor3.2', 'pipeline.processor1',
+        'pipeline.processor3.3',
+        'pipeline.processor3.processor3', 'pipeline.processor3.processor3.2']
+
+
 def test_program_get_processor(program, pipeline1):
     assert program.get_processor('pipeline1.processor1') == pipeline1[0]
     assert program.get_processor('unknown') is None
@@ -0,0 +1,96 @@
+from mock import Mock, call
+
+from pypipes.infrastructure.base import Infrastructure
+from pypipes.infrastructure.response.base import BaseResponseHandler
+from pypipes.infrastructure.response.listener import ListenerResponseHandler
+
+
+def test_response_property(response_mock):
+    values = {}
+    response_mock.set_property('cursor', lambda: values.get('cursor'),
+                               lambda value: values.update(cursor=value))
+    response_mock.cursor = 'value'
+    assert values == {'cursor': 'value'}
+    assert response_mock.cursor == 'value'
+
+    # custom attributes are still supported
+    response_mock.page = 1
+    assert response_mock.page == 1
+
+    # other handlers are not affected
+    other_response = ListenerResponseHandler(Mock(), Mock(), 'processor_id', {})
+    other_response.cursor = 'other value'
+    assert values == {'cursor': 'value'}
+
+
+def test_response_flush(response_mock, infrastructure_mock, program_mock):
+    flush_extension = Mock(side_effect=lambda original_flush: original_flush())
+    response_mock.extend_flush(flush_extension)
+
+    response_mock.flush()
+    infrastructure_mock.send_message.assert_not_called()
+
+    response_mock.message.key = 'value'
+    response_mock.retry_message = True
+    response_mock.flush()
+    assert flush_extension.call_count == 2
+    infrastructure_mock.send_message.assert_any_call(
+        program_mock, 'next_processor_id', {'key': 'value'}, start_in=None, priority=None)
+    infrastructure_mock.send_message.assert_any_call(
+        program_mock, 'processor_id', {}, start_in=None, priority=None)
+    # message objects are reset after flush
+    assert response_mock.message == {}
+    assert not response_mock.retry_message
+
+
+class BacklogInfrastructure(Infrastructure):
+    max_backlog = 10
+    backlog_check_interval = 5
+
+    def __init__(self, backlog):
+        super(BacklogInfrastructure, self).__init__()
+        self.get_backlog = Mock(side_effect=backlog)
+        self.sleep = Mock()
+
+
+def test_response_throttle_default():
+    # a response handler that can't count pending messages doesn't block
+    BaseResponseHandler({}).throttle()
+
+
+def test_response_throttle(program_mock):
+    program_mock.id = 'program_id'
+    infrastructure = BacklogInfrastructure([15, 12, 9])
+    response = ListenerResponseHandler(infrastructure, program_mock, 'processor_id', {})
+
+    # the stream waits till the next processor backlog is below max_backlog
+    response.throttle()
+    assert infrastructure.get_backlog.call_args_list == [
+        call(program_mock, 'next_processor_id')] * 3
+    assert infrastructure.sleep.call_args_list == [call(5), call(5)]
+
+    # the backlog is not checked again till backlog_check_interval passes
+    response.throttle()
+    assert infrastructure.get_backlog.call_count == 3
+
+
+def test_response_throttle_limits(program_mock):
+    program_mock.id = 'program_id'
+    infrastructure = BacklogInfrastructure([None])
+    response = ListenerResponseHandler(infrastructure, program_mock, 'processor_id', {})
+    # infrastructure can't count the backlog
+    response.throttle()
+    infrastructure.sleep.assert_not_called()
+
+    infrastructure = BacklogInfrastructure([15, 15])
+    infrastructure.max_throttle_time = 0
+    response = ListenerResponseHandler(infrastructure, program_mock, 'processor_id', {})
+    # the stream is never paused longer than max_throttle_time
+    response.throttle()
+    infrastructure.sleep.assert_not_called()
+
+    # last processor of a pipeline has no consumers to wait for
+    program_mock.get_next_processor.return_value = None
+    infrastructure = BacklogInfrastructure([15])
+    ListenerResponseHandler(infrastructure, program_mock, 'processor_id', {}).throttle()
+    infrastructure.get_backlog.assert_not_called()